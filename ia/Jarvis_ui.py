@@ -1,37 +1,94 @@
+import os
 import sys
+import getpass
 import asyncio
-import threading
 import re
+import time
 from datetime import datetime
 
 # Bibliotecas Visuais
 from textual.app import App, ComposeResult
 from textual.containers import Container, Horizontal
-from textual.widgets import Header, Footer, Input, RichLog, Static
+from textual.widgets import Header, Footer, Input, RichLog, Static, DataTable
+from rich.markup import escape
+from rich.text import Text
+from rich.errors import MarkupError
 
-# Biblioteca de Voz
-import pyttsx3
+from despacho_voz import despachante_padrao, PRIORIDADE_ALERTA, PRIORIDADE_RESPOSTA, PRIORIDADE_INFO
 
-# --- IMPORT DO BACKEND ---
-try:
-    from agente_spb import app as agente_graph
-    BACKEND_ATIVO = True
-except ImportError:
-    BACKEND_ATIVO = False
+# --- BACKEND (CARREGADO DEPOIS DO PRIMEIRO QUADRO) ---
+# agente_spb puxa pandas/LangChain/LangGraph: a TUI desenha primeiro e importa o backend
+# numa thread (SpbJarvisApp.aquecer_backend), com o progresso real na lateral.
+# Os demais módulos do backend são importados dentro dos métodos (já em cache depois disso).
+BACKEND_ATIVO = False
+agente_graph = None
 
-# --- CONFIGURAÇÃO DE VOZ (Thread Segura) ---
-def speak_system(text):
-    def run_speech():
+def carregar_backend():
+    """Importa o agente e compila o grafo com a sessão persistida. Retorna (grafo, segundos)."""
+    inicio = time.perf_counter()
+    from agente_spb import construir_app
+    from sessoes import checkpointer_padrao
+    # Sessão persistida (histórico + último NUOP) sobrevive a reinícios da TUI
+    return construir_app(checkpointer_padrao()), time.perf_counter() - inicio
+
+# --- VOZ (despacho_voz.py) ---
+# Um worker de voz só, com fila limitada e prioridade: rajada de alertas do monitor
+# não empilha threads nem trava a TUI (repetições são coalescidas, o excesso é descartado)
+def speak_system(text, prioridade=PRIORIDADE_INFO, chave=None):
+    despachante_padrao().falar(text, prioridade, chave)
+
+# --- LOG COM ROLAGEM LIMITADA ---
+# O RichLog guarda só as últimas TUI_LOG_LINHAS linhas (turno de plantão não faz a TUI
+# engordar); tudo o que é escrito vai também, em texto puro, para a transcrição em disco.
+LOG_LINHAS = int(os.getenv("TUI_LOG_LINHAS", "2000"))
+LOG_DIR = os.getenv("TUI_LOG_DIR", ".jarvis_logs")    # Vazio = sem transcrição em disco
+
+def texto_puro(conteudo):
+    """Markup do Rich -> texto (markup inválido vai como está)."""
+    if isinstance(conteudo, Text):
+        return conteudo.plain
+    if isinstance(conteudo, str):
         try:
-            engine = pyttsx3.init()
-            engine.setProperty('rate', 190)
-            engine.setProperty('volume', 1.0)
-            engine.say(text)
-            engine.runAndWait()
-        except Exception:
-            pass 
-    thread = threading.Thread(target=run_speech, daemon=True)
-    thread.start()
+            return Text.from_markup(conteudo).plain
+        except MarkupError:
+            return conteudo
+    return str(conteudo)
+
+class LogLimitado(RichLog):
+    """RichLog com max_lines que despeja cada escrita na transcrição da sessão (arquivo)."""
+
+    def __init__(self, arquivo=None, max_lines=LOG_LINHAS, **kwargs):
+        super().__init__(max_lines=max_lines, **kwargs)
+        self.arquivo = arquivo
+        self._saida = None
+
+    def write(self, content, *args, **kwargs):
+        # Antes do primeiro tamanho o RichLog adia a escrita e a refaz depois: grava só na refeita
+        if self.arquivo and self._size_known:
+            try:
+                if self._saida is None:
+                    os.makedirs(os.path.dirname(self.arquivo) or ".", exist_ok=True)
+                    self._saida = open(self.arquivo, "a", encoding="utf-8", buffering=1)
+                self._saida.write(texto_puro(content) + "\n")
+            except OSError:
+                self.arquivo = None   # Disco indisponível: segue só com a rolagem em memória
+        return super().write(content, *args, **kwargs)
+
+    def fechar(self):
+        if self._saida is not None:
+            self._saida.close()
+            self._saida = None
+
+# Progresso dos nós do grafo exibido no log enquanto o astream anda
+ROTULOS_NOS = {
+    "router": "🧭 Pergunta roteada",
+    "gerar_sql": "🧠 SQL gerado",
+    "validar_sql": "🛡️ Plano validado",
+    "executar_sql": "📊 Consulta executada",
+    "investigar_nuop": "🕵️ Timeline carregada",
+    "analise_forense": "⚖️ Parecer concluído",
+    "registrar_turno": "💾 Sessão atualizada",
+}
 
 # --- CSS ---
 CSS = """
@@ -39,6 +96,7 @@ Screen { background: #0d1117; color: #e6edf3; }
 Header { background: #161b22; color: #00ffaa; dock: top; height: 3; content-align: center middle; text-style: bold; border-bottom: solid #00ffaa; }
 #sidebar { dock: left; width: 35; height: 100%; background: #0d1117; border-right: solid #333; padding: 1 2; }
 #chat-area { background: #0d1117; border: heavy #00ffaa; margin: 1 1 1 1; height: 1fr; padding: 1; overflow-y: scroll; }
+#tabela_resultado { height: 16; margin: 0 1; border: solid #00ffaa; background: #0d1117; display: none; }
 Input { dock: bottom; width: 100%; height: 3; margin: 0 1 1 1; padding: 0; border: solid #00ffaa; background: #262626; color: #ffffff; }
 Input:focus { border: double #ffffff; background: #333333; }
 .status-box { background: #161b22; border: solid #333; height: auto; margin-bottom: 2; padding: 1; }
@@ -52,8 +110,16 @@ class SpbJarvisApp(App):
     CSS = CSS
     TITLE = "🛡️ SPB FORENSIC SYSTEM // v3.1 (Fixed)"
     
-    # Memória de Curto Prazo
-    chat_memory = []
+    ultimo_resultado_id = None   # Resultado SQL com páginas pendentes (/mais)
+    monitor_worker = None        # Loop do /monitor em andamento
+
+    def __init__(self, sessao_id=None):
+        super().__init__()
+        # Memória de curto prazo por sessão (checkpointer), não mais uma lista da classe
+        self.sessao_id = sessao_id or os.getenv("JARVIS_SESSAO") or f"tui-{getpass.getuser()}"
+        self.backend_pronto = asyncio.Event()   # Perguntas feitas antes disso esperam o import
+        self.arquivo_log = (os.path.join(LOG_DIR, f"{self.sessao_id}_{datetime.now():%Y%m%d-%H%M%S}.log")
+                            if LOG_DIR else None)
 
     def compose(self) -> ComposeResult:
         yield Header(show_clock=True)
@@ -63,30 +129,83 @@ class SpbJarvisApp(App):
                 yield Static("SYSTEM STATUS", classes="title-side")
                 with Container(classes="status-box"):
                     yield Static("🔌 CONEXÃO DB", classes="label")
-                    yield Static("ONLINE", classes="value") if BACKEND_ATIVO else Static("OFFLINE", classes="value-error")
+                    yield Static("CARREGANDO...", classes="value-error", id="st_db")
                 with Container(classes="status-box"):
                     yield Static("🧠 IA CORE", classes="label")
-                    yield Static("Llama 3 (Local)", classes="value")
+                    yield Static("CARREGANDO...", classes="value-error", id="st_ia")
                 with Container(classes="status-box"):
                     yield Static("⚡ STATUS", classes="label")
                     yield Static("AGUARDANDO", classes="value", id="st_action")
+                with Container(classes="status-box"):
+                    yield Static("📈 ÚLTIMA RESPOSTA", classes="label")
+                    yield Static("—", classes="value", id="st_metricas")
+                with Container(classes="status-box"):
+                    yield Static("📡 MONITOR", classes="label")
+                    yield Static("DESLIGADO", classes="value", id="st_monitor")
                 yield Static("GUIDE:", classes="title-side")
-                yield Static("• Digite NUOP para análise.\n• Perguntas SQL.", classes="label")
+                yield Static("• Digite NUOP para análise.\n• Perguntas SQL.\n• /mais: próxima página.\n• /nova: nova sessão.\n• /monitor: liga/desliga o tempo real.\n• /exportar: transcrição em disco.", classes="label")
 
             # CHAT AREA
             with Container(): 
-                self.log_widget = RichLog(id="chat-area", highlight=True, markup=True, wrap=True)
+                self.log_widget = LogLimitado(self.arquivo_log, id="chat-area", highlight=True, markup=True, wrap=True)
                 yield self.log_widget
+                # Resultado SQL: DataTable só desenha as linhas visíveis; páginas do /mais entram no fim
+                self.tabela = DataTable(id="tabela_resultado", zebra_stripes=True, cursor_type="row")
+                yield self.tabela
                 self.input_widget = Input(placeholder="📝 COMANDO...", id="input_cmd")
                 yield self.input_widget
         yield Footer()
 
     def on_mount(self):
         self.log_widget.write("[bold green]🔁 INICIANDO SISTEMA JARVIS...[/]")
-        if BACKEND_ATIVO:
-            speak_system("Sistema Online.")
-            self.log_widget.write("[bold cyan]✅ SISTEMA DE VOZ ATIVO.[/]")
         self.input_widget.focus()
+        self.run_worker(self.aquecer_backend(), group="aquecimento")
+
+    def on_unmount(self):
+        self.log_widget.fechar()
+
+    def atualizar_prontidao(self, seletor, texto, ok):
+        widget = self.query_one(seletor)
+        widget.update(texto)
+        widget.classes = "value" if ok else "value-error"
+
+    async def aquecer_backend(self):
+        """Import do backend numa thread; depois banco (SELECT 1) e modelo (1 token) em paralelo."""
+        global agente_graph, BACKEND_ATIVO
+        try:
+            agente_graph, segundos = await asyncio.to_thread(carregar_backend)
+            BACKEND_ATIVO = True
+        except Exception as e:
+            self.atualizar_prontidao("#st_db", "OFFLINE", False)
+            self.atualizar_prontidao("#st_ia", "OFFLINE", False)
+            self.log_widget.write(f"[bold yellow]⚠️ Backend indisponível ({escape(str(e))}): modo demo.[/]")
+            return
+        finally:
+            self.backend_pronto.set()
+        self.log_widget.write(f"[dim]Backend carregado em {segundos:.2f}s.[/]")
+        self.atualizar_prontidao("#st_ia", "AQUECENDO...", False)
+        await asyncio.gather(self.checar_banco(), self.checar_modelo())
+        speak_system("Sistema Online.")
+        self.log_widget.write("[bold cyan]✅ SISTEMA DE VOZ ATIVO.[/]")
+        if os.getenv("MONITOR_AUTO", "0") == "1":
+            self.alternar_monitor()
+
+    async def checar_banco(self):
+        from db_pool import verificar_conexao
+        try:
+            ms = await asyncio.to_thread(verificar_conexao)
+            self.atualizar_prontidao("#st_db", f"ONLINE ({ms:.0f} ms)", True)
+        except Exception as e:
+            self.atualizar_prontidao("#st_db", "OFFLINE", False)
+            self.log_widget.write(f"[bold red]❌ Banco indisponível: {escape(str(e))}[/]")
+
+    async def checar_modelo(self):
+        """Warm-up: o Ollama carrega o Llama 3 na memória antes da primeira pergunta."""
+        from agente_spb import aquecer_modelo
+        ok, detalhe = await asyncio.to_thread(aquecer_modelo)
+        self.atualizar_prontidao("#st_ia", f"PRONTO: {detalhe}" if ok else "INDISPONÍVEL", ok)
+        if not ok:
+            self.log_widget.write(f"[bold red]❌ Modelo indisponível: {escape(detalhe)}[/]")
 
     async def on_input_submitted(self, message: Input.Submitted):
         user_msg = message.value
@@ -98,61 +217,177 @@ class SpbJarvisApp(App):
         self.log_widget.write(f"\n[bold white]👤 VOCÊ:[/]\n{user_msg}")
         self.query_one("#st_action").update("PROCESSANDO...")
         self.query_one("#st_action").classes = "value-error"
+        if not self.backend_pronto.is_set():
+            self.log_widget.write("[dim]⏳ Aguardando o backend terminar de carregar...[/]")
+            await self.backend_pronto.wait()
 
-        if BACKEND_ATIVO:
-            result = await asyncio.to_thread(self.processar_com_agente, user_msg)
-            self.exibir_resultado(result)
+        if BACKEND_ATIVO and user_msg.strip().lower() == "/mais":
+            # Próxima página do último resultado SQL (cursor aberto no servidor)
+            await self.exibir_proxima_pagina()
+        elif BACKEND_ATIVO and user_msg.strip().lower() == "/nova":
+            # Esquece histórico e último NUOP desta sessão
+            from sessoes import checkpointer_padrao
+            await asyncio.to_thread(checkpointer_padrao().delete_thread, self.sessao_id)
+            self.log_widget.write("[bold green]🧹 Sessão reiniciada.[/]")
+        elif BACKEND_ATIVO and user_msg.strip().lower() == "/monitor":
+            self.alternar_monitor()
+        elif user_msg.strip().lower() == "/exportar":
+            self.exportar_log()
+        elif BACKEND_ATIVO:
+            result, transmitidos = await self.processar_com_agente(user_msg)
+            self.exibir_resultado(result, transmitidos)
         else:
             self.log_widget.write("[bold yellow]⚠️ MODO DEMO (SEM BACKEND).[/]")
 
         self.query_one("#st_action").update("AGUARDANDO")
         self.query_one("#st_action").classes = "value"
 
-    def processar_com_agente(self, texto_usuario):
+    async def processar_com_agente(self, texto_usuario):
+        """
+        Roda o grafo com astream: o progresso de cada nó e os tokens do LLM
+        aparecem no log à medida que chegam, sem esperar o fluxo inteiro.
+        Retorna (estado final, nós cujo texto já foi transmitido ao vivo).
+        """
+        from sessoes import entrada_turno
+        from metricas import medir_execucao, resumo_execucao
+        # Histórico e último NUOP vêm do checkpoint da sessão (thread_id)
+        inputs = entrada_turno(texto_usuario)
+        config = {"configurable": {"thread_id": self.sessao_id}}
+        
+        resultado = {}
+        transmitidos = set()
+        self._no_transmitindo, self._buffer_tokens = None, ""
+        inicio = time.perf_counter()
         try:
-            # 1. Prepara o histórico
-            # Aumentei para pegar as últimas 10 linhas para dar mais contexto
-            contexto_str = "\n".join(self.chat_memory[-10:]) 
-            
-            inputs = {
-                "input_usuario": texto_usuario,
-                "historico": contexto_str
-            }
-            
-            resultado = agente_graph.invoke(inputs)
-            
-            # --- ATUALIZAÇÃO DA MEMÓRIA (AQUI É A MÁGICA) ---
-            # 1. Salva a pergunta do usuário
-            self.chat_memory.append(f"User: {texto_usuario}")
-            
-            # 2. Salva a RESPOSTA REAL da IA (não apenas um placeholder)
-            # Isso permite que a IA leia o NUOP ou o Erro que ela mesma citou antes
-            
-            if resultado.get('relatorio_final'):
-                # Salva o relatório (pode ser grande, então salvamos ele todo para contexto)
-                texto_limpo = str(resultado['relatorio_final']).replace('\n', ' ')
-                self.chat_memory.append(f"AI Analysis: {texto_limpo[:500]}...") # Limita a 500 chars para não estourar o prompt
-            
-            elif resultado.get('sql_query'):
-                # Salva a query (ajuda a IA a saber o que ela pesquisou antes)
-                self.chat_memory.append(f"AI SQL Executed: {resultado['sql_query']}")
-                
-                # Opcional: Salvar que dados foram encontrados
-                if resultado.get('sql_resultado'):
-                    dados_resumo = str(resultado['sql_resultado']).replace('\n', ' ')
-                    self.chat_memory.append(f"AI Data Result: {dados_resumo[:200]}...")
-
-            return resultado
+            with medir_execucao() as spans:
+                async for modo, evento in agente_graph.astream(inputs, config, stream_mode=["updates", "messages"]):
+                    if modo == "messages":
+                        chunk, meta = evento
+                        no = meta.get("langgraph_node")
+                        if no != self._no_transmitindo:
+                            self.descarregar_tokens()
+                            self._no_transmitindo = no
+                            transmitidos.add(no)
+                            if no == "analise_forense":
+                                self.log_widget.write("\n[bold cyan]🤖 JARVIS (ao vivo):[/]")
+                        self.receber_tokens(chunk.content)
+                        continue
+                    self.descarregar_tokens()
+                    for no, atualizacao in evento.items():
+                        resultado.update(atualizacao or {})
+                        self.log_widget.write(f"[dim]{ROTULOS_NOS.get(no, no)} ({time.perf_counter() - inicio:.2f}s)[/]")
+                        self.query_one("#st_action").update(no.upper())
+            self.descarregar_tokens()
+            # Onde foi o tempo (LLM x banco x resto) da pergunta que acabou de rodar
+            self.query_one("#st_metricas").update(resumo_execucao(spans))
+            return resultado, transmitidos
+        except Exception as e:
+            self.descarregar_tokens()
+            return {"erro_sistema": str(e)}, transmitidos
+
+    def receber_tokens(self, texto):
+        """O RichLog escreve por linha: tokens acumulam até o próximo \\n."""
+        self._buffer_tokens += texto if isinstance(texto, str) else ""
+        *linhas, self._buffer_tokens = self._buffer_tokens.split("\n")
+        for linha in linhas:
+            self.escrever_linha_transmitida(linha)
+
+    def descarregar_tokens(self):
+        if self._buffer_tokens:
+            self.escrever_linha_transmitida(self._buffer_tokens)
+        self._buffer_tokens = ""
+        self._no_transmitindo = None
+
+    def escrever_linha_transmitida(self, linha):
+        if self._no_transmitindo == "analise_forense":
+            self.log_widget.write(escape(linha))
+        else:
+            self.log_widget.write(f"[dim]{escape(linha)}[/]")  # SQL sendo gerado
+
+    def alternar_monitor(self):
+        if self.monitor_worker is not None:
+            self.monitor_worker.cancel()
+            self.monitor_worker = None
+            self.query_one("#st_monitor").update("DESLIGADO")
+            self.log_widget.write("[bold yellow]📡 Monitor desligado.[/]")
+            return
+        self.monitor_worker = self.run_worker(self.loop_monitor(), group="monitor", exclusive=True)
+
+    async def loop_monitor(self):
+        """Tick a tick: só as linhas novas (keyset); alertas vão para o log e para a voz."""
+        from monitor_tempo_real import MonitorTempoReal, resumo_monitor, MONITOR_INTERVALO_S
+        monitor = MonitorTempoReal()
+        try:
+            await asyncio.to_thread(monitor.iniciar)
+            self.log_widget.write(f"[bold green]📡 Monitor ligado "
+                                  f"({'LISTEN/NOTIFY' if monitor._conn_listen else 'polling'}, janela {monitor.janela.janela_s}s).[/]")
+            while True:
+                retrato, alertas = await asyncio.to_thread(monitor.tick)
+                self.query_one("#st_monitor").update(resumo_monitor(retrato))
+                for alerta in alertas:
+                    if alerta["nivel"] == "alerta":
+                        self.log_widget.write(f"[bold red]🚨 MONITOR: {escape(alerta['texto'])}[/]")
+                        speak_system(alerta["voz"], PRIORIDADE_ALERTA, chave=f"monitor:{alerta['regra']}")
+                    else:
+                        self.log_widget.write(f"[bold green]✅ MONITOR: {escape(alerta['texto'])}[/]")
+                await asyncio.to_thread(monitor.aguardar, MONITOR_INTERVALO_S)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            return {"erro_sistema": str(e)}
+            self.log_widget.write(f"[bold red]❌ Monitor parado: {escape(str(e))}[/]")
+            self.query_one("#st_monitor").update("ERRO")
+            self.monitor_worker = None
+        finally:
+            monitor.fechar()
 
-    def exibir_resultado(self, result):
+    async def exibir_proxima_pagina(self):
+        if not self.ultimo_resultado_id:
+            self.log_widget.write("[bold orange3]⚠️ Nenhum resultado com mais páginas.[/]")
+            return
+        from resultado_paginado import proxima_pagina
+        pagina, rodape = await asyncio.to_thread(proxima_pagina, self.ultimo_resultado_id)
+        if pagina is None:
+            self.ultimo_resultado_id = None
+            self.log_widget.write(f"[bold orange3]{rodape}[/]")
+            return
+        from resultado_paginado import linhas_texto
+        inicio = self.tabela.row_count
+        self.adicionar_linhas(linhas_texto(pagina)[1])
+        self.tabela.move_cursor(row=inicio)
+        self.log_widget.write(f"[dim]{escape(rodape)} (tabela abaixo)[/]")
+        if "/mais" not in rodape:
+            self.ultimo_resultado_id = None
+
+    def mostrar_tabela(self, pagina):
+        """Troca o conteúdo da tabela pelo novo resultado (colunas + primeira página)."""
+        self.tabela.clear(columns=True)
+        self.tabela.add_columns(*(escape(c) for c in pagina["colunas"]))
+        self.adicionar_linhas(pagina["linhas"])
+        self.tabela.display = True
+
+    def adicionar_linhas(self, linhas):
+        # Células com escape: o DataTable interpreta str como markup
+        self.tabela.add_rows([escape(celula) for celula in linha] for linha in linhas)
+
+    def exportar_log(self):
+        if not self.log_widget.arquivo:
+            self.log_widget.write("[bold orange3]⚠️ Transcrição em disco desligada (TUI_LOG_DIR vazio).[/]")
+            return
+        self.log_widget.write(f"[bold green]💾 Transcrição completa da sessão: {escape(os.path.abspath(self.log_widget.arquivo))}[/]\n"
+                              f"[dim](a tela guarda só as últimas {self.log_widget.max_lines} linhas)[/]")
+
+    def exibir_resultado(self, result, transmitidos=()):
         self.log_widget.write("\n[bold cyan]🤖 JARVIS:[/]")
+        self.ultimo_resultado_id = result.get('sql_resultado_id')
+
+        if result.get('sql_executado') and not result.get('sql_pagina'):
+            self.tabela.display = False   # Consulta nova sem linhas: a tabela antiga sairia como se fosse dela
 
         # 1. Debug SQL
         if result.get('sql_executado'):
-            self.log_widget.write("[dim]🔍 QUERY EXECUTADA:[/]")
-            self.log_widget.write(f"```sql\n{result['sql_executado']}\n```")
+            from agente_spb import sql_sem_cte
+            self.log_widget.write("[dim]🔍 QUERY EXECUTADA (sobre a view_universal):[/]")
+            self.log_widget.write(f"```sql\n{escape(sql_sem_cte(result['sql_executado']))}\n```")
 
         # 2. Erros de Sistema
         if result.get('erro_sistema'):
@@ -163,25 +398,34 @@ class SpbJarvisApp(App):
             relatorio = result['relatorio_final']
             
             # Se for apenas aviso de não encontrado
-            if "não encontrado" in relatorio.lower() or "⚠️" in relatorio:
+            # (Relatórios por regra trazem o SLA, que pode conter "⚠️ ALERTA": só o prefixo conta)
+            if "não encontrado" in relatorio.lower() or relatorio.startswith("⚠️"):
                  self.log_widget.write(f"[bold orange3]{relatorio}[/]")
-                 speak_system("Informação não localizada.")
+                 speak_system("Informação não localizada.", PRIORIDADE_RESPOSTA)
             else:
-                self.log_widget.write(relatorio)
+                if "analise_forense" not in transmitidos:  # Parecer do LLM já saiu token a token
+                    self.log_widget.write(relatorio)
                 self.log_widget.write(f"\n[italic green]💾 Log salvo.[/]")
-                speak_system("Análise concluída.")
+                speak_system("Análise concluída.", PRIORIDADE_RESPOSTA)
 
         # 4. Resultado SQL
+        elif result.get('sql_pagina'):
+            pagina = result['sql_pagina']
+            self.mostrar_tabela(pagina)
+            self.log_widget.write(f"[bold blue]📊 DADOS:[/] {len(pagina['linhas'])} linhas na tabela abaixo")
+            if pagina.get('rodape'):
+                self.log_widget.write(f"[dim]{escape(pagina['rodape'])}[/]")
+            speak_system("Dados recuperados.", PRIORIDADE_RESPOSTA)
         elif result.get('sql_resultado'):
             self.log_widget.write("[bold blue]📊 DADOS:[/]")
             self.log_widget.write(f"```\n{result['sql_resultado']}\n```")
-            speak_system("Dados recuperados.")
+            speak_system("Dados recuperados.", PRIORIDADE_RESPOSTA)
 
         # 5. Erro SQL Específico
         elif result.get('sql_erro'):
             self.log_widget.write("[bold red]❌ ERRO SQL:[/]")
             self.log_widget.write(result['sql_erro'])
-            speak_system("Erro na query.")
+            speak_system("Erro na query.", PRIORIDADE_RESPOSTA)
         
         self.log_widget.write("---")
 
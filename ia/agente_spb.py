@@ -1,54 +1,183 @@
 import os
 import re
+import asyncio
+import time
 import warnings
+import threading
+import contextvars
 import pandas as pd
-import psycopg2
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from typing import TypedDict, Optional
 from dotenv import load_dotenv
 
-# LangChain / LangGraph imports
-from langchain_ollama import ChatOllama
+# LangChain / LangGraph imports (o langchain_ollama só carrega no obter_llm: ~1s de import)
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, END
+from langgraph.constants import TAG_NOSTREAM
 
 # --- 0. CONFIGURAÇÃO GERAL ---
 load_dotenv()
 warnings.filterwarnings('ignore')
 
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": os.getenv("DB_PORT", "5432"),
-    "database": os.getenv("DB_NAME", "spb_database"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASSWORD", "postgres")
-}
+# Conexões vêm do pool compartilhado (db_pool.py): sem handshake TCP+auth a cada pergunta
+from db_pool import DB_CONFIG, conexao_db
+from cache_sql import CacheTraducaoSQL, impressao_digital
+from timeline_nuop import TimelineNuop
+
+# Motivos de erro já extraídos pelo backfill_motivos.py (forense.motivo_extraido):
+# a view e a investigação leem 'evidencia_erro' pronta em vez de parsear XML na consulta
+MOTIVOS_PRECOMPUTADOS = os.getenv("MOTIVOS_PRECOMPUTADOS", "0") == "1"
+_COL_EVIDENCIA = ", M.motivo as evidencia_erro" if MOTIVOS_PRECOMPUTADOS else ""
+_JOIN_EVIDENCIA = " LEFT JOIN forense.motivo_extraido M USING (msgid)" if MOTIVOS_PRECOMPUTADOS else ""
 
 # CTE Universal para SQL
-CTE_UNIVERSAL = """
+CTE_UNIVERSAL = f"""
 WITH view_universal AS (
     SELECT 
         'PIX' as origem, msgid, codmsg, nuop, statusop, 
         CAST(statusmsg AS INTEGER) as statusmsg, 
         COALESCE(sitlanc, 'N/A') as sitlanc, 
-        ts_inclusao, msgop 
-    FROM pix.operacao
+        ts_inclusao, msgop{_COL_EVIDENCIA} 
+    FROM pix.operacao{_JOIN_EVIDENCIA}
     UNION ALL
     SELECT 
         'STR' as origem, msgid, codmsg, nuop, statusop, 
         CAST(statusmsg AS INTEGER) as statusmsg, 
         'N/A' as sitlanc, 
-        ts_inclusao, msgop 
-    FROM STR.operacao
+        ts_inclusao, msgop{_COL_EVIDENCIA} 
+    FROM STR.operacao{_JOIN_EVIDENCIA}
+)
+"""
+
+
+
+# Timeline forense de um NUOP (parâmetros ligados, sem interpolar o código do usuário)
+QUERY_INVESTIGACAO_NUOP = """
+WITH 
+spi_op AS (
+    SELECT 'PIX.operacao' as origem, msgid, nuop, codmsg, statusop, statusmsg, sitlanc, ts_inclusao, msgop, NULL::timestamp as ts_entrega, NULL::timestamp as ts_consumo
+    FROM PIX.operacao WHERE nuop {filtro}
+),
+spi_leg AS (
+    SELECT 'PIX.legado', L.msgid, O.nuop, O.codmsg, NULL::smallint, NULL::smallint, NULL, L.ts_inclusao, O.msgop, L.ts_entrega, L.ts_consumo
+    FROM PIX.legado L JOIN spi.operacao O ON L.msgid = O.msgid WHERE O.nuop {filtro}
+),
+spb_op AS (
+    SELECT 'spb.operacao', msgid, nuop, codmsg, statusop, statusmsg, NULL, ts_inclusao, msgop, NULL::timestamp, NULL::timestamp
+    FROM spb.operacao WHERE nuop {filtro}
+),
+timeline AS (
+    SELECT * FROM spi_op UNION ALL SELECT * FROM spi_leg UNION ALL SELECT * FROM spb_op
 )
+""" + ("""
+SELECT T.origem, T.msgid, T.nuop, T.codmsg, T.statusop, T.statusmsg, T.sitlanc, T.ts_inclusao,
+       CASE WHEN M.msgid IS NULL THEN T.msgop END as msgop,   -- XML só trafega se ainda não foi extraído
+       T.ts_entrega, T.ts_consumo, M.motivo as evidencia_erro
+FROM timeline T LEFT JOIN forense.motivo_extraido M ON M.msgid = T.msgid
+ORDER BY T.ts_inclusao ASC;
+""" if MOTIVOS_PRECOMPUTADOS else """
+SELECT * FROM timeline ORDER BY ts_inclusao ASC;
+""")
+
+# Estratégias de busca do NUOP (do mais barato para o mais caro)
+FILTROS_NUOP = {
+    "exato": "= %(nuop)s",
+    "prefixo": "LIKE %(nuop_like)s || '%%'",
+    "substring": "LIKE '%%' || %(nuop_like)s || '%%'",   # Scan sequencial sem o índice pg_trgm
+}
+NUOP_BUSCA_SUBSTRING = os.getenv("NUOP_BUSCA_SUBSTRING", "0") == "1"
+
+# Execução do SQL em streaming (cursor nomeado + páginas sob demanda, resultado_paginado.py)
+SQL_STREAMING = os.getenv("SQL_STREAMING", "1") == "1"
+
+# Modo especulativo do Text-to-SQL: N candidatos em paralelo (temperatura/instrução diferentes),
+# todos validados com EXPLAIN; executa o válido mais barato. 1 = desligado (um SQL + loop serial).
+SQL_CANDIDATOS = int(os.getenv("SQL_CANDIDATOS", "1"))
+SQL_CANDIDATOS_ESPERA_S = float(os.getenv("SQL_CANDIDATOS_ESPERA_S", "0.5"))  # Após o 1º válido
+VARIANTES_SQL = [
+    # (temperatura, instrução acrescentada ao prompt); a primeira é o prompt original
+    (None, ""),
+    (0.3, "\n💡 Prefira filtros em statusmsg/statusop/codmsg/origem e janela em ts_inclusao "
+          "(colunas indexadas); evite LIKE em msgop quando o status bastar."),
+    (0.6, "\n💡 Escreva a consulta mais simples possível: sem subconsultas, só as colunas necessárias."),
+    (0.9, ""),
+]
+
+# Motor de regras do veredito (regras_veredito.py): casos claros não passam pelo LLM
+VEREDITO_SEMPRE_LLM = os.getenv("VEREDITO_SEMPRE_LLM", "0") == "1"
+
+# Dicionário de status injetado no prompt do Text-to-SQL
+GLOSSARIO_SPB = """
+    - statusmsg 302: Mensagem processada com sucesso (OK).
+    - statusmsg 108: Operação liquidada.
+    - statusmsg 319: Rejeitada pelo PILOTO.
+    - statusmsg 320: Rejeitada pelo AUTORIZADOR (ex: saldo/limite).
+    - statusop 205: Erro de processamento no Bacen (inclui 'Pagamento expirado por timeout').
+"""
+if MOTIVOS_PRECOMPUTADOS:
+    GLOSSARIO_SPB += """    - evidencia_erro (Texto): motivo do erro já extraído do XML. Prefira evidencia_erro ILIKE '%...%' a msgop LIKE.
 """
 
+# --- TEMPLATE HÍBRIDO (O MELHOR DOS DOIS MUNDOS) ---
+TEMPLATE_SQL = """
+    Você é um Especialista em Banco de Dados SPB/PIX.
+    Sua missão é traduzir linguagem natural para SQL.
+    
+    📚 DICIONÁRIO DE STATUS:
+    {glossario}
+    
+    SCHEMA 'view_universal':
+    - origem (Texto): VALORES: 'SPI' ou 'SPB'.
+      ⚠️ REGRA: Se usuário disser "Pix" -> use 'SPI'. Se "STR/TED" -> use 'SPB'.
+    - msgid, codmsg, nuop (Texto), statusop, statusmsg, ts_inclusao, msgop
+    
+    🚨 REGRAS DE NEGÓCIO:
+    1. TIMEOUT: statusop=205 AND msgop LIKE '%Pagamento expirado por timeout%'
+    2. SALDO/LIMITE: statusmsg=320 AND (msgop ILIKE '%Saldo%' OR msgop ILIKE '%Insuficiente%' OR msgop ILIKE '%Limite%')
+    3. PILOTO REJEITOU: statusmsg=319
+    4. AUTORIZADOR REJEITOU: statusmsg=320
+    
+    🧠 LÓGICA DE MEMÓRIA (MUITO IMPORTANTE):
+    
+    CASO 1: BUSCA NOVA (GLOBAL)
+    Se o usuário perguntar "quais", "quantas", "últimas X", "listar erros" ou usar plural:
+    -> IGNORAR qualquer NUOP do histórico. Fazer uma busca limpa na tabela.
+    
+    CASO 2: CONTEXTO (REFERÊNCIA)
+    APENAS se o usuário usar palavras como "esse", "dessa", "o código", "aquele id" E não der o número:
+    -> Buscar o último NUOP citado no histórico e usar no WHERE.
+    
+    ⚠️ ATENÇÃO COM DATAS (HOMOLOGAÇÃO):
+    Os dados do banco são de 2024/2025.
+    - Se o usuário pedir "hoje" ou "agora", considere que ele quer dizer "DEZEMBRO DE 2025" (ex: ts_inclusao >= '2025-12-01').
+    - Se não especificar data, traga os últimos registros ordenados por data (DESC).
+    
+    EXEMPLOS:
+    - User: "Quantas mensagens recusadas pelo piloto?" -> SELECT count(*) FROM view_universal WHERE statusmsg = 319; (SEM NUOP!)
+    - User: "O que houve com ela?" (Histórico tem E5610...) -> SELECT * FROM view_universal WHERE nuop = 'E5610...';
+    
+    HISTÓRICO RECENTE: 
+    {historico}
+    
+    PERGUNTA ATUAL: {pergunta}
+    
+    RESPOSTA (APENAS O SQL):
+    {dica}"""
+
+# Prompts compilados uma vez; o que varia por chamada (erro anterior, variante) entra por {dica}
+PROMPT_SQL = PromptTemplate(input_variables=["historico", "pergunta", "glossario", "dica"], template=TEMPLATE_SQL)
 
+# Cache da tradução (cache_sql.py), versionado pelo prompt + schema + glossário
+cache_sql = CacheTraducaoSQL(versao=impressao_digital(TEMPLATE_SQL, CTE_UNIVERSAL, GLOSSARIO_SPB))
 
 # --- 1. ESTADO DO AGENTE ---
 class AgentState(TypedDict):
     input_usuario: str          
     historico: Optional[str]    
+    historico_turnos: Optional[list]  # Ring buffer de turnos resumidos da sessão (sessoes.py)
+    ultimo_nuop: Optional[str]        # Último NUOP referenciado: resolve "esse"/"dessa" sem o LLM
     tipo_fluxo: str             
     
     # Contexto SQL
@@ -56,80 +185,75 @@ class AgentState(TypedDict):
     sql_erro: Optional[str]     
     sql_resultado: Optional[str]
     sql_executado: Optional[str] # Adicionado para debug na UI
+    sql_params: Optional[dict]      # Parâmetros do SQL de template (fast-path); None no SQL do LLM
+    sql_original: Optional[str]     # SQL antes da reescrita para o rollup (é o que vai para o cache)
+    sql_resultado_id: Optional[str] # Cursor aberto no servidor (próximas páginas via resultado_paginado.proxima_pagina)
+    sql_linhas: Optional[int]       # Linhas já lidas
+    sql_total: Optional[int]        # Total exato, quando conhecido
+    sql_pagina: Optional[dict]      # Primeira página em texto {"colunas", "linhas", "rodape"} (tabela da TUI)
+    sql_cache_chave: Optional[str]  # Chave no cache de tradução (gravada só após executar com sucesso)
+    sql_do_cache: Optional[bool]
+    sql_plano: Optional[dict]       # EXPLAIN da guarda de custo: custo, linhas, nó raiz, excedido
+    sql_pre_validacao: Optional[dict]  # Modo especulativo: {"erro", "plano"} do candidato escolhido
     tentativas: int             
     
     # Contexto NUOP
     nuop_id: Optional[str]
-    dados_nuop: Optional[pd.DataFrame] 
+    busca_parcial: Optional[bool]   # Usuário pediu busca por trecho do NUOP (LIKE '%...%')
+    narrativa_solicitada: Optional[bool]  # Força o parecer do LLM mesmo quando as regras decidem
+    dados_nuop: Optional[TimelineNuop]  # Timeline colunar, sem o XML (DataFrame só sob demanda)
     relatorio_final: Optional[str]
 
 # --- 2. CONEXÃO LLM & HELPERS ---
 
-print("🔌 Conectando ao Llama 3 local...")
-try:
-    llm = ChatOllama(model="llama3", temperature=0, base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
-except Exception as e:
-    print(f"❌ Erro ao conectar no Ollama: {e}")
-    exit()
-
-from lxml import etree
+OLLAMA_MODELO = os.getenv("OLLAMA_MODELO", "llama3")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")   # Modelo fica residente entre as perguntas
+
+# Cliente criado no primeiro uso (obter_llm), não no import: abrir a TUI/serviço não
+# espera o langchain_ollama e o Ollama fora do ar não derruba o processo.
+# Benchmark/testes podem atribuir agente_spb.llm antes da primeira pergunta.
+llm = None
+_llm_lock = threading.Lock()
+
+def obter_llm():
+    global llm
+    with _llm_lock:
+        if llm is None:
+            from langchain_ollama import ChatOllama
+            print("🔌 Conectando ao Llama 3 local...")
+            llm = ChatOllama(model=OLLAMA_MODELO, temperature=0, keep_alive=OLLAMA_KEEP_ALIVE,
+                             base_url=os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"))
+        return llm
+
+from regras_veredito import aplicar_regras, relatorio_deterministico, pediu_narrativa
+from templates_sql import casar_template
+from extrator_xml import extrair_motivo, extrair_motivos_coluna
+from resultado_paginado import abrir_resultado, truncar_colunas, linhas_texto
+from metricas import instrumentar, medir_db, registrar_dataframe, contar_retry_sql
+from sessoes import compactar_historico, resolver_referencia, resumir_turno, registrar
+import guarda_custo
+from sla_legado import estatisticas_sla, texto_sla
+from rollup_contagens import reescrever_contagem
+from tabela_prompt import compactar_tabela
 
 def extrair_motivo_xml_parser(xml_text):
     """
     Parser robusto para XML do SPB (ISO20022).
-    Remove namespaces e busca tags de erro estruturadas.
+    Ignora namespaces e busca tags de erro estruturadas.
+    Implementação rápida em extrator_xml.py (XPath pré-compilado + memoização).
     """
-    if not xml_text or not isinstance(xml_text, str):
-        return ""
-
-    try:
-        # 1. Tenta converter string para Objeto XML
-        # O encode é necessário porque lxml espera bytes
-        parser = etree.XMLParser(recover=True) # recover=True tenta ignorar pequenos erros de formatação
-        root = etree.fromstring(xml_text.encode('utf-8'), parser=parser)
-
-        # 2. Truque para limpar Namespaces (ns0, ns1...) que atrapalham a busca
-        # Isso normaliza <ns1:RsnDesc> para apenas <RsnDesc>
-        for elem in root.getiterator():
-            if not hasattr(elem.tag, 'find'): continue
-            i = elem.tag.find('}')
-            if i >= 0:
-                elem.tag = elem.tag[i+1:]
-
-        # 3. Lista de Tags onde o Bacen costuma esconder o motivo do erro
-        tags_prioridade = [
-            'RsnDesc',       # Reason Description (Mais comum)
-            'AddtlInf',      # Additional Information
-            'StsRsnInf',     # Status Reason Information
-            'RjctnRsn',      # Rejection Reason
-            'Prtry',         # Proprietary Error Code
-            'Ustrd'          # Unstructured info
-        ]
-
-        # 4. Busca a primeira tag que tiver conteúdo
-        for tag in tags_prioridade:
-            # .// significa "busque em qualquer profundidade"
-            found = root.find(f".//{tag}")
-            if found is not None and found.text and found.text.strip():
-                return found.text.strip()
-
-    except Exception:
-        # Se falhar (não for XML ou estiver corrompido), retorna vazio silenciosamente
-        pass
-        
-    return ""
+    return extrair_motivo(xml_text)
 
 def calcular_sla_unificado(df):
+    """SLA de todos os eventos do legado numa passada vetorizada (sla_legado.py)."""
     if df is None or df.empty: return "Sem dados."
-    relatorio = "📊 SLA & PERFORMANCE:\n"
-    df_leg = df.dropna(subset=['ts_entrega', 'ts_consumo'])
-    if not df_leg.empty:
-        evt = df_leg.iloc[-1]
-        delta = (pd.to_datetime(evt['ts_consumo']) - pd.to_datetime(evt['ts_entrega'])).total_seconds()
-        relatorio += f"   ➤ TEMPO CONSUMO: {delta:.3f}s\n"
-        if delta > 10: relatorio += "      ⚠️ ALERTA: Consumo Lento (>10s)!\n"
-        else: relatorio += "      🏆 Performance: Imediata.\n"
-    return relatorio
+    return texto_sla(estatisticas_sla(df))
+
+def sql_sem_cte(query):
+    """SQL executado sem o texto da CTE_UNIVERSAL (o que vale exibir na UI/log)."""
+    if query and query.startswith(CTE_UNIVERSAL):
+        return query[len(CTE_UNIVERSAL):].strip()
+    return query
 
 # --- 3. NÓS DO GRAFO ---
 
@@ -139,8 +263,20 @@ def node_router(state: AgentState):
     - Se tem NUOP + Palavras de Contagem/Lista -> SQL
     - Se tem NUOP + Pergunta de Diagnóstico -> Forense
     - Se não tem NUOP -> SQL
+    Antes disso resolve "esse"/"dessa" pelo último NUOP da sessão e monta o
+    histórico compactado a partir do ring buffer de turnos.
     """
+    contexto = {}
     entrada_original = state['input_usuario'].strip()
+    entrada_resolvida = resolver_referencia(entrada_original, state.get('ultimo_nuop'))
+    if entrada_resolvida != entrada_original:
+        print(f"   ➤ Referência resolvida: NUOP {state['ultimo_nuop']}")
+        contexto["input_usuario"] = entrada_resolvida
+    if state.get('historico_turnos'):
+        contexto["historico"] = compactar_historico(state['historico_turnos'])
+    return {**contexto, **_decidir_rota(entrada_resolvida)}
+
+def _decidir_rota(entrada_original):
     entrada_lower = entrada_original.lower()
     
     # Busca o NUOP (Regex mantido)
@@ -160,175 +296,421 @@ def node_router(state: AgentState):
         
         # Caso contrário (ex: "o que houve", "analise", ou só o código solto) -> Fluxo Forense
         else:
-            return {"tipo_fluxo": "nuop", "nuop_id": match_nuop.group()}
+            busca_parcial = any(p in entrada_lower for p in ['parcial', 'contém', 'contem', 'contendo', 'trecho'])
+            return {
+                "tipo_fluxo": "nuop",
+                "nuop_id": match_nuop.group(),
+                "busca_parcial": busca_parcial,
+                "narrativa_solicitada": pediu_narrativa(entrada_lower),
+            }
             
     else:
+        # Fast-path: pergunta frequente com template pronto -> executa direto, sem LLM
+        template = casar_template(entrada_original)
+        if template:
+            nome, sql, params = template
+            print(f"   ➤ Fast-path SQL: template '{nome}'")
+            return {
+                "tipo_fluxo": "sql_rapido",
+                "sql_query": sql,
+                "sql_params": params,
+                "sql_cache_chave": None,
+                "tentativas": 0,
+            }
         # Sem NUOP, assume que é pergunta genérica para o SQL
         return {"tipo_fluxo": "sql", "tentativas": 0}
 
-def node_gerar_sql(state: AgentState):
+def _preparar_gerar_sql(state: AgentState):
+    """
+    Parte comum das versões síncrona e assíncrona do gerar_sql.
+    Retorna (resposta_do_cache, None, chave) ou (None, entradas, chave).
+    """
     pergunta = state['input_usuario']
     historico = state.get('historico', '') or "Sem histórico."
     erro_anterior = state.get('sql_erro')
-    
-    # --- TEMPLATE HÍBRIDO (O MELHOR DOS DOIS MUNDOS) ---
-    template = """
-    Você é um Especialista em Banco de Dados SPB/PIX.
-    Sua missão é traduzir linguagem natural para SQL.
-    
-    📚 DICIONÁRIO DE STATUS:
-    {glossario}
-    
-    SCHEMA 'view_universal':
-    - origem (Texto): VALORES: 'SPI' ou 'SPB'.
-      ⚠️ REGRA: Se usuário disser "Pix" -> use 'SPI'. Se "STR/TED" -> use 'SPB'.
-    - msgid, codmsg, nuop (Texto), statusop, statusmsg, ts_inclusao, msgop
-    
-    🚨 REGRAS DE NEGÓCIO:
-    1. TIMEOUT: statusop=205 AND msgop LIKE '%Pagamento expirado por timeout%'
-    2. SALDO/LIMITE: statusmsg=320 AND (msgop ILIKE '%Saldo%' OR msgop ILIKE '%Insuficiente%' OR msgop ILIKE '%Limite%')
-    3. PILOTO REJEITOU: statusmsg=319
-    4. AUTORIZADOR REJEITOU: statusmsg=320
-    
-    🧠 LÓGICA DE MEMÓRIA (MUITO IMPORTANTE):
-    
-    CASO 1: BUSCA NOVA (GLOBAL)
-    Se o usuário perguntar "quais", "quantas", "últimas X", "listar erros" ou usar plural:
-    -> IGNORAR qualquer NUOP do histórico. Fazer uma busca limpa na tabela.
-    
-    CASO 2: CONTEXTO (REFERÊNCIA)
-    APENAS se o usuário usar palavras como "esse", "dessa", "o código", "aquele id" E não der o número:
-    -> Buscar o último NUOP citado no histórico e usar no WHERE.
-    
-    ⚠️ ATENÇÃO COM DATAS (HOMOLOGAÇÃO):
-    Os dados do banco são de 2024/2025.
-    - Se o usuário pedir "hoje" ou "agora", considere que ele quer dizer "DEZEMBRO DE 2025" (ex: ts_inclusao >= '2025-12-01').
-    - Se não especificar data, traga os últimos registros ordenados por data (DESC).
-    
-    EXEMPLOS:
-    - User: "Quantas mensagens recusadas pelo piloto?" -> SELECT count(*) FROM view_universal WHERE statusmsg = 319; (SEM NUOP!)
-    - User: "O que houve com ela?" (Histórico tem E5610...) -> SELECT * FROM view_universal WHERE nuop = 'E5610...';
-    
-    HISTÓRICO RECENTE: 
-    {historico}
-    
-    PERGUNTA ATUAL: {pergunta}
-    
-    RESPOSTA (APENAS O SQL):
-    """
-    
     if erro_anterior:
-        template += f"\n🚨 ERRO ANTERIOR: {erro_anterior}. Corrija a sintaxe."
-    
-    prompt = PromptTemplate(input_variables=["historico", "pergunta", "glossario"], template=template)
-    chain = prompt | llm | StrOutputParser()
-    
-    sql_bruto = chain.invoke({
+        contar_retry_sql()
+    
+    chave_cache = None
+    if not erro_anterior:
+        # Cache da tradução: pergunta repetida não paga o LLM de novo
+        chave_cache = cache_sql.chave(pergunta, historico)
+        sql_cache = cache_sql.obter(chave_cache)
+        if sql_cache:
+            print(f"   ➤ SQL do cache ({chave_cache})")
+            return {
+                "sql_query": sql_cache,
+                "sql_params": None,
+                "tentativas": state.get('tentativas', 0) + 1,
+                "sql_cache_chave": chave_cache,
+                "sql_do_cache": True,
+                "sql_pre_validacao": None,
+            }, None, chave_cache
+    
+    dica = ""
+    if erro_anterior and (state.get('sql_plano') or {}).get('excedido'):
+        # Barrada pela guarda de custo: a sintaxe está certa, falta filtro
+        dica = f"\n🚨 CONSULTA ANTERIOR REJEITADA: {erro_anterior}"
+    elif erro_anterior:
+        dica = f"\n🚨 ERRO ANTERIOR: {erro_anterior}. Corrija a sintaxe."
+    
+    entradas = {
         "historico": historico, 
         "pergunta": pergunta,
-        "glossario": GLOSSARIO_SPB 
-    })
-    
+        "glossario": GLOSSARIO_SPB,
+        "dica": dica,
+    }
+    return None, entradas, chave_cache
+
+_CADEIAS = {}
+
+def _cadeia(prompt, temperatura=None):
+    """
+    prompt | llm | parser montado uma vez por (prompt, temperatura) e reutilizado.
+    Trocar agente_spb.llm (benchmark, testes) remonta na próxima chamada.
+    A temperatura só vale para modelos que têm o campo (ChatOllama).
+    """
+    base = obter_llm()
+    chave = (id(prompt), temperatura)
+    item = _CADEIAS.get(chave)
+    if item is None or item[0] is not base:
+        modelo = base
+        if temperatura is not None and "temperature" in type(base).model_fields:
+            modelo = base.model_copy(update={"temperature": temperatura})
+        item = (base, prompt | modelo | StrOutputParser())
+        _CADEIAS[chave] = item
+    return item[1]
+
+def _limpar_sql(sql_bruto):
+    """SQL a partir do primeiro SELECT, sem markdown, até o primeiro ';'. None se não há SELECT."""
     # --- LIMPEZA SEGURA (MANTIDA DO CÓDIGO ANTIGO) ---
     # Remove marcação markdown
     sql_limpo = re.sub(r"```sql|```", "", sql_bruto).strip()
     
     # Garante que pegamos apenas a partir do SELECT (ignora conversas antes)
     inicio_comando = sql_limpo.upper().find("SELECT")
-    if inicio_comando != -1:
-        sql_limpo = sql_limpo[inicio_comando:]
-    else:
-        # Se o LLM não gerou SELECT, retornamos um erro seguro vazio
-        return {"sql_query": "SELECT 1 WHERE 1=0;", "tentativas": state.get('tentativas', 0) + 1}
+    if inicio_comando == -1:
+        return None
+    sql_limpo = sql_limpo[inicio_comando:]
 
     # Garante ponto e vírgula no final
     if ";" in sql_limpo: 
         sql_limpo = sql_limpo.split(";")[0] + ";"
+    return sql_limpo
+
+def _finalizar_sql(sql_bruto, state: AgentState, chave_cache):
+    sql_limpo = _limpar_sql(sql_bruto)
+    if sql_limpo is None:
+        # Se o LLM não gerou SELECT, retornamos um erro seguro vazio
+        return {"sql_query": "SELECT 1 WHERE 1=0;", "sql_params": None, "tentativas": state.get('tentativas', 0) + 1,
+                "sql_cache_chave": None, "sql_pre_validacao": None}
         
-    return {"sql_query": sql_limpo, "tentativas": state.get('tentativas', 0) + 1}
+    return {
+        "sql_query": sql_limpo,
+        "sql_params": None,
+        "tentativas": state.get('tentativas', 0) + 1,
+        "sql_cache_chave": chave_cache or state.get('sql_cache_chave'),
+        "sql_do_cache": False,
+        "sql_pre_validacao": None,
+    }
+
+def _reescrever_rollup(sql, params=None):
+    """Contagem por status/origem/codmsg/tempo lida dos rollups por minuto (rollup_contagens.py).
+    Retorna (sql, params, reescrito)."""
+    reescrita = reescrever_contagem(sql, params)
+    if not reescrita:
+        return sql, params, False
+    print("   ➤ Contagem reescrita para o rollup por minuto")
+    return reescrita[0], reescrita[1], True
+
+def _validar_sql(sql, params=None, usar_guarda=True):
+    """
+    Reescrita para o rollup + LIMIT automático + EXPLAIN contra o orçamento.
+    Retorna (sql, params, plano, erro); erro None = pode executar. O plano é o da
+    consulta que vai rodar: a contagem cara no histórico é barata no rollup.
+    """
+    sql, params, _ = _reescrever_rollup(sql, params)
+    if usar_guarda:
+        sql, _ = guarda_custo.garantir_limit(sql)
+    try:
+        with medir_db():
+            plano = guarda_custo.estimar_plano(f"{CTE_UNIVERSAL} {sql}", params)
+    except Exception as e:
+        # EXPLAIN já pega erro de sintaxe/coluna: mesmo tratamento do executar_sql
+        return sql, params, None, str(e)
+    dica = guarda_custo.avaliar(plano) if usar_guarda else None
+    plano["excedido"] = dica is not None
+    return sql, params, plano, dica
+
+# --- MODO ESPECULATIVO (SQL_CANDIDATOS > 1) ---
+# Cada candidato é gerado e validado (EXPLAIN, conexão própria do pool) assim que fica pronto.
+# Depois do primeiro válido espera-se no máximo SQL_CANDIDATOS_ESPERA_S pelos demais e fica
+# o válido de menor custo; sem nenhum válido, o loop serial de correção assume com o erro.
+
+def _variantes_sql():
+    return VARIANTES_SQL[:max(1, min(SQL_CANDIDATOS, len(VARIANTES_SQL)))]
+
+def _candidato_sql(indice, sql_bruto):
+    sql = _limpar_sql(sql_bruto)
+    if sql is None:
+        return {"indice": indice, "sql": None, "plano": None, "erro": "O modelo não gerou um SELECT."}
+    validado, params, plano, erro = _validar_sql(sql, usar_guarda=guarda_custo.GUARDA_ATIVA)
+    return {"indice": indice, "sql": validado, "params": params, "original": sql, "plano": plano, "erro": erro}
+
+def _falha_candidato(indice, erro):
+    return {"indice": indice, "sql": None, "plano": None, "erro": f"Falha ao gerar o candidato: {erro}"}
+
+def _escolher_candidato(candidatos, state: AgentState, chave_cache):
+    validos = [c for c in candidatos if c["sql"] and not c["erro"]]
+    if validos:
+        escolhido = min(validos, key=lambda c: (c["plano"]["custo"], c["indice"]))
+    else:
+        # Nenhum passou: segue o primeiro com SQL (ou o primeiro) para o retry serial corrigir
+        escolhido = min(candidatos, key=lambda c: (c["sql"] is None, c["indice"]))
+    plano = escolhido["plano"]
+    print(f"   ➤ Especulativo: {len(validos)}/{len(candidatos)} candidatos válidos; "
+          f"escolhido #{escolhido['indice']}" + (f" custo={plano['custo']:.0f}" if plano else ""))
+    # Inválido: o retry corrige o SQL do modelo, não a reescrita do rollup
+    sql = escolhido["original"] if escolhido["erro"] and escolhido["sql"] else escolhido["sql"]
+    return {
+        "sql_query": sql or "SELECT 1 WHERE 1=0;",
+        "sql_params": None if escolhido["erro"] else escolhido.get("params"),
+        "sql_original": escolhido.get("original"),
+        "tentativas": state.get('tentativas', 0) + 1,
+        "sql_cache_chave": (chave_cache or state.get('sql_cache_chave')) if escolhido["sql"] else None,
+        "sql_do_cache": False,
+        "sql_pre_validacao": {"erro": escolhido["erro"], "plano": plano},
+    }
+
+def _entradas_variante(entradas, instrucao):
+    return {**entradas, "dica": entradas["dica"] + instrucao} if instrucao else entradas
+
+def _especular_sql(entradas, state: AgentState, chave_cache):
+    variantes = _variantes_sql()
+
+    def gerar_e_validar(indice, temperatura, instrucao):
+        try:
+            bruto = _cadeia(PROMPT_SQL, temperatura).invoke(_entradas_variante(entradas, instrucao))
+        except Exception as e:
+            return _falha_candidato(indice, e)
+        return _candidato_sql(indice, bruto)
+
+    candidatos, prazo = [], None
+    executor = ThreadPoolExecutor(max_workers=len(variantes), thread_name_prefix="sql-candidato")
+    # copy_context: o span do nó (metricas.py) acompanha cada thread
+    pendentes = {executor.submit(contextvars.copy_context().run, gerar_e_validar, i, t, instr)
+                 for i, (t, instr) in enumerate(variantes)}
+    while pendentes:
+        espera = None if prazo is None else max(0.0, prazo - time.monotonic())
+        prontos, pendentes = wait(pendentes, timeout=espera, return_when=FIRST_COMPLETED)
+        if not prontos:
+            break
+        for futuro in prontos:
+            candidato = futuro.result()
+            candidatos.append(candidato)
+            if prazo is None and candidato["sql"] and not candidato["erro"]:
+                prazo = time.monotonic() + SQL_CANDIDATOS_ESPERA_S
+    # Retardatários terminam em segundo plano; o resultado deles é descartado
+    executor.shutdown(wait=False, cancel_futures=True)
+    return _escolher_candidato(candidatos, state, chave_cache)
+
+async def _aespecular_sql(entradas, state: AgentState, chave_cache):
+    async def gerar_e_validar(indice, temperatura, instrucao):
+        # Só o primeiro candidato transmite tokens para a UI; os demais seriam ruído intercalado
+        config = None if indice == 0 else {"tags": [TAG_NOSTREAM]}
+        try:
+            bruto = await _cadeia(PROMPT_SQL, temperatura).ainvoke(_entradas_variante(entradas, instrucao), config=config)
+        except Exception as e:
+            return _falha_candidato(indice, e)
+        return await asyncio.to_thread(_candidato_sql, indice, bruto)
+
+    candidatos, prazo = [], None
+    pendentes = {asyncio.create_task(gerar_e_validar(i, t, instr))
+                 for i, (t, instr) in enumerate(_variantes_sql())}
+    while pendentes:
+        espera = None if prazo is None else max(0.0, prazo - time.monotonic())
+        prontos, pendentes = await asyncio.wait(pendentes, timeout=espera, return_when=asyncio.FIRST_COMPLETED)
+        if not prontos:
+            break
+        for tarefa in prontos:
+            candidato = tarefa.result()
+            candidatos.append(candidato)
+            if prazo is None and candidato["sql"] and not candidato["erro"]:
+                prazo = time.monotonic() + SQL_CANDIDATOS_ESPERA_S
+    for tarefa in pendentes:
+        tarefa.cancel()   # Cancela a geração no Ollama (fecha a requisição HTTP)
+    return _escolher_candidato(candidatos, state, chave_cache)
+
+def node_gerar_sql(state: AgentState):
+    pronto, entradas, chave_cache = _preparar_gerar_sql(state)
+    if pronto:
+        return pronto
+    if SQL_CANDIDATOS > 1:
+        return _especular_sql(entradas, state, chave_cache)
+    return _finalizar_sql(_cadeia(PROMPT_SQL).invoke(entradas), state, chave_cache)
+
+async def anode_gerar_sql(state: AgentState):
+    """Versão assíncrona: os tokens do LLM saem no astream(stream_mode="messages") do grafo."""
+    pronto, entradas, chave_cache = _preparar_gerar_sql(state)
+    if pronto:
+        return pronto
+    if SQL_CANDIDATOS > 1:
+        return await _aespecular_sql(entradas, state, chave_cache)
+    return _finalizar_sql(await _cadeia(PROMPT_SQL).ainvoke(entradas), state, chave_cache)
+
+def node_validar_sql(state: AgentState):
+    """
+    Guarda de custo antes de executar: LIMIT automático + EXPLAIN contra o orçamento.
+    Consulta cara ou inválida não chega a rodar; volta para o gerar_sql corrigir.
+    """
+    pre = state.get('sql_pre_validacao')
+    if pre:
+        # Modo especulativo: o gerar_sql já validou o candidato escolhido com EXPLAIN
+        if pre["erro"]:
+            return {"sql_erro": pre["erro"], "sql_resultado": None, "sql_executado": state['sql_query'],
+                    "sql_plano": pre["plano"], "sql_pre_validacao": None}
+        return {"sql_erro": None, "sql_plano": pre["plano"], "sql_pre_validacao": None}
+
+    original, params = state['sql_query'], state.get('sql_params') or None
+    if not guarda_custo.GUARDA_ATIVA:
+        sql, params, reescrito = _reescrever_rollup(original, params)
+        if not reescrito:
+            return {"sql_erro": None, "sql_plano": None}
+        return {"sql_query": sql, "sql_params": params, "sql_original": original, "sql_erro": None, "sql_plano": None}
+    
+    sql, params, plano, erro = _validar_sql(original, params)
+    limite = f"LIMIT {guarda_custo.LIMITE_AUTOMATICO};"
+    if sql.rstrip().endswith(limite) and limite not in original:
+        print(f"   ➤ LIMIT {guarda_custo.LIMITE_AUTOMATICO} acrescentado automaticamente")
+    if plano is None:
+        if state.get('sql_do_cache'):
+            cache_sql.remover(state['sql_cache_chave'])
+        return {"sql_erro": erro, "sql_resultado": None, "sql_plano": None}
+    
+    print(f"   ➤ Plano: {plano['no']} custo={plano['custo']:.0f} linhas≈{plano['linhas']:.0f}"
+          f"{' ❌ acima do orçamento' if erro else ''}")
+    if erro:
+        if state.get('sql_do_cache'):
+            cache_sql.remover(state['sql_cache_chave'])
+        return {"sql_erro": erro, "sql_resultado": None, "sql_executado": sql, "sql_plano": plano}
+    # A reescrita para o rollup já vem pronta (validar_sql): o executar não reescreve de novo
+    return {"sql_query": sql, "sql_params": params, "sql_original": original, "sql_erro": None, "sql_plano": plano}
 
 def node_executar_sql(state: AgentState):
-    query_final = f"{CTE_UNIVERSAL} {state['sql_query']}"
-    print(f"\n🔍 DEBUG QUERY: {query_final}\n") 
+    sql, params = state['sql_query'], state.get('sql_params') or None
+    query_final = f"{CTE_UNIVERSAL} {sql}"
+    print(f"\n🔍 DEBUG QUERY (view_universal omitida): {sql}\n")
+    
+    resultado = None
     
-    conn = psycopg2.connect(**DB_CONFIG)
     try:
-        df = pd.read_sql(query_final, conn)
+        with medir_db() as medicao:
+            if SQL_STREAMING:
+                # Cursor nomeado no servidor: lê só a primeira página; o resto fica para o /mais
+                resultado, df = abrir_resultado(query_final, params)
+                query_final = resultado.query_exibida
+            else:
+                with conexao_db() as conn:
+                    df = pd.read_sql(query_final, conn, params=params)
+                    if params:
+                        # Mostra na UI o SQL já com os valores do template
+                        query_final = conn.cursor().mogrify(query_final, params).decode()
+                df = truncar_colunas(df)
+            medicao["linhas"] = len(df)
+        registrar_dataframe(df)
+        
+        # Executou sem erro: agora sim a tradução pode ir para o cache
+        if state.get('sql_cache_chave') and not state.get('sql_do_cache'):
+            cache_sql.gravar(state['sql_cache_chave'], state.get('sql_original') or state['sql_query'])
         
         if df.empty:
             return {
                 "sql_resultado": "⚠️ Nenhum registro encontrado.", 
                 "sql_executado": query_final,
+                "sql_resultado_id": None,
+                "sql_pagina": None,
                 "sql_erro": None
             }
         
-        # Limpeza Visual
-        if 'msgop' in df.columns: df = df.drop(columns=['msgop'])
-        for col in df.columns:
-            if df[col].dtype == 'object':
-                df[col] = df[col].apply(lambda x: (str(x)[:50] + '...') if len(str(x)) > 50 else x)
+        markdown = df.to_markdown(index=False)
+        rodape = resultado.resumo() if resultado and (resultado.tem_mais or resultado.truncado) else ""
+        if rodape:
+            markdown += f"\n\n{rodape}"
+        colunas, linhas = linhas_texto(df)
         
         return {
-            "sql_resultado": df.to_markdown(index=False), 
+            "sql_resultado": markdown, 
             "sql_executado": query_final,
+            "sql_pagina": {"colunas": colunas, "linhas": linhas, "rodape": rodape},
+            "sql_resultado_id": resultado.id if resultado and resultado.tem_mais else None,
+            "sql_linhas": resultado.lidas if resultado else len(df),
+            "sql_total": resultado.total if resultado else len(df),
             "sql_erro": None
         }
     except Exception as e:
+        if state.get('sql_do_cache'):
+            cache_sql.remover(state['sql_cache_chave'])  # SQL do cache quebrou (ex: schema mudou)
         return {"sql_erro": str(e), "sql_resultado": None}
-    finally:
-        conn.close()
+
+def _escapar_like(texto):
+    """Escapa curingas do LIKE (% e _) para o NUOP ser comparado literalmente."""
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def buscar_timeline_nuop(conn, nuop, permitir_substring=False):
+    """
+    Busca o NUOP em ordem de custo: exato -> prefixo -> substring (só se permitido).
+    Exato e prefixo usam o índice btree (text_pattern_ops) criado por indices_nuop.py;
+    a substring só fica rápida com o índice pg_trgm opcional.
+    Retorna (DataFrame, modo_usado).
+    """
+    modos = ["exato", "prefixo"] + (["substring"] if permitir_substring else [])
+    params = {"nuop": nuop, "nuop_like": _escapar_like(nuop)}
+    df = None
+    for modo in modos:
+        query = QUERY_INVESTIGACAO_NUOP.format(filtro=FILTROS_NUOP[modo])
+        df = pd.read_sql(query, conn, params=params)
+        if not df.empty:
+            return df, modo
+    return df, modos[-1]
 
 def node_investigar_nuop(state: AgentState):
-    nuop_safe = state['nuop_id'].strip().replace("'", "")
+    nuop_safe = state['nuop_id'].strip()
+    permitir_substring = NUOP_BUSCA_SUBSTRING or bool(state.get('busca_parcial'))
     print(f"🕵️ Investigando NUOP: {nuop_safe}...")
     
-    query = f"""
-    WITH 
-    spi_op AS (
-        SELECT 'PIX.operacao' as origem, msgid, nuop, codmsg, statusop, statusmsg, sitlanc, ts_inclusao, msgop, NULL::timestamp as ts_entrega, NULL::timestamp as ts_consumo
-        FROM PIX.operacao WHERE nuop LIKE '%{nuop_safe}%'
-    ),
-    spi_leg AS (
-        SELECT 'PIX.legado', L.msgid, O.nuop, O.codmsg, NULL::smallint, NULL::smallint, NULL, L.ts_inclusao, O.msgop, L.ts_entrega, L.ts_consumo
-        FROM PIX.legado L JOIN spi.operacao O ON L.msgid = O.msgid WHERE O.nuop LIKE '%{nuop_safe}%'
-    ),
-    spb_op AS (
-        SELECT 'spb.operacao', msgid, nuop, codmsg, statusop, statusmsg, NULL, ts_inclusao, msgop, NULL::timestamp, NULL::timestamp
-        FROM spb.operacao WHERE nuop LIKE '%{nuop_safe}%'
-    )
-    SELECT * FROM spi_op UNION ALL SELECT * FROM spi_leg UNION ALL SELECT * FROM spb_op ORDER BY ts_inclusao ASC;
-    """
-    
-    conn = psycopg2.connect(**DB_CONFIG)
     try:
-        df = pd.read_sql(query, conn)
+        with medir_db() as medicao, conexao_db() as conn:
+            df, modo = buscar_timeline_nuop(conn, nuop_safe, permitir_substring)
+            medicao["linhas"] = len(df)
+        registrar_dataframe(df)
         if not df.empty:
-            df['hora'] = pd.to_datetime(df['ts_inclusao'])
-            return {"dados_nuop": df, "relatorio_final": None} # Limpa relatório anterior se houver
+            print(f"   ➤ Encontrado via busca '{modo}' ({len(df)} linhas)")
+            # Motivo extraído aqui: o XML bruto não entra no estado (nem no checkpoint da sessão)
+            extrair_evidencias(df)
+            return {"dados_nuop": TimelineNuop.de_dataframe(df), "relatorio_final": None} # Limpa relatório anterior se houver
         else:
             # AQUI ESTÁ A MENSAGEM QUE ESTAVA SENDO PERDIDA
-            return {"relatorio_final": f"⚠️ O NUOP '{nuop_safe}' não foi encontrado em nenhuma tabela (SPI/SPB). Verifique se o código está correto."}
+            aviso = f"⚠️ O NUOP '{nuop_safe}' não foi encontrado em nenhuma tabela (SPI/SPB). Verifique se o código está correto."
+            if not permitir_substring:
+                aviso += " (Busca exata/prefixo. Peça uma busca 'parcial' para procurar trechos do código.)"
+            return {"relatorio_final": aviso}
     except Exception as e:
         return {"relatorio_final": f"Erro de conexão DB: {e}"}
-    finally:
-        conn.close()
 
-def node_analise_forense(state: AgentState):
-    """Analisa o DataFrame encontrado e gera o parecer."""
-    df = state['dados_nuop']
-    
-    # 1. Pré-processamento: Extrair erros do XML com Parser Seguro
-    df['evidencia_erro'] = df['msgop'].apply(lambda x: extrair_motivo_xml_parser(str(x)))
-    sla = calcular_sla_unificado(df)
-    
-    # 2. Tabela para a IA ler
-    cols_ia = ['origem', 'codmsg', 'statusop', 'statusmsg', 'evidencia_erro', 'ts_inclusao']
-    tabela_para_ia = df[cols_ia].to_markdown(index=False)
-    
-    # 3. Prompt com a NOVA LÓGICA DE PRECISÃO
-    template = """
+def extrair_evidencias(df):
+    """Extrai o motivo do XML para a coluna 'evidencia_erro' (no próprio DataFrame)."""
+    if 'evidencia_erro' in df.columns:
+        # Motivo pré-computado pelo backfill: só parseia as linhas que ainda não foram processadas
+        faltando = df['evidencia_erro'].isna()
+        if faltando.any():
+            df.loc[faltando, 'evidencia_erro'] = extrair_motivos_coluna(df.loc[faltando, 'msgop'])
+    else:
+        df['evidencia_erro'] = extrair_motivos_coluna(df['msgop'])  # Lote: cada msgop distinto é parseado uma vez
+
+# Prompt do parecer, compilado uma vez (a tabela chega compactada por tabela_prompt.py)
+TEMPLATE_PARECER = """
     Você é um Perito Forense do Sistema Bancário (SPB/PIX).
-    DADOS TÉCNICOS DA OPERAÇÃO (Histórico Completo):
+    DADOS TÉCNICOS DA OPERAÇÃO (Histórico; linhas repetidas agrupadas em 'qtd', de ts_inclusao a ts_ultimo):
     {tabela}
     
     PERFORMANCE:
@@ -358,13 +740,82 @@ def node_analise_forense(state: AgentState):
     **Análise Técnica:** (Detalhe se foi erro 205 genérico ou se houve a mensagem explícita de timeout)
     **Veredito Final:** (SUCESSO / TIMEOUT / ERRO BACEN / ERRO OPERACIONAL)
     """
+
+PROMPT_PARECER = PromptTemplate(input_variables=["tabela", "sla"], template=TEMPLATE_PARECER)
+
+def _montar_parecer(df, sla):
+    """Monta (chain, entradas) do parecer do caso (DataFrame já com 'evidencia_erro')."""
+    # Tabela para a IA ler: repetições colapsadas e orçamento de tokens (prompt e prefill previsíveis)
+    tabela_para_ia = compactar_tabela(df)
+    return _cadeia(PROMPT_PARECER), {"tabela": tabela_para_ia, "sla": sla}
+
+def gerar_parecer_forense(df, sla):
+    """Pede ao LLM o parecer do caso (DataFrame já com 'evidencia_erro')."""
+    chain, entradas = _montar_parecer(df, sla)
+    return chain.invoke(entradas)
+
+async def agerar_parecer_forense(df, sla):
+    chain, entradas = _montar_parecer(df, sla)
+    return await chain.ainvoke(entradas)
+
+def _decidir_por_regra(state: AgentState):
+    """SLA + motor de regras. Retorna (resposta_pronta ou None, df, sla)."""
+    # 1. DataFrame montado da timeline (o motivo do XML já foi extraído no investigar_nuop)
+    df = state['dados_nuop'].para_dataframe()
+    sla = calcular_sla_unificado(df)
+    registrar_dataframe(df)
+    
+    # 2. Motor de regras: se a hierarquia decide sozinha, responde sem chamar o LLM
+    decisao = None if VEREDITO_SEMPRE_LLM else aplicar_regras(df)
+    if decisao and not state.get('narrativa_solicitada'):
+        print(f"   ➤ Veredito por regra {decisao['regra']}: {decisao['veredito']}")
+        return {"relatorio_final": relatorio_deterministico(decisao, sla)}, df, sla
+    return None, df, sla
+
+def node_analise_forense(state: AgentState):
+    """Analisa o DataFrame encontrado e gera o parecer."""
+    pronto, df, sla = _decidir_por_regra(state)
+    if pronto:
+        return pronto
     
-    prompt = PromptTemplate(input_variables=["tabela", "sla"], template=template)
-    chain = prompt | llm | StrOutputParser()
-    analise = chain.invoke({"tabela": tabela_para_ia, "sla": sla})
+    analise = gerar_parecer_forense(df, sla)
     
     return {"relatorio_final": analise}
 
+async def anode_analise_forense(state: AgentState):
+    # Montar o DataFrame e rodar as regras é CPU: fora do event loop
+    pronto, df, sla = await asyncio.to_thread(_decidir_por_regra, state)
+    if pronto:
+        return pronto
+    return {"relatorio_final": await agerar_parecer_forense(df, sla)}
+
+def node_registrar_turno(state: AgentState):
+    """Fim de todo fluxo: resume o turno no ring buffer e atualiza o slot do último NUOP."""
+    ultimo_nuop = state.get('ultimo_nuop')
+    nuops = state['dados_nuop'].nuops() if state.get('dados_nuop') else set()
+    if len(nuops) == 1:
+        ultimo_nuop = nuops.pop()   # NUOP completo (a busca pode ter sido por prefixo)
+    elif state.get('nuop_id'):
+        ultimo_nuop = state['nuop_id']
+    else:
+        citados = re.findall(r'\b[a-zA-Z0-9]{20,35}\b', state['input_usuario'])
+        ultimo_nuop = citados[-1] if citados else ultimo_nuop
+    return {
+        "historico_turnos": registrar(state.get('historico_turnos'), resumir_turno(state['input_usuario'], state)),
+        "ultimo_nuop": ultimo_nuop,
+    }
+
+# Nós de banco: psycopg2 é bloqueante, então a versão assíncrona roda o nó numa thread
+# (a conexão vem do mesmo pool) e o event loop da TUI continua livre
+async def anode_validar_sql(state: AgentState):
+    return await asyncio.to_thread(node_validar_sql, state)
+
+async def anode_executar_sql(state: AgentState):
+    return await asyncio.to_thread(node_executar_sql, state)
+
+async def anode_investigar_nuop(state: AgentState):
+    return await asyncio.to_thread(node_investigar_nuop, state)
+
 # --- 4. FUNÇÕES DE CONTROLE DE FLUXO (NOVAS) ---
 
 def check_nuop_found(state: AgentState):
@@ -372,10 +823,15 @@ def check_nuop_found(state: AgentState):
     if state.get("relatorio_final"):
         # Se já tem mensagem (ex: "Não encontrado"), encerra aqui.
         return "encerrar"
-    if state.get("dados_nuop") is not None and not state["dados_nuop"].empty:
+    if state.get("dados_nuop"):
         return "analisar"
     return "encerrar"
 
+def check_sql_validado(state: AgentState):
+    if state.get('sql_erro'):
+        return "retry" if state['tentativas'] < 3 else "give_up"
+    return "executar"
+
 def check_sql_status(state: AgentState):
     if state['sql_erro']:
         return "retry" if state['tentativas'] < 3 else "give_up"
@@ -385,19 +841,35 @@ def check_sql_status(state: AgentState):
 
 workflow = StateGraph(AgentState)
 
-workflow.add_node("router", node_router)
-workflow.add_node("gerar_sql", node_gerar_sql)
-workflow.add_node("executar_sql", node_executar_sql)
-workflow.add_node("investigar_nuop", node_investigar_nuop)
-workflow.add_node("analise_forense", node_analise_forense)
+def _no(nome, func, afunc=None):
+    """Nó instrumentado (metricas.py); com afunc também roda nativo no ainvoke/astream."""
+    if afunc is None:
+        return instrumentar(nome, func)
+    return RunnableLambda(instrumentar(nome, func), afunc=instrumentar(nome, afunc))
+
+# Cada nó tem versão síncrona (invoke: lote_forense, scripts) e assíncrona (ainvoke/astream: TUI)
+workflow.add_node("router", _no("router", node_router))
+workflow.add_node("gerar_sql", _no("gerar_sql", node_gerar_sql, anode_gerar_sql))
+workflow.add_node("validar_sql", _no("validar_sql", node_validar_sql, anode_validar_sql))
+workflow.add_node("executar_sql", _no("executar_sql", node_executar_sql, anode_executar_sql))
+workflow.add_node("investigar_nuop", _no("investigar_nuop", node_investigar_nuop, anode_investigar_nuop))
+workflow.add_node("analise_forense", _no("analise_forense", node_analise_forense, anode_analise_forense))
+workflow.add_node("registrar_turno", _no("registrar_turno", node_registrar_turno))
 
 workflow.set_entry_point("router")
 
 # Rota inicial
+def rota_inicial(state: AgentState):
+    if state['tipo_fluxo'] == "nuop":
+        return "investigar_nuop"
+    if state['tipo_fluxo'] == "sql_rapido":
+        return "executar_sql"   # Template pronto: pula o LLM (se falhar, o retry cai no gerar_sql)
+    return "gerar_sql"
+
 workflow.add_conditional_edges(
     "router",
-    lambda state: "investigar_nuop" if state['tipo_fluxo'] == "nuop" else "gerar_sql",
-    {"investigar_nuop": "investigar_nuop", "gerar_sql": "gerar_sql"}
+    rota_inicial,
+    {"investigar_nuop": "investigar_nuop", "gerar_sql": "gerar_sql", "executar_sql": "executar_sql"}
 )
 
 # Rota NUOP (AQUI ESTAVA O BUG - AGORA CORRIGIDO)
@@ -406,18 +878,47 @@ workflow.add_conditional_edges(
     check_nuop_found,
     {
         "analisar": "analise_forense",
-        "encerrar": END
+        "encerrar": "registrar_turno"
     }
 )
-workflow.add_edge("analise_forense", END)
+workflow.add_edge("analise_forense", "registrar_turno")
 
 # Rota SQL
-workflow.add_edge("gerar_sql", "executar_sql")
+workflow.add_edge("gerar_sql", "validar_sql")
+workflow.add_conditional_edges(
+    "validar_sql",
+    check_sql_validado,
+    {"retry": "gerar_sql", "executar": "executar_sql", "give_up": "registrar_turno"}
+)
 workflow.add_conditional_edges(
     "executar_sql",
     check_sql_status,
-    {"retry": "gerar_sql", "success": END, "give_up": END}
+    {"retry": "gerar_sql", "success": "registrar_turno", "give_up": "registrar_turno"}
 )
+workflow.add_edge("registrar_turno", END)
+
 
+def construir_app(checkpointer=None):
+    """Grafo compilado com checkpointer: cada sessão (thread_id) guarda histórico e último NUOP."""
+    return workflow.compile(checkpointer=checkpointer)
 
+# Sem checkpointer: chamadas avulsas (lote, serviço sem sessão, scripts)
 app = workflow.compile()
+
+def aquecer_modelo():
+    """
+    Warm-up do LLM: monta as cadeias dos dois prompts e pede 1 token ao Ollama,
+    que carrega o Llama 3 na memória antes da primeira pergunta.
+    Retorna (ok, detalhe) — não levanta exceção.
+    """
+    inicio = time.perf_counter()
+    try:
+        modelo = obter_llm()
+        for prompt in (PROMPT_SQL, PROMPT_PARECER):
+            _cadeia(prompt)
+        if "num_predict" in type(modelo).model_fields:
+            modelo = modelo.model_copy(update={"num_predict": 1})
+        modelo.invoke("OK")
+    except Exception as e:
+        return False, str(e)
+    return True, f"{getattr(modelo, 'model', OLLAMA_MODELO)} ({time.perf_counter() - inicio:.1f}s)"
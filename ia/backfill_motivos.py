@@ -0,0 +1,175 @@
+"""
+Backfill (offline / incremental) do motivo de erro extraído do XML.
+
+O msgop não muda depois de gravado, então o motivo é extraído uma única vez e
+persistido em forense.motivo_extraido (chave: msgid). Com MOTIVOS_PRECOMPUTADOS=1
+o node_investigar_nuop e a view_universal leem a coluna 'evidencia_erro' pronta
+e não parseiam XML na hora da consulta.
+
+- Percorre cada fonte em blocos por keyset (ts_inclusao, msgid), sem OFFSET;
+- Retoma do watermark salvo em forense.backfill_watermark (por fonte);
+- A extração dos blocos roda em paralelo num pool de processos;
+  a gravação (motivos + watermark) é feita em ordem, numa transação por bloco.
+
+Uso:
+    python backfill_motivos.py --preparar                # Cria schema, tabelas e índices de keyset
+    python backfill_motivos.py --workers 4 --bloco 5000  # Processa o que falta e sai
+    python backfill_motivos.py --intervalo 60            # Modo contínuo (incremental a cada 60s)
+"""
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from psycopg2.extras import execute_values
+
+from db_pool import conexao_db
+from extrator_xml import extrair_motivo
+from indices_nuop import aplicar_ddl
+
+TABELA_MOTIVOS = "forense.motivo_extraido"
+TABELA_WATERMARK = "forense.backfill_watermark"
+
+# fonte -> (SELECT base, coluna ts, coluna msgid). Legado usa o msgop da operação (JOIN por msgid),
+# como no node_investigar_nuop; o ON CONFLICT evita regravar o mesmo msgid.
+FONTES = {
+    "pix.operacao": ("SELECT msgid, ts_inclusao, msgop FROM pix.operacao", "ts_inclusao", "msgid"),
+    "str.operacao": ("SELECT msgid, ts_inclusao, msgop FROM str.operacao", "ts_inclusao", "msgid"),
+    "spb.operacao": ("SELECT msgid, ts_inclusao, msgop FROM spb.operacao", "ts_inclusao", "msgid"),
+    "pix.legado": (
+        "SELECT L.msgid, L.ts_inclusao, O.msgop FROM pix.legado L JOIN spi.operacao O ON L.msgid = O.msgid",
+        "L.ts_inclusao", "L.msgid",
+    ),
+}
+
+TAMANHO_BLOCO = 5000
+WORKERS = 4
+
+
+def gerar_ddl():
+    ddl = [
+        "CREATE SCHEMA IF NOT EXISTS forense",
+        f"""CREATE TABLE IF NOT EXISTS {TABELA_MOTIVOS} (
+            msgid text PRIMARY KEY,
+            fonte text NOT NULL,
+            motivo text NOT NULL,
+            extraido_em timestamptz NOT NULL DEFAULT now()
+        )""",
+        f"""CREATE TABLE IF NOT EXISTS {TABELA_WATERMARK} (
+            fonte text PRIMARY KEY,
+            ts_inclusao timestamp NOT NULL,
+            msgid text NOT NULL,
+            atualizado_em timestamptz NOT NULL DEFAULT now()
+        )""",
+    ]
+    # Índices que tornam o keyset (ts_inclusao, msgid) um range scan
+    for tabela in ["pix.operacao", "str.operacao", "spb.operacao", "pix.legado"]:
+        nome = f"idx_{tabela.split('.')[-1]}_keyset"
+        ddl.append(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nome} ON {tabela} (ts_inclusao, msgid)")
+    return ddl
+
+def _extrair_bloco(linhas):
+    """Roda no processo filho: [(msgid, msgop)] -> [(msgid, motivo)]."""
+    return [(msgid, extrair_motivo(msgop)) for msgid, msgop in linhas]
+
+def ler_watermark(conn, fonte):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT ts_inclusao, msgid FROM {TABELA_WATERMARK} WHERE fonte = %s", (fonte,))
+        linha = cur.fetchone()
+    return linha or (None, None)
+
+def _ler_blocos(fonte, tamanho_bloco):
+    """Gera blocos em ordem de keyset a partir do watermark salvo."""
+    select, col_ts, col_msgid = FONTES[fonte]
+    with conexao_db() as conn:
+        ts, msgid = ler_watermark(conn, fonte)
+    while True:
+        if ts is None:
+            filtro, params = f"WHERE {col_ts} IS NOT NULL", {}
+        else:
+            filtro = f"WHERE ({col_ts}, {col_msgid}) > (%(ts)s, %(msgid)s)"
+            params = {"ts": ts, "msgid": msgid}
+        query = f"{select} {filtro} ORDER BY {col_ts}, {col_msgid} LIMIT %(limite)s"
+        params["limite"] = tamanho_bloco
+        with conexao_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                linhas = cur.fetchall()
+        if not linhas:
+            return
+        ultimo = linhas[-1]
+        ts, msgid = ultimo[1], ultimo[0]
+        yield [(m, x) for m, _, x in linhas], (ts, msgid)
+        if len(linhas) < tamanho_bloco:
+            return
+
+def _gravar_bloco(fonte, motivos, watermark):
+    """Motivos + avanço do watermark na mesma transação (retomada nunca pula linhas)."""
+    with conexao_db(somente_leitura=False) as conn:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                f"INSERT INTO {TABELA_MOTIVOS} (msgid, fonte, motivo) VALUES %s ON CONFLICT (msgid) DO NOTHING",
+                [(msgid, fonte, motivo) for msgid, motivo in motivos],
+                page_size=1000,
+            )
+            cur.execute(
+                f"""INSERT INTO {TABELA_WATERMARK} (fonte, ts_inclusao, msgid) VALUES (%s, %s, %s)
+                    ON CONFLICT (fonte) DO UPDATE
+                    SET ts_inclusao = EXCLUDED.ts_inclusao, msgid = EXCLUDED.msgid, atualizado_em = now()""",
+                (fonte, watermark[0], watermark[1]),
+            )
+        conn.commit()
+
+def processar_fonte(fonte, pool, workers=WORKERS, tamanho_bloco=TAMANHO_BLOCO):
+    """Pipeline: lê blocos em sequência, extrai em paralelo (até `workers` em voo) e grava em ordem."""
+    total = 0
+    em_voo = []   # [(future, watermark)] na ordem de leitura
+    for linhas, watermark in _ler_blocos(fonte, tamanho_bloco):
+        em_voo.append((pool.submit(_extrair_bloco, linhas), watermark))
+        while len(em_voo) >= workers:
+            futuro, wm = em_voo.pop(0)
+            motivos = futuro.result()
+            _gravar_bloco(fonte, motivos, wm)
+            total += len(motivos)
+    for futuro, wm in em_voo:
+        motivos = futuro.result()
+        _gravar_bloco(fonte, motivos, wm)
+        total += len(motivos)
+    return total
+
+def executar(fontes, workers=WORKERS, tamanho_bloco=TAMANHO_BLOCO):
+    resumo = {}
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        for fonte in fontes:
+            inicio = time.perf_counter()
+            try:
+                total = processar_fonte(fonte, pool, workers, tamanho_bloco)
+                duracao = time.perf_counter() - inicio
+                print(f"✅ {fonte}: {total} mensagens em {duracao:.1f}s")
+                resumo[fonte] = total
+            except Exception as e:
+                print(f"❌ {fonte}: {str(e).strip()}")
+                resumo[fonte] = None
+    return resumo
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill do motivo de erro (XML) em forense.motivo_extraido.")
+    parser.add_argument("--preparar", action="store_true", help="Cria schema, tabelas e índices e sai")
+    parser.add_argument("--fontes", nargs="*", default=list(FONTES), choices=list(FONTES))
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Processos de extração")
+    parser.add_argument("--bloco", type=int, default=TAMANHO_BLOCO, help="Linhas por bloco (keyset)")
+    parser.add_argument("--intervalo", type=float, help="Modo contínuo: segundos entre rodadas incrementais")
+    args = parser.parse_args()
+
+    if args.preparar:
+        return 1 if aplicar_ddl(gerar_ddl()) else 0
+
+    while True:
+        resumo = executar(args.fontes, args.workers, args.bloco)
+        if args.intervalo is None:
+            return 1 if any(v is None for v in resumo.values()) else 0
+        time.sleep(args.intervalo)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Benchmark offline do agente: grafo compilado de verdade, LLM e banco substituídos.
+
+- LLM: ModeloFalso (bench_modelo_falso.py), respostas canônicas e latência fixa;
+- Banco: Postgres local semeado por bench_dados.py (banco separado, dados sintéticos);
+- Carga: corpus de replay (bench_corpus.json) x repetições, com N perguntas simultâneas
+  pelo app.ainvoke (mesmo caminho do serviço).
+
+Mede por nó (spans do metricas.py) e ponta a ponta: p50/p95/p99 e vazão (perguntas/s).
+Com --salvar-baseline grava o resultado; com --baseline compara e sai com código 1
+se alguma latência piorar (ou a vazão cair) além da tolerância.
+
+Uso:
+    python bench_agente.py --semear --nuops 20000 --salvar-baseline bench_baseline.json
+    python bench_agente.py --nuops 20000 --baseline bench_baseline.json --tolerancia 0.2
+    python bench_agente.py --concorrencia 8 --repeticoes 20 --latencia-llm 0.2
+"""
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+
+import db_pool
+import bench_dados
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PADRAO = os.path.join(DIR, "bench_corpus.json")
+PERCENTIS = (50, 95, 99)
+DIFERENCA_MINIMA_S = 0.002   # Abaixo disso é ruído de relógio, não regressão
+
+
+def percentil(valores, p):
+    """Nearest-rank (sem interpolação: o valor devolvido foi de fato medido)."""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+def resumir(valores):
+    resumo = {f"p{p}": round(percentil(valores, p), 6) for p in PERCENTIS}
+    resumo["n"] = len(valores)
+    return resumo
+
+def carregar_corpus(caminho, manifesto, repeticao):
+    """Troca {nuop:<cenário>} por um NUOP do cenário (gira a cada repetição) e devolve (perguntas, sql_por_pergunta)."""
+    with open(caminho, encoding="utf-8") as f:
+        corpus = json.load(f)["perguntas"]
+
+    def substituir(texto):
+        for cenario, nuops in manifesto.items():
+            marca = "{nuop:" + cenario + "}"
+            if marca in texto:
+                texto = texto.replace(marca, nuops[repeticao % len(nuops)] if nuops else "SEMNUOPNOCENARIO0000")
+        return texto
+
+    perguntas, sql_por_pergunta = [], {}
+    for item in corpus:
+        pergunta = substituir(item["pergunta"])
+        perguntas.append((item["id"], pergunta))
+        if item.get("sql"):
+            sql_por_pergunta[pergunta] = substituir(item["sql"])
+    return perguntas, sql_por_pergunta
+
+async def executar_carga(agente_spb, cache_sql, fechar_resultado, medir_execucao, perguntas,
+                         concorrencia, manter_cache):
+    """Roda todas as perguntas com no máximo `concorrencia` simultâneas. Devolve a lista de execuções."""
+    vagas = asyncio.Semaphore(concorrencia)
+
+    async def uma(pergunta_id, pergunta):
+        async with vagas:
+            if not manter_cache:
+                cache_sql.invalidar()
+            inicio = time.perf_counter()
+            erro = None
+            with medir_execucao() as spans:
+                try:
+                    estado = await agente_spb.app.ainvoke({"input_usuario": pergunta, "historico": ""})
+                    if estado.get("sql_resultado_id"):
+                        fechar_resultado(estado["sql_resultado_id"])
+                    if estado.get("sql_erro"):
+                        erro = estado["sql_erro"]
+                except Exception as e:
+                    erro = str(e)
+            return {"id": pergunta_id, "duracao_s": time.perf_counter() - inicio, "spans": list(spans), "erro": erro}
+
+    return await asyncio.gather(*(uma(pid, p) for pid, p in perguntas))
+
+def consolidar(execucoes, duracao_total_s, parametros):
+    por_no = {}
+    for execucao in execucoes:
+        for span in execucao["spans"]:
+            por_no.setdefault(span["no"], []).append(span["duracao_s"])
+    return {
+        "parametros": parametros,
+        "ponta_a_ponta": resumir([e["duracao_s"] for e in execucoes]),
+        "nos": {no: resumir(valores) for no, valores in sorted(por_no.items())},
+        "vazao_por_s": round(len(execucoes) / duracao_total_s, 3) if duracao_total_s else None,
+        "erros": sum(1 for e in execucoes if e["erro"]),
+    }
+
+def comparar(atual, baseline, tolerancia):
+    """Lista de regressões (texto). Latência: atual > base*(1+tol); vazão: atual < base*(1-tol)."""
+    regressoes = []
+    pares = [("ponta_a_ponta", atual["ponta_a_ponta"], baseline["ponta_a_ponta"])]
+    pares += [(no, atual["nos"][no], baseline["nos"][no]) for no in atual["nos"] if no in baseline["nos"]]
+    for nome, medido, base in pares:
+        for p in PERCENTIS:
+            chave = f"p{p}"
+            if medido[chave] > base[chave] * (1 + tolerancia) and medido[chave] - base[chave] > DIFERENCA_MINIMA_S:
+                regressoes.append(f"{nome} {chave}: {base[chave] * 1000:.1f}ms -> {medido[chave] * 1000:.1f}ms")
+    if baseline.get("vazao_por_s") and atual["vazao_por_s"] < baseline["vazao_por_s"] * (1 - tolerancia):
+        regressoes.append(f"vazão: {baseline['vazao_por_s']}/s -> {atual['vazao_por_s']}/s")
+    return regressoes
+
+def imprimir(resultado):
+    print(f"\n{'nó':<20} {'n':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    linhas = list(resultado["nos"].items()) + [("PONTA A PONTA", resultado["ponta_a_ponta"])]
+    for nome, r in linhas:
+        print(f"{nome:<20} {r['n']:>6} {r['p50'] * 1000:>10.1f} {r['p95'] * 1000:>10.1f} {r['p99'] * 1000:>10.1f}")
+    print(f"\nVazão: {resultado['vazao_por_s']} perguntas/s | erros: {resultado['erros']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do grafo (LLM falso + banco sintético).")
+    parser.add_argument("--banco", default=bench_dados.BANCO_PADRAO)
+    parser.add_argument("--nuops", type=int, default=20000, help="Tamanho do banco sintético")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--semear", action="store_true", help="Recria o banco sintético antes de medir")
+    parser.add_argument("--corpus", default=CORPUS_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--latencia-llm", type=float, default=0.05, help="Segundos por chamada do LLM falso")
+    parser.add_argument("--latencia-token", type=float, default=0.0, help="Segundos por token da resposta")
+    parser.add_argument("--cache", action="store_true", help="Mantém o cache de tradução entre perguntas")
+    parser.add_argument("--aquecimento", type=int, default=1, help="Passadas do corpus descartadas")
+    parser.add_argument("--salvar-baseline", help="Grava o resultado em JSON")
+    parser.add_argument("--baseline", help="Compara com um resultado gravado")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa aceita (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.semear:
+        manifesto = bench_dados.semear(args.nuops, args.banco, args.semente)
+        print(f"✅ Banco {args.banco} semeado com {args.nuops} NUOPs")
+    else:
+        manifesto = bench_dados.gerar_nuops(args.nuops, args.semente)[3]   # Mesmos dados do semear (determinístico)
+
+    # O pool é criado sob demanda a partir de DB_CONFIG: aponta para o banco do benchmark.
+    # O cache de tradução fica só em memória (não mexe no arquivo do usuário).
+    db_pool.DB_CONFIG["database"] = args.banco
+    os.environ["SQL_CACHE_ARQUIVO"] = ""
+    import agente_spb
+    from bench_modelo_falso import ModeloFalso
+    from metricas import medir_execucao
+    from resultado_paginado import fechar_resultado
+
+    modelo = ModeloFalso(latencia_s=args.latencia_llm, latencia_token_s=args.latencia_token)
+    agente_spb.llm = modelo
+
+    async def rodar():
+        for i in range(args.aquecimento):
+            perguntas, modelo.sql_por_pergunta = carregar_corpus(args.corpus, manifesto, i)
+            await executar_carga(agente_spb, agente_spb.cache_sql, fechar_resultado, medir_execucao,
+                                 perguntas, args.concorrencia, args.cache)
+        carga = []
+        for r in range(args.repeticoes):
+            perguntas, sql = carregar_corpus(args.corpus, manifesto, args.aquecimento + r)
+            carga += perguntas
+            modelo.sql_por_pergunta = {**modelo.sql_por_pergunta, **sql}
+        inicio = time.perf_counter()
+        execucoes = await executar_carga(agente_spb, agente_spb.cache_sql, fechar_resultado, medir_execucao,
+                                         carga, args.concorrencia, args.cache)
+        return execucoes, time.perf_counter() - inicio
+
+    print(f"🏁 {args.repeticoes} x corpus, concorrência {args.concorrencia}, LLM falso {args.latencia_llm}s/chamada")
+    execucoes, duracao = asyncio.run(rodar())
+    resultado = consolidar(execucoes, duracao, {
+        "nuops": args.nuops, "semente": args.semente, "repeticoes": args.repeticoes,
+        "concorrencia": args.concorrencia, "latencia_llm": args.latencia_llm,
+        "latencia_token": args.latencia_token, "cache": args.cache,
+    })
+    imprimir(resultado)
+    for e in execucoes:
+        if e["erro"]:
+            print(f"   ⚠️ {e['id']}: {str(e['erro'])[:120]}")
+
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"💾 Baseline salvo em {args.salvar_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("parametros") != resultado["parametros"]:
+            print("⚠️ Parâmetros diferentes do baseline: comparação só indicativa.")
+        regressoes = comparar(resultado, baseline, args.tolerancia)
+        if regressoes:
+            print(f"❌ Regressões acima de {args.tolerancia:.0%}:")
+            for r in regressoes:
+                print(f"   ➤ {r}")
+            return 1
+        print(f"✅ Sem regressões acima de {args.tolerancia:.0%} em relação ao baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
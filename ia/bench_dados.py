@@ -0,0 +1,173 @@
+"""
+Banco de benchmark: Postgres local com o formato de produção e dados sintéticos.
+
+Cria (num banco separado, por padrão 'jarvis_bench') os schemas pix/spi/spb/str,
+as tabelas de operação, o legado e a view spi.operacao, e gera N NUOPs com
+timelines realistas e msgop ISO 20022 (pacs.008/pacs.002). Cada NUOP pertence a
+um cenário (sucesso, timeout, cadastro, piloto, autorizador, bacen), e o manifesto
+devolvido diz quais NUOPs usar no corpus de replay.
+
+Determinístico pela semente: o mesmo --nuops/--semente gera sempre os mesmos dados.
+
+Uso:
+    python bench_dados.py --nuops 20000                  # Cria/recria jarvis_bench
+    python bench_dados.py --nuops 200000 --banco bench2   # Escala maior em outro banco
+"""
+import os
+import sys
+import json
+import random
+import argparse
+from datetime import datetime, timedelta
+
+import psycopg2
+from psycopg2 import sql as psql
+from psycopg2.extras import execute_values
+
+from db_pool import DB_CONFIG
+from indices_nuop import gerar_ddl
+
+BANCO_PADRAO = os.getenv("BENCH_DB_NAME", "jarvis_bench")
+INICIO = datetime(2025, 12, 1, 0, 0, 0)   # "Hoje" da homologação (JARVIS_DATA_HOJE)
+
+# cenário -> (peso, statusop, statusmsg da resposta, tag do motivo, texto do motivo)
+CENARIOS = {
+    "sucesso":     (50, 0,   302, None,       None),
+    "liquidado":   (10, 0,   108, None,       None),
+    "timeout":     (12, 205, 0,   "RsnDesc",  "Pagamento expirado por timeout"),
+    "cadastro":    (8,  205, 320, "AddtlInf", "Identificação do Agente inválida"),
+    "saldo":       (8,  205, 320, "AddtlInf", "Saldo Insuficiente na conta PI"),
+    "piloto":      (6,  205, 319, "Prtry",    "EGEN0001"),
+    "bacen":       (6,  205, 0,   "RsnDesc",  "Erro interno de processamento"),
+}
+
+DDL = """
+DROP SCHEMA IF EXISTS pix CASCADE;
+DROP SCHEMA IF EXISTS spi CASCADE;
+DROP SCHEMA IF EXISTS spb CASCADE;
+DROP SCHEMA IF EXISTS str CASCADE;
+DROP SCHEMA IF EXISTS forense CASCADE;
+CREATE SCHEMA pix; CREATE SCHEMA spi; CREATE SCHEMA spb; CREATE SCHEMA str;
+CREATE TABLE pix.operacao (msgid text, codmsg text, nuop text, statusop smallint, statusmsg smallint,
+                           sitlanc text, ts_inclusao timestamp, msgop text);
+CREATE TABLE spb.operacao (msgid text, codmsg text, nuop text, statusop smallint, statusmsg smallint,
+                           ts_inclusao timestamp, msgop text);
+CREATE TABLE str.operacao (LIKE spb.operacao);
+CREATE TABLE pix.legado (msgid text, ts_inclusao timestamp, ts_entrega timestamp, ts_consumo timestamp);
+CREATE VIEW spi.operacao AS SELECT * FROM pix.operacao;
+"""
+
+
+def payload_iso(codmsg, msgid, nuop, tag=None, texto=None):
+    """msgop no formato do SPI (envelope + AppHdr + Document), com motivo opcional."""
+    motivo = f"<StsRsnInf><Rsn><{tag}>{texto}</{tag}></Rsn></StsRsnInf>" if tag else ""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<Envelope xmlns="https://www.bcb.gov.br/pi/{codmsg}/1.10">'
+        '<AppHdr><Fr><FIId><FinInstnId><Othr><Id>99999004</Id></Othr></FinInstnId></FIId></Fr>'
+        f'<BizMsgIdr>{msgid}</BizMsgIdr><MsgDefIdr>{codmsg}.spi.1.10</MsgDefIdr></AppHdr>'
+        f'<Document><FIToFIPmtStsRpt><TxInfAndSts><OrgnlEndToEndId>{nuop}</OrgnlEndToEndId>'
+        f'<TxSts>{"ACSC" if not tag else "RJCT"}</TxSts>{motivo}</TxInfAndSts></FIToFIPmtStsRpt></Document>'
+        '</Envelope>'
+    )
+
+def gerar_nuops(quantidade, semente=42):
+    """Gera as linhas de todas as tabelas + manifesto {cenário: [nuops]}."""
+    rng = random.Random(semente)
+    nomes = list(CENARIOS)
+    pesos = [CENARIOS[n][0] for n in nomes]
+    pix, spb, legado = [], [], []
+    manifesto = {nome: [] for nome in nomes}
+    passo = timedelta(days=30) / max(1, quantidade)
+
+    for i in range(quantidade):
+        cenario = rng.choices(nomes, pesos)[0]
+        _, statusop, statusmsg, tag, texto = CENARIOS[cenario]
+        ts = INICIO - timedelta(days=30) + passo * i + timedelta(seconds=rng.random())
+        no_pix = rng.random() < 0.8   # 80% PIX, 20% STR/SPB
+        if no_pix:
+            nuop = f"E99999004{ts:%Y%m%d%H%M}{i:010d}"[:32]
+            ida = (f"M{i:012d}A", "pacs.008", nuop, statusop, 0, "N/A", ts,
+                   payload_iso("pacs.008", f"M{i:012d}A", nuop))
+            volta_ts = ts + timedelta(seconds=rng.uniform(0.2, 3))
+            volta = (f"M{i:012d}B", "pacs.002", nuop, statusop, statusmsg, "N/A", volta_ts,
+                     payload_iso("pacs.002", f"M{i:012d}B", nuop, tag, texto))
+            pix += [ida, volta]
+            # Legado: entrega/consumo da resposta; ~5% com consumo lento (>10s)
+            lento = rng.random() < 0.05
+            consumo = volta_ts + timedelta(seconds=rng.uniform(10.5, 30) if lento else rng.uniform(0.05, 2))
+            legado.append((f"M{i:012d}B", volta_ts, volta_ts, consumo))
+        else:
+            nuop = f"S{ts:%Y%m%d}{i:015d}"[:24]
+            spb += [
+                (f"S{i:012d}A", "STR0008", nuop, statusop, 0, ts, payload_iso("pacs.008", f"S{i:012d}A", nuop)),
+                (f"S{i:012d}B", "STR0008R2", nuop, statusop, statusmsg, ts + timedelta(seconds=1),
+                 payload_iso("pacs.002", f"S{i:012d}B", nuop, tag, texto)),
+            ]
+        manifesto[cenario].append(nuop)
+    return pix, spb, legado, manifesto
+
+def _conectar(banco):
+    config = dict(DB_CONFIG, database=banco)
+    return psycopg2.connect(**config)
+
+def criar_banco(banco):
+    """CREATE DATABASE se ainda não existir (conectando no banco de manutenção 'postgres')."""
+    conn = psycopg2.connect(**dict(DB_CONFIG, database="postgres"))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_database WHERE datname = %s", (banco,))
+            if not cur.fetchone():
+                cur.execute(psql.SQL("CREATE DATABASE {}").format(psql.Identifier(banco)))
+    finally:
+        conn.close()
+
+def semear(quantidade, banco=BANCO_PADRAO, semente=42, indices=True):
+    """Recria o banco de benchmark do zero e devolve o manifesto de NUOPs por cenário."""
+    if banco == DB_CONFIG["database"]:
+        raise ValueError(f"Recusado: '{banco}' é o banco configurado do agente (DB_NAME). Use um banco só de benchmark.")
+    criar_banco(banco)
+    pix, spb, legado, manifesto = gerar_nuops(quantidade, semente)
+    conn = _conectar(banco)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(DDL)
+            execute_values(cur, "INSERT INTO pix.operacao VALUES %s", pix, page_size=5000)
+            execute_values(cur, "INSERT INTO spb.operacao VALUES %s", spb, page_size=5000)
+            cur.execute("INSERT INTO str.operacao SELECT * FROM spb.operacao")
+            execute_values(cur, "INSERT INTO pix.legado VALUES %s", legado, page_size=5000)
+        conn.commit()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            if indices:
+                # Os mesmos índices da migração de produção (indices_nuop.py)
+                for comando in gerar_ddl():
+                    try:
+                        cur.execute(comando)
+                    except psycopg2.Error:
+                        pass   # spi.operacao é view aqui: não leva índice
+            cur.execute("ANALYZE")
+    finally:
+        conn.close()
+    return manifesto
+
+def main():
+    parser = argparse.ArgumentParser(description="Cria o banco sintético do benchmark do agente.")
+    parser.add_argument("--nuops", type=int, default=20000)
+    parser.add_argument("--banco", default=BANCO_PADRAO)
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--sem-indices", action="store_true", help="Simula produção sem os índices de NUOP")
+    parser.add_argument("--manifesto", help="Grava {cenário: [nuops]} em JSON")
+    args = parser.parse_args()
+
+    manifesto = semear(args.nuops, args.banco, args.semente, not args.sem_indices)
+    print(f"✅ {args.banco}: {args.nuops} NUOPs " +
+          ", ".join(f"{c}={len(n)}" for c, n in manifesto.items()))
+    if args.manifesto:
+        with open(args.manifesto, "w", encoding="utf-8") as f:
+            json.dump(manifesto, f)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Micro-benchmark: extrator de motivo original (linha a linha) x extrator_xml (rápido/lote).
+
+Corpus (em ordem de preferência):
+    python bench_extrator_xml.py --corpus pasta_com_xmls/      # Um payload ISO 20022 por arquivo .xml
+    python bench_extrator_xml.py --corpus payloads.txt         # Um payload por linha
+    python bench_extrator_xml.py --db 5000                     # msgop reais de pix/spb.operacao
+    python bench_extrator_xml.py                               # Corpus sintético (pacs.002/pacs.008)
+
+Também confere se os dois extratores devolvem exatamente o mesmo motivo.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+import pandas as pd
+from lxml import etree
+
+import extrator_xml
+
+
+def extrair_motivo_legado(xml_text):
+    """Cópia fiel do extrair_motivo_xml_parser anterior (referência do benchmark)."""
+    if not xml_text or not isinstance(xml_text, str):
+        return ""
+    try:
+        parser = etree.XMLParser(recover=True)
+        root = etree.fromstring(xml_text.encode('utf-8'), parser=parser)
+        for elem in root.iter():
+            if not hasattr(elem.tag, 'find'): continue
+            i = elem.tag.find('}')
+            if i >= 0:
+                elem.tag = elem.tag[i+1:]
+        for tag in ['RsnDesc', 'AddtlInf', 'StsRsnInf', 'RjctnRsn', 'Prtry', 'Ustrd']:
+            found = root.find(f".//{tag}")
+            if found is not None and found.text and found.text.strip():
+                return found.text.strip()
+    except Exception:
+        pass
+    return ""
+
+# --- Corpus ---
+
+MOTIVOS = [
+    ("RsnDesc", "Pagamento expirado por timeout"),
+    ("AddtlInf", "Saldo Insuficiente na conta PI"),
+    ("AddtlInf", "Identificação do Agente inválida"),
+    ("Prtry", "AB03"),
+    ("Ustrd", "Conta Inexistente"),
+    (None, None),
+]
+
+def _payload_sintetico(rng, i):
+    tag, texto = rng.choice(MOTIVOS)
+    motivo = f"<StsRsnInf><Rsn><{tag}>{texto}</{tag}></Rsn></StsRsnInf>" if tag else ""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<Envelope xmlns="https://www.bcb.gov.br/pi/pacs.002/1.10">'
+        '<AppHdr><Fr><FIId><FinInstnId><Othr><Id>99999004</Id></Othr></FinInstnId></FIId></Fr>'
+        f'<BizMsgIdr>M9999900420251201{i:012d}</BizMsgIdr><MsgDefIdr>pacs.002.spi.1.10</MsgDefIdr>'
+        '<CreDt>2025-12-01T10:00:00.000Z</CreDt></AppHdr>'
+        '<Document><FIToFIPmtStsRpt><GrpHdr><MsgId>M99999004</MsgId><CreDtTm>2025-12-01T10:00:00.000Z</CreDtTm></GrpHdr>'
+        f'<OrgnlGrpInfAndSts><OrgnlMsgId>E{i:031d}</OrgnlMsgId><OrgnlMsgNmId>pacs.008.spi.1.10</OrgnlMsgNmId></OrgnlGrpInfAndSts>'
+        f'<TxInfAndSts><OrgnlEndToEndId>E{i:031d}</OrgnlEndToEndId><TxSts>RJCT</TxSts>{motivo}'
+        '</TxInfAndSts></FIToFIPmtStsRpt></Document></Envelope>'
+    )
+
+def corpus_sintetico(tamanho, duplicacao, seed=42):
+    """`duplicacao` = fração de linhas que repetem um msgop já visto (legado x operação)."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(tamanho):
+        if corpus and rng.random() < duplicacao:
+            corpus.append(rng.choice(corpus))
+        else:
+            corpus.append(_payload_sintetico(rng, i))
+    return corpus
+
+def corpus_de_arquivos(caminho):
+    if os.path.isdir(caminho):
+        corpus = []
+        for nome in sorted(os.listdir(caminho)):
+            if nome.endswith(".xml"):
+                with open(os.path.join(caminho, nome), encoding="utf-8") as f:
+                    corpus.append(f.read())
+        return corpus
+    with open(caminho, encoding="utf-8") as f:
+        return [linha.rstrip("\n") for linha in f if linha.strip()]
+
+def corpus_do_banco(limite):
+    from db_pool import conexao_db
+    query = """
+        (SELECT msgop FROM pix.operacao ORDER BY ts_inclusao DESC LIMIT %(limite)s)
+        UNION ALL
+        (SELECT msgop FROM spb.operacao ORDER BY ts_inclusao DESC LIMIT %(limite)s)
+    """
+    with conexao_db() as conn:
+        df = pd.read_sql(query, conn, params={"limite": limite})
+    return df['msgop'].tolist()
+
+# --- Medição ---
+
+def medir(nome, funcao, repeticoes):
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        extrator_xml.limpar_memo()  # Cada repetição começa "fria"
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return nome, statistics.median(tempos), resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do extrator de motivo XML.")
+    parser.add_argument("--corpus", help="Pasta com .xml ou arquivo com um payload por linha")
+    parser.add_argument("--db", type=int, help="Lê N msgop recentes de cada tabela de operação")
+    parser.add_argument("--tamanho", type=int, default=20000, help="Tamanho do corpus sintético")
+    parser.add_argument("--duplicacao", type=float, default=0.5, help="Fração de msgop repetidos no sintético")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus, origem = corpus_de_arquivos(args.corpus), args.corpus
+    elif args.db:
+        corpus, origem = corpus_do_banco(args.db), "banco"
+    else:
+        corpus, origem = corpus_sintetico(args.tamanho, args.duplicacao), "sintético"
+    serie = pd.Series(corpus)
+    print(f"📦 Corpus {origem}: {len(corpus)} mensagens ({serie.nunique()} distintas)")
+
+    medicoes = [
+        medir("original (apply linha a linha)", lambda: serie.apply(lambda x: extrair_motivo_legado(str(x))), args.repeticoes),
+        medir("rápido (apply linha a linha)", lambda: serie.apply(lambda x: extrator_xml.extrair_motivo(str(x))), args.repeticoes),
+        medir("rápido (lote + memo)", lambda: extrator_xml.extrair_motivos_coluna(serie), args.repeticoes),
+    ]
+
+    referencia = medicoes[0][2]
+    base = medicoes[0][1]
+    print(f"\n{'extrator':<34}{'total (s)':>12}{'µs/msg':>10}{'speedup':>10}  resultado")
+    for nome, tempo, resultado in medicoes:
+        iguais = "OK" if resultado.tolist() == referencia.tolist() else "DIVERGENTE"
+        print(f"{nome:<34}{tempo:>12.4f}{tempo / len(corpus) * 1e6:>10.1f}{base / tempo:>9.1f}x  {iguais}")
+
+    return 0 if all(r.tolist() == referencia.tolist() for _, _, r in medicoes) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Chat model determinístico para o benchmark (substitui o Ollama sem mudar o grafo).
+
+- Prompt de SQL (TEMPLATE_SQL): devolve o SQL cadastrado para a PERGUNTA ATUAL
+  (corpus de replay) ou um SQL padrão;
+- Prompt do Perito Forense: devolve um parecer em Markdown com o veredito que a
+  hierarquia do prompt daria para a tabela recebida;
+- Latência configurável: fixa por chamada + por token da resposta (o streaming
+  entrega caractere a caractere no ritmo do token), sem sorteio nenhum.
+
+Uso:
+    import agente_spb
+    from bench_modelo_falso import ModeloFalso
+    agente_spb.llm = ModeloFalso(sql_por_pergunta={...}, latencia_s=0.05)
+"""
+import re
+import time
+import asyncio
+from typing import Any, Dict, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+SQL_PADRAO = "SELECT * FROM view_universal ORDER BY ts_inclusao DESC LIMIT 10"
+
+_RE_PERGUNTA = re.compile(r"PERGUNTA ATUAL:\s*(.*?)\s*\n")
+_RE_SUCESSO = re.compile(r"\|\s*(302|108)\s*\|")
+_RE_NEGOCIO = re.compile(r"\|\s*(319|320)\s*\|")
+_RE_BACEN = re.compile(r"\|\s*205\s*\|")
+
+
+def _tokens(texto):
+    return len(texto or "") // 4 + 1
+
+def parecer_canonico(prompt):
+    """Veredito pela mesma hierarquia do prompt do perito (sucesso > timeout > cadastro > 205 > negócio)."""
+    texto = prompt.lower()
+    if _RE_SUCESSO.search(prompt):
+        resumo, veredito = "Operação liquidada com sucesso.", "SUCESSO"
+    elif "pagamento expirado por timeout" in texto:
+        resumo, veredito = "Falha por timeout no Bacen.", "TIMEOUT / FALHA TÉCNICA"
+    elif any(p in texto for p in ("identificação", "agente", "participante", "conta inexistente", "saldo")):
+        resumo, veredito = "Rejeição por dado cadastral/saldo.", "ERRO OPERACIONAL / CADASTRO"
+    elif _RE_BACEN.search(prompt):
+        resumo, veredito = "Erro 205 sem mensagem de timeout.", "ERRO DE PROCESSAMENTO NO BACEN"
+    elif _RE_NEGOCIO.search(prompt):
+        resumo, veredito = "Rejeitada pelo piloto/autorizador.", "REJEIÇÃO DE NEGÓCIO"
+    else:
+        resumo, veredito = "Sem evidência conclusiva.", "INDEFINIDO"
+    return (
+        f"**Resumo do Caso:** {resumo}\n"
+        f"**Análise Técnica:** Parecer sintético do benchmark.\n"
+        f"**Veredito Final:** {veredito}"
+    )
+
+
+class ModeloFalso(BaseChatModel):
+    """Respostas canônicas por tipo de prompt, com latência previsível."""
+
+    sql_por_pergunta: Dict[str, str] = {}   # Pergunta do corpus -> SQL devolvido
+    sql_padrao: str = SQL_PADRAO
+    latencia_s: float = 0.0          # Por chamada (tempo até o primeiro token)
+    latencia_token_s: float = 0.0    # Por token da resposta
+    chamadas: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "jarvis-bench-falso"
+
+    def _responder(self, messages):
+        prompt = "\n".join(str(m.content) for m in messages)
+        self.chamadas += 1
+        if "RESPOSTA (APENAS O SQL)" in prompt:
+            match = _RE_PERGUNTA.search(prompt)
+            pergunta = match.group(1) if match else ""
+            for chave, sql in self.sql_por_pergunta.items():
+                # A pergunta pode chegar com o NUOP do contexto anexado (sessoes.resolver_referencia)
+                if pergunta.startswith(chave):
+                    return prompt, sql
+            return prompt, self.sql_padrao
+        if "Perito Forense" in prompt:
+            return prompt, parecer_canonico(prompt)
+        return prompt, "OK"
+
+    def _mensagem(self, prompt, resposta):
+        return AIMessage(content=resposta, usage_metadata={
+            "input_tokens": _tokens(prompt), "output_tokens": _tokens(resposta),
+            "total_tokens": _tokens(prompt) + _tokens(resposta),
+        })
+
+    def _pausa_total(self, resposta):
+        return self.latencia_s + self.latencia_token_s * _tokens(resposta)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt, resposta = self._responder(messages)
+        time.sleep(self._pausa_total(resposta))
+        return ChatResult(generations=[ChatGeneration(message=self._mensagem(prompt, resposta))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        prompt, resposta = self._responder(messages)
+        await asyncio.sleep(self._pausa_total(resposta))
+        return ChatResult(generations=[ChatGeneration(message=self._mensagem(prompt, resposta))])
+
+    def _pedacos(self, resposta):
+        """Blocos de ~4 caracteres (um 'token') para o streaming."""
+        return [resposta[i:i + 4] for i in range(0, len(resposta), 4)]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        prompt, resposta = self._responder(messages)
+        time.sleep(self.latencia_s)
+        for pedaco in self._pedacos(resposta):
+            time.sleep(self.latencia_token_s)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=pedaco))
+            if run_manager:
+                run_manager.on_llm_new_token(pedaco, chunk=chunk)
+            yield chunk
+        yield self._chunk_uso(prompt, resposta)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any):
+        prompt, resposta = self._responder(messages)
+        await asyncio.sleep(self.latencia_s)
+        for pedaco in self._pedacos(resposta):
+            await asyncio.sleep(self.latencia_token_s)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=pedaco))
+            if run_manager:
+                await run_manager.on_llm_new_token(pedaco, chunk=chunk)
+            yield chunk
+        yield self._chunk_uso(prompt, resposta)
+
+    def _chunk_uso(self, prompt, resposta):
+        return ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata={
+            "input_tokens": _tokens(prompt), "output_tokens": _tokens(resposta),
+            "total_tokens": _tokens(prompt) + _tokens(resposta),
+        }))
+
+    @property
+    def _identifying_params(self) -> Dict[str, Optional[float]]:
+        return {"latencia_s": self.latencia_s, "latencia_token_s": self.latencia_token_s}
@@ -0,0 +1,140 @@
+"""
+Cache da tradução Text-to-SQL (node_gerar_sql).
+
+- Chave: pergunta normalizada + contexto de histórico (só quando a pergunta depende dele).
+- Despejo LRU + TTL; persistência opcional em JSON entre reinícios.
+- Versionado pela impressão digital do prompt/schema: mudou o template, o cache zera.
+- Só recebe SQL que executou com sucesso (quem grava é o node_executar_sql).
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+CACHE_TAMANHO = int(os.getenv("SQL_CACHE_TAMANHO", "256"))
+CACHE_TTL_S = float(os.getenv("SQL_CACHE_TTL_S", "3600"))
+CACHE_ARQUIVO = os.getenv("SQL_CACHE_ARQUIVO", "")   # Vazio = só memória
+
+# Mesmas pistas de referência do prompt ("CASO 2: CONTEXTO")
+PALAVRAS_CONTEXTO = ["esse", "essa", "desse", "dessa", "nesse", "nessa", "o codigo", "aquele id", "ela", "ele"]
+
+
+def normalizar_pergunta(pergunta):
+    """Minúsculas, sem acento, sem pontuação, espaços colapsados."""
+    texto = unicodedata.normalize("NFKD", pergunta or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c)).lower()
+    texto = re.sub(r"[^\w\s]", " ", texto)
+    return re.sub(r"\s+", " ", texto).strip()
+
+def usa_contexto(pergunta_normalizada):
+    palavras = f" {pergunta_normalizada} "
+    return any(f" {p} " in palavras for p in PALAVRAS_CONTEXTO)
+
+def impressao_digital(*textos):
+    """Hash do prompt + schema: qualquer mudança invalida o cache inteiro."""
+    h = hashlib.sha256()
+    for texto in textos:
+        h.update((texto or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:16]
+
+
+class CacheTraducaoSQL:
+    def __init__(self, versao, capacidade=CACHE_TAMANHO, ttl_s=CACHE_TTL_S, arquivo=CACHE_ARQUIVO):
+        self.versao = versao
+        self.capacidade = max(1, capacidade)
+        self.ttl_s = ttl_s
+        self.arquivo = arquivo
+        self._itens = OrderedDict()   # chave -> (sql, gravado_em)
+        self._lock = threading.Lock()
+        self._lock_io = threading.Lock()
+        self.acertos = 0
+        self.faltas = 0
+        self._carregar()
+
+    def chave(self, pergunta, historico=""):
+        """
+        Pergunta normalizada + '|ctx:<NUOP>' quando ela referencia o histórico ("esse", "dessa"...).
+        Assim "o que houve com essa?" não devolve o SQL de outro NUOP.
+        """
+        normalizada = normalizar_pergunta(pergunta)
+        if not usa_contexto(normalizada):
+            return f"{normalizada}|ctx:-"
+        nuops = re.findall(r'\b[a-zA-Z0-9]{20,35}\b', historico or "")
+        return f"{normalizada}|ctx:{nuops[-1] if nuops else '?'}"
+
+    def obter(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.faltas += 1
+                return None
+            sql, gravado_em = item
+            if time.time() - gravado_em > self.ttl_s:
+                del self._itens[chave]
+                self.faltas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return sql
+
+    def gravar(self, chave, sql):
+        with self._lock:
+            self._itens[chave] = (sql, time.time())
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.capacidade:
+                self._itens.popitem(last=False)
+        self._salvar()
+
+    def remover(self, chave):
+        with self._lock:
+            removido = self._itens.pop(chave, None) is not None
+        if removido:
+            self._salvar()
+
+    def invalidar(self):
+        with self._lock:
+            self._itens.clear()
+        self._salvar()
+
+    def estatisticas(self):
+        with self._lock:
+            return {"itens": len(self._itens), "acertos": self.acertos, "faltas": self.faltas, "versao": self.versao}
+
+    # --- Persistência (JSON) ---
+
+    def _carregar(self):
+        if not self.arquivo or not os.path.exists(self.arquivo):
+            return
+        try:
+            with open(self.arquivo, encoding="utf-8") as f:
+                dados = json.load(f)
+        except Exception:
+            return
+        if dados.get("versao") != self.versao:
+            return  # Prompt/schema mudou desde a gravação: descarta tudo
+        agora = time.time()
+        for chave, sql, gravado_em in dados.get("itens", [])[-self.capacidade:]:
+            if agora - gravado_em <= self.ttl_s:
+                self._itens[chave] = (sql, gravado_em)
+
+    def _salvar(self):
+        if not self.arquivo:
+            return
+        with self._lock:
+            dados = {
+                "versao": self.versao,
+                "itens": [[chave, sql, ts] for chave, (sql, ts) in self._itens.items()],
+            }
+        temporario = f"{self.arquivo}.tmp"
+        with self._lock_io:
+            try:
+                with open(temporario, "w", encoding="utf-8") as f:
+                    json.dump(dados, f, ensure_ascii=False)
+                os.replace(temporario, self.arquivo)
+            except OSError:
+                pass
@@ -0,0 +1,248 @@
+import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+
+# --- 0. CONFIGURAÇÃO ---
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": os.getenv("DB_PORT", "5432"),
+    "database": os.getenv("DB_NAME", "spb_database"),
+    "user": os.getenv("DB_USER", "postgres"),
+    "password": os.getenv("DB_PASSWORD", "postgres")
+}
+
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+POOL_TIMEOUT_ESPERA = float(os.getenv("DB_POOL_TIMEOUT", "30"))        # Segundos esperando conexão livre
+POOL_PING_OCIOSA = float(os.getenv("DB_POOL_PING_OCIOSA", "30"))       # Faz SELECT 1 se ficou ociosa mais que isso
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão liberada dentro do tempo de espera configurado."""
+
+
+class PoolConexoes:
+    """
+    Pool de conexões reutilizáveis (thread-safe).
+    Cada conexão nasce configurada (read-only + statement_timeout) e é
+    devolvida limpa (rollback) para a próxima pergunta.
+    """
+
+    def __init__(self, config, minimo=POOL_MIN, maximo=POOL_MAX, somente_leitura=True,
+                 statement_timeout_ms=STATEMENT_TIMEOUT_MS, timeout_espera=POOL_TIMEOUT_ESPERA):
+        self.config = dict(config)
+        self.minimo = max(0, minimo)
+        self.maximo = max(1, maximo, self.minimo)
+        self.somente_leitura = somente_leitura
+        self.statement_timeout_ms = statement_timeout_ms
+        self.timeout_espera = timeout_espera
+
+        self._cond = threading.Condition()
+        self._ociosas = []          # Pilha (LIFO): reaproveita a conexão mais "quente"
+        self._ultimo_uso = {}       # id(conn) -> instante da devolução
+        self._total = 0             # Conexões abertas (ociosas + em uso)
+        self._aguardando = 0        # Threads paradas esperando conexão agora (sinal de saturação)
+        self._fechado = False
+        self._metricas = {
+            "criadas": 0, "reutilizadas": 0, "esperas": 0, "tempo_espera_s": 0.0,
+            "timeouts": 0, "descartadas": 0, "falhas_healthcheck": 0,
+        }
+
+        # Aquece o mínimo configurado (erros sobem para quem pediu o pool)
+        for _ in range(self.minimo):
+            conn = self._criar()
+            with self._cond:
+                self._total += 1
+                self._ociosas.append(conn)
+                self._ultimo_uso[id(conn)] = time.monotonic()
+
+    # --- Ciclo de vida da conexão ---
+
+    def _criar(self):
+        conn = psycopg2.connect(**self.config)
+        try:
+            conn.set_session(readonly=self.somente_leitura, autocommit=False)
+            with conn.cursor() as cur:
+                cur.execute("SET statement_timeout = %s", (self.statement_timeout_ms,))
+            conn.commit()  # SET dentro de transação só "pega" após o commit
+        except Exception:
+            conn.close()
+            raise
+        with self._cond:
+            self._metricas["criadas"] += 1
+        return conn
+
+    def _saudavel(self, conn):
+        """Health check: descarta conexões mortas e pinga as que ficaram ociosas muito tempo."""
+        if conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        ocioso = time.monotonic() - self._ultimo_uso.get(id(conn), 0)
+        if ocioso < POOL_PING_OCIOSA:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _descartar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._ultimo_uso.pop(id(conn), None)
+            self._total -= 1
+            self._metricas["descartadas"] += 1
+            self._cond.notify()
+
+    # --- API pública ---
+
+    def obter(self, timeout=None):
+        timeout = self.timeout_espera if timeout is None else timeout
+        limite = time.monotonic() + timeout
+        esperou = False
+
+        while True:
+            with self._cond:
+                if self._fechado:
+                    raise PoolEsgotado("Pool de conexões encerrado.")
+                while not self._ociosas and self._total >= self.maximo:
+                    if not esperou:
+                        esperou = True
+                        self._metricas["esperas"] += 1
+                    inicio = time.monotonic()
+                    restante = limite - inicio
+                    if restante <= 0:
+                        self._metricas["timeouts"] += 1
+                        raise PoolEsgotado(
+                            f"Nenhuma conexão livre em {timeout:.0f}s (máximo={self.maximo})."
+                        )
+                    self._aguardando += 1
+                    try:
+                        self._cond.wait(restante)
+                    finally:
+                        self._aguardando -= 1
+                    self._metricas["tempo_espera_s"] += time.monotonic() - inicio
+
+                if self._ociosas:
+                    conn = self._ociosas.pop()
+                    nova = False
+                else:
+                    self._total += 1  # Reserva a vaga antes de conectar (fora do lock)
+                    nova = True
+
+            if nova:
+                try:
+                    return self._criar()
+                except Exception:
+                    with self._cond:
+                        self._total -= 1
+                        self._cond.notify()
+                    raise
+
+            if self._saudavel(conn):
+                with self._cond:
+                    self._metricas["reutilizadas"] += 1
+                return conn
+
+            with self._cond:
+                self._metricas["falhas_healthcheck"] += 1
+            self._descartar(conn)
+
+    def devolver(self, conn):
+        if conn.closed or self._fechado:
+            self._descartar(conn)
+            return
+        try:
+            # Encerra a transação read-only aberta pelo pd.read_sql / cursor
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except Exception:
+            self._descartar(conn)
+            return
+        with self._cond:
+            self._ultimo_uso[id(conn)] = time.monotonic()
+            self._ociosas.append(conn)
+            self._cond.notify()
+
+    def metricas(self):
+        with self._cond:
+            dados = dict(self._metricas)
+            dados.update({
+                "abertas": self._total,
+                "ociosas": len(self._ociosas),
+                "em_uso": self._total - len(self._ociosas),
+                "aguardando": self._aguardando,
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+            })
+        return dados
+
+    def fechar(self):
+        with self._cond:
+            self._fechado = True
+            ociosas, self._ociosas = self._ociosas, []
+            self._cond.notify_all()
+        for conn in ociosas:
+            self._descartar(conn)
+
+
+# --- 1. POOLS DO PROCESSO (SINGLETON) ---
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def obter_pool(config=None, somente_leitura=True):
+    """
+    Retorna o pool compartilhado do processo (um para leitura, outro para escrita).
+    Criado no primeiro uso; se o banco estiver fora, o erro sobe e a próxima chamada tenta de novo.
+    """
+    with _pools_lock:
+        pool = _pools.get(somente_leitura)
+        if pool is None:
+            pool = PoolConexoes(config or DB_CONFIG, somente_leitura=somente_leitura)
+            _pools[somente_leitura] = pool
+        return pool
+
+@contextmanager
+def conexao_db(somente_leitura=True):
+    """Empresta uma conexão do pool: `with conexao_db() as conn: ...`"""
+    pool = obter_pool(somente_leitura=somente_leitura)
+    conn = pool.obter()
+    try:
+        yield conn
+    finally:
+        pool.devolver(conn)
+
+def verificar_conexao():
+    """Prontidão do banco: SELECT 1 por uma conexão do pool (cria o pool se preciso). Retorna ms; erro sobe."""
+    inicio = time.perf_counter()
+    with conexao_db() as conn, conn.cursor() as cur:
+        cur.execute("SELECT 1")
+        cur.fetchone()
+    return (time.perf_counter() - inicio) * 1000
+
+def metricas_pool():
+    with _pools_lock:
+        pools = dict(_pools)
+    return {("leitura" if leitura else "escrita"): pool.metricas() for leitura, pool in pools.items()}
+
+@atexit.register
+def fechar_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.fechar()
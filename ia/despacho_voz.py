@@ -0,0 +1,232 @@
+"""
+Despacho de voz e alertas: um worker só, fila limitada com prioridade.
+
+Antes cada fala abria uma thread e um pyttsx3.init() novos; numa rajada do monitor
+as falas se sobrepunham e as threads se acumulavam. Aqui:
+- Uma thread de longa duração, com um backend (motor de voz) criado uma única vez;
+- Fila com prioridade (alerta > resposta > informativo) e tamanho máximo: cheia,
+  sai a mensagem menos importante (a nova, se for ela);
+- Repetições coalescidas: a mesma chave na fila vira uma fala só ("3 vezes") e a
+  mesma chave já falada dentro da janela não é repetida;
+- Limite de ritmo (intervalo mínimo entre falas) e descarte de mensagens não
+  urgentes que envelheceram na fila;
+- Backend plugável: voz (pyttsx3), log (só imprime), webhook (POST JSON) ou nenhum.
+
+Quem chama nunca bloqueia: falar() só enfileira.
+
+Uso:
+    from despacho_voz import despachante_padrao, PRIORIDADE_ALERTA
+    despachante_padrao().falar("Taxa de timeout acima do limite.", PRIORIDADE_ALERTA, chave="timeout")
+    VOZ_BACKEND=log python Jarvis_ui.py      # Sem áudio (servidor, SSH)
+"""
+import os
+import json
+import time
+import heapq
+import threading
+import urllib.request
+
+PRIORIDADE_ALERTA = 0
+PRIORIDADE_RESPOSTA = 1
+PRIORIDADE_INFO = 2
+
+VOZ_BACKEND = os.getenv("VOZ_BACKEND", "voz")                        # voz | log | webhook | nenhum
+VOZ_FILA_MAXIMA = int(os.getenv("VOZ_FILA_MAXIMA", "8"))
+VOZ_JANELA_S = float(os.getenv("VOZ_JANELA_S", "30"))                # Mesma chave não repete dentro disso
+VOZ_INTERVALO_S = float(os.getenv("VOZ_INTERVALO_S", "1.0"))         # Pausa mínima entre falas
+VOZ_VALIDADE_S = float(os.getenv("VOZ_VALIDADE_S", "15"))            # Não urgente mais velha que isso é descartada
+VOZ_WEBHOOK_URL = os.getenv("VOZ_WEBHOOK_URL", "")
+VOZ_VELOCIDADE = int(os.getenv("VOZ_VELOCIDADE", "190"))
+
+
+# --- Backends ---
+
+class BackendVoz:
+    """pyttsx3: o motor é criado na thread do worker (e só nela é usado)."""
+
+    def __init__(self, velocidade=VOZ_VELOCIDADE):
+        self.velocidade = velocidade
+        self._motor = None
+
+    def falar(self, texto, prioridade):
+        if self._motor is None:
+            import pyttsx3
+            self._motor = pyttsx3.init()
+            self._motor.setProperty('rate', self.velocidade)
+            self._motor.setProperty('volume', 1.0)
+        self._motor.say(texto)
+        self._motor.runAndWait()
+
+    def fechar(self):
+        if self._motor is not None:
+            self._motor.stop()
+
+
+class BackendLog:
+    def falar(self, texto, prioridade):
+        print(f"🔊 [{prioridade}] {texto}")
+
+    def fechar(self):
+        pass
+
+
+class BackendWebhook:
+    """Encaminha a fala como JSON (ex.: chat do plantão). Sem URL configurada, não faz nada."""
+
+    def __init__(self, url=VOZ_WEBHOOK_URL, timeout_s=2.0):
+        self.url = url
+        self.timeout_s = timeout_s
+
+    def falar(self, texto, prioridade):
+        if not self.url:
+            return
+        corpo = json.dumps({"texto": texto, "prioridade": prioridade}).encode()
+        requisicao = urllib.request.Request(self.url, data=corpo, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(requisicao, timeout=self.timeout_s).close()
+
+    def fechar(self):
+        pass
+
+
+class BackendNenhum:
+    def falar(self, texto, prioridade):
+        pass
+
+    def fechar(self):
+        pass
+
+
+BACKENDS = {"voz": BackendVoz, "log": BackendLog, "webhook": BackendWebhook, "nenhum": BackendNenhum}
+
+
+# --- Despachante ---
+
+class DespachanteVoz:
+    """Fila com prioridade + um worker. falar() é thread-safe e não bloqueia."""
+
+    def __init__(self, backend=None, fila_maxima=VOZ_FILA_MAXIMA, janela_s=VOZ_JANELA_S,
+                 intervalo_s=VOZ_INTERVALO_S, validade_s=VOZ_VALIDADE_S):
+        self.backend = backend or BACKENDS.get(VOZ_BACKEND, BackendLog)()
+        self.fila_maxima = max(1, fila_maxima)
+        self.janela_s = janela_s
+        self.intervalo_s = intervalo_s
+        self.validade_s = validade_s
+
+        self._cond = threading.Condition()
+        self._fila = []               # heap de [prioridade, seq, chave]
+        self._pendentes = {}          # chave -> {"texto", "prioridade", "vezes", "criada"}
+        self._faladas_em = {}         # chave -> instante da última fala
+        self._seq = 0
+        self._fechado = False
+        self._metricas = {"faladas": 0, "coalescidas": 0, "repetidas": 0, "descartadas": 0,
+                          "expiradas": 0, "erros": 0}
+        self._thread = threading.Thread(target=self._trabalhar, name="despacho-voz", daemon=True)
+        self._thread.start()
+
+    def falar(self, texto, prioridade=PRIORIDADE_INFO, chave=None):
+        """Enfileira; retorna False se a mensagem foi coalescida, suprimida ou descartada."""
+        if not texto:
+            return False
+        chave = chave or texto
+        agora = time.monotonic()
+        with self._cond:
+            if self._fechado:
+                return False
+            pendente = self._pendentes.get(chave)
+            if pendente:
+                # Já está na fila: vira uma fala só, com a contagem e a prioridade mais alta
+                pendente["vezes"] += 1
+                pendente["texto"] = texto
+                if prioridade < pendente["prioridade"]:
+                    pendente["prioridade"] = prioridade
+                    self._empilhar(chave, prioridade)
+                self._metricas["coalescidas"] += 1
+                return False
+            if agora - self._faladas_em.get(chave, -self.janela_s) < self.janela_s:
+                self._metricas["repetidas"] += 1
+                return False
+            if len(self._pendentes) >= self.fila_maxima and not self._abrir_vaga(prioridade):
+                self._metricas["descartadas"] += 1
+                return False
+            self._pendentes[chave] = {"texto": texto, "prioridade": prioridade, "vezes": 1, "criada": agora}
+            self._empilhar(chave, prioridade)
+            self._cond.notify()
+            return True
+
+    def _empilhar(self, chave, prioridade):
+        self._seq += 1
+        heapq.heappush(self._fila, [prioridade, self._seq, chave])
+
+    def _abrir_vaga(self, prioridade):
+        """Fila cheia: descarta a pendente menos importante (a mais nova entre as piores), se for pior que a nova."""
+        chave, pior = max(self._pendentes.items(), key=lambda item: (item[1]["prioridade"], item[1]["criada"]))
+        if pior["prioridade"] <= prioridade:
+            return False
+        del self._pendentes[chave]   # A entrada do heap fica órfã e é ignorada no pop
+        self._metricas["descartadas"] += 1
+        return True
+
+    def _proxima(self):
+        """Próxima pendente válida (com o lock). None se o despachante fechou."""
+        while True:
+            while not self._fila and not self._fechado:
+                self._cond.wait()
+            if self._fechado:
+                return None
+            prioridade, _, chave = heapq.heappop(self._fila)
+            pendente = self._pendentes.get(chave)
+            if pendente is None or pendente["prioridade"] != prioridade:
+                continue   # Descartada ou reempilhada com prioridade maior
+            del self._pendentes[chave]
+            if prioridade > PRIORIDADE_ALERTA and time.monotonic() - pendente["criada"] > self.validade_s:
+                self._metricas["expiradas"] += 1
+                continue
+            return chave, pendente
+
+    def _trabalhar(self):
+        ultima = 0.0
+        while True:
+            with self._cond:
+                proxima = self._proxima()
+            if proxima is None:
+                break
+            chave, pendente = proxima
+            espera = ultima + self.intervalo_s - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            texto = pendente["texto"]
+            if pendente["vezes"] > 1:
+                texto += f" ({pendente['vezes']} vezes)"
+            try:
+                self.backend.falar(texto, pendente["prioridade"])
+                self._metricas["faladas"] += 1
+            except Exception:
+                self._metricas["erros"] += 1
+            ultima = time.monotonic()
+            with self._cond:
+                self._faladas_em[chave] = ultima
+                if len(self._faladas_em) > 256:   # Esquece chaves fora da janela
+                    self._faladas_em = {c: t for c, t in self._faladas_em.items() if ultima - t < self.janela_s}
+        self.backend.fechar()
+
+    def metricas(self):
+        with self._cond:
+            return {**self._metricas, "na_fila": len(self._pendentes)}
+
+    def fechar(self, timeout_s=2.0):
+        with self._cond:
+            self._fechado = True
+            self._cond.notify_all()
+        self._thread.join(timeout_s)
+
+
+_padrao = None
+_padrao_lock = threading.Lock()
+
+def despachante_padrao():
+    """Despachante do processo (criado no primeiro uso, com o backend de VOZ_BACKEND)."""
+    global _padrao
+    with _padrao_lock:
+        if _padrao is None:
+            _padrao = DespachanteVoz()
+        return _padrao
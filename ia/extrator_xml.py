@@ -0,0 +1,105 @@
+"""
+Motor rápido de extração do motivo de erro em XML do SPB (ISO 20022).
+
+Mesmo resultado do parser original (primeira ocorrência de cada tag, na ordem
+de prioridade), mas:
+- Atalho sem parse quando nenhuma tag candidata aparece no texto;
+- Parser reutilizado (um por thread) e filtro de tags agnóstico a namespace ({*}Tag),
+  numa única varredura da árvore (sem reescrever as tags nem repetir buscas .//tag);
+- Para na hora se a tag de maior prioridade aparece com conteúdo;
+- Memoização por hash da mensagem (legado e operação costumam repetir o mesmo msgop);
+- Versão em lote para uma coluna inteira do DataFrame.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from lxml import etree
+
+# Tags onde o Bacen costuma esconder o motivo do erro (ordem = prioridade)
+TAGS_PRIORIDADE = [
+    'RsnDesc',       # Reason Description (Mais comum)
+    'AddtlInf',      # Additional Information
+    'StsRsnInf',     # Status Reason Information
+    'RjctnRsn',      # Rejection Reason
+    'Prtry',         # Proprietary Error Code
+    'Ustrd'          # Unstructured info
+]
+_PRIORIDADE = {tag: i for i, tag in enumerate(TAGS_PRIORIDADE)}
+_TAGS_BYTES = tuple(tag.encode('ascii') for tag in TAGS_PRIORIDADE)
+
+# Filtro de tags agnóstico a namespace ({*}Tag): uma única varredura em C devolve
+# todas as candidatas em ordem de documento (bem mais barato que XPath com local-name())
+_TAGS_QUALQUER_NS = tuple(f"{{*}}{tag}" for tag in TAGS_PRIORIDADE)
+
+MEMO_TAMANHO = 50_000
+_memo = OrderedDict()     # digest -> motivo
+_memo_lock = threading.Lock()
+_local = threading.local()
+
+
+def _parser():
+    """XMLParser não é thread-safe: um por thread, reaproveitado entre chamadas."""
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = etree.XMLParser(recover=True)
+    return parser
+
+def _extrair_bytes(dados):
+    # Atalho: sem nenhuma tag candidata no texto não há o que parsear
+    if not any(tag in dados for tag in _TAGS_BYTES):
+        return ""
+    try:
+        root = etree.fromstring(dados, parser=_parser())
+        if root is None:
+            return ""
+        primeiras = {}
+        for elem in root.iter(*_TAGS_QUALQUER_NS):
+            tag = elem.tag[elem.tag.rfind('}') + 1:]
+            if tag in primeiras:
+                continue  # Como o .find() original: só a primeira ocorrência de cada tag conta
+            texto = elem.text.strip() if elem.text else ""
+            primeiras[tag] = texto
+            if texto and _PRIORIDADE[tag] == 0:
+                return texto  # Maior prioridade encontrada: não precisa olhar o resto
+        for tag in TAGS_PRIORIDADE:
+            if primeiras.get(tag):
+                return primeiras[tag]
+    except Exception:
+        # Se falhar (não for XML ou estiver corrompido), retorna vazio silenciosamente
+        pass
+    return ""
+
+def extrair_motivo(xml_text):
+    """Extrai o motivo de uma mensagem (com memoização pelo hash do conteúdo)."""
+    if not xml_text or not isinstance(xml_text, str):
+        return ""
+    dados = xml_text.encode('utf-8')
+    digest = hashlib.blake2b(dados, digest_size=16).digest()
+    with _memo_lock:
+        motivo = _memo.get(digest)
+        if motivo is not None:
+            _memo.move_to_end(digest)
+            return motivo
+    motivo = _extrair_bytes(dados)
+    with _memo_lock:
+        _memo[digest] = motivo
+        if len(_memo) > MEMO_TAMANHO:
+            _memo.popitem(last=False)
+    return motivo
+
+def extrair_motivos_coluna(serie):
+    """
+    Versão em lote: parseia cada msgop distinto uma única vez e espalha o resultado.
+    Nulos viram "" (mesmo efeito do str(x) aplicado linha a linha no código antigo).
+    """
+    if serie is None or len(serie) == 0:
+        return pd.Series([], index=getattr(serie, "index", None), dtype=object)
+    unicos = pd.unique(serie.dropna())
+    motivos = {valor: extrair_motivo(valor) if isinstance(valor, str) else "" for valor in unicos}
+    return serie.map(motivos).fillna("")
+
+def limpar_memo():
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,68 @@
+"""
+Guarda de custo do SQL gerado pelo LLM (antes de executar no banco de produção).
+
+- Acrescenta LIMIT quando a consulta final não tem (o planner escolhe planos top-N
+  e o banco para de produzir linhas cedo);
+- Roda EXPLAIN (FORMAT JSON), sem executar, e compara custo e linhas estimados com
+  o orçamento configurado;
+- Consulta acima do orçamento não roda: volta para o loop de autocorreção do
+  gerar_sql com a dica de filtrar mais.
+"""
+import os
+import re
+import json
+
+from db_pool import conexao_db
+from resultado_paginado import LIMITE_LINHAS
+
+GUARDA_ATIVA = os.getenv("SQL_GUARDA_CUSTO", "1") == "1"
+CUSTO_MAXIMO = float(os.getenv("SQL_CUSTO_MAXIMO", "500000"))        # Unidades de custo do planner
+LINHAS_MAXIMAS = float(os.getenv("SQL_LINHAS_ESTIMADAS_MAX", "100000"))
+# +1 para o resultado_paginado ainda perceber que havia mais linhas que o limite de leitura
+LIMITE_AUTOMATICO = int(os.getenv("SQL_LIMITE_AUTOMATICO", str(LIMITE_LINHAS + 1)))
+
+PREFIXO_CARA = "CONSULTA CARA DEMAIS"
+
+# LIMIT/FETCH no fim do comando = limite da consulta externa (subqueries terminam em ')').
+# O valor pode ser parâmetro do psycopg2 (templates: LIMIT %(limite)s)
+_VALOR = r"(?:\d+|%\(\w+\)s|%s)"
+_LIMIT_FINAL = re.compile(
+    rf"\b(limit\s+({_VALOR}|all)|fetch\s+(first|next)\s+{_VALOR}?\s*rows?\s+only)(\s+offset\s+{_VALOR}(\s+rows?)?)?\s*;?\s*$",
+    re.IGNORECASE,
+)
+
+
+def garantir_limit(sql, limite=LIMITE_AUTOMATICO):
+    """Devolve (sql, True) com LIMIT acrescentado quando a consulta externa não tem limite."""
+    corpo = sql.strip().rstrip(";").rstrip()
+    if _LIMIT_FINAL.search(corpo):
+        return sql, False
+    return f"{corpo}\nLIMIT {int(limite)};", True
+
+def estimar_plano(query, params=None):
+    """EXPLAIN (FORMAT JSON) sem ANALYZE: nada é executado, só planejado."""
+    with conexao_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"EXPLAIN (FORMAT JSON) {query.strip().rstrip(';')}", params)
+            plano = cur.fetchone()[0]
+    if isinstance(plano, str):  # Drivers sem o typecaster de json devolvem texto
+        plano = json.loads(plano)
+    raiz = plano[0]["Plan"]
+    return {
+        "custo": float(raiz["Total Cost"]),
+        "linhas": float(raiz["Plan Rows"]),
+        "no": raiz["Node Type"],
+    }
+
+def avaliar(plano, custo_maximo=CUSTO_MAXIMO, linhas_maximas=LINHAS_MAXIMAS):
+    """None se o plano cabe no orçamento, senão a dica para o LLM reescrever a consulta."""
+    excessos = []
+    if plano["custo"] > custo_maximo:
+        excessos.append(f"custo estimado {plano['custo']:.0f} > orçamento {custo_maximo:.0f}")
+    if plano["linhas"] > linhas_maximas:
+        excessos.append(f"~{plano['linhas']:.0f} linhas estimadas > máximo {linhas_maximas:.0f}")
+    if not excessos:
+        return None
+    return (f"{PREFIXO_CARA} ({'; '.join(excessos)}). "
+            "Adicione filtros (ts_inclusao em uma janela de tempo, statusmsg, origem, codmsg) "
+            "ou agregue com COUNT/GROUP BY em vez de listar tudo.")
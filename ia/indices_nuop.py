@@ -0,0 +1,94 @@
+"""
+Migração de índices para a busca de NUOP do investigador forense.
+
+- btree (text_pattern_ops) em `nuop`: atende a busca exata (=) e por prefixo (LIKE 'E123%').
+- btree em `msgid`: atende o JOIN legado -> operação.
+- btree em `ts_entrega` do legado: janela do SLA do consumidor (sla_legado.py).
+- pg_trgm (opcional): deixa a busca por substring (LIKE '%...%') rápida quando ela for pedida.
+
+Uso:
+    python indices_nuop.py                    # Só imprime o DDL
+    python indices_nuop.py --aplicar          # Executa no banco configurado no .env
+    python indices_nuop.py --aplicar --trgm   # Inclui os índices trigram
+"""
+import sys
+import argparse
+
+import psycopg2
+
+from db_pool import DB_CONFIG
+
+# Tabelas lidas por QUERY_INVESTIGACAO_NUOP (agente_spb.py)
+TABELAS_OPERACAO = ["pix.operacao", "spi.operacao", "spb.operacao"]
+TABELAS_LEGADO = ["pix.legado"]
+
+
+def _nome_indice(tabela, sufixo):
+    return f"idx_{tabela.split('.')[-1]}_{sufixo}"
+
+def gerar_ddl(trgm=False):
+    """Lista de comandos DDL (idempotentes, CONCURRENTLY para não travar escrita)."""
+    ddl = []
+    for tabela in TABELAS_OPERACAO:
+        ddl.append(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {_nome_indice(tabela, 'nuop_pattern')} "
+            f"ON {tabela} (nuop text_pattern_ops)"
+        )
+        ddl.append(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {_nome_indice(tabela, 'msgid')} "
+            f"ON {tabela} (msgid)"
+        )
+    for tabela in TABELAS_LEGADO:
+        ddl.append(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {_nome_indice(tabela, 'msgid')} "
+            f"ON {tabela} (msgid)"
+        )
+        ddl.append(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {_nome_indice(tabela, 'ts_entrega')} "
+            f"ON {tabela} (ts_entrega)"
+        )
+    if trgm:
+        ddl.append("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for tabela in TABELAS_OPERACAO:
+            ddl.append(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {_nome_indice(tabela, 'nuop_trgm')} "
+                f"ON {tabela} USING gin (nuop gin_trgm_ops)"
+            )
+    return ddl
+
+def aplicar_ddl(ddl):
+    """
+    Executa cada comando em autocommit (exigência do CONCURRENTLY).
+    Usa conexão dedicada, fora do pool read-only e sem statement_timeout.
+    Retorna a quantidade de falhas (uma tabela ausente não impede as demais).
+    """
+    falhas = 0
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    try:
+        for comando in ddl:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(comando)
+                print(f"✅ {comando}")
+            except Exception as e:
+                falhas += 1
+                print(f"❌ {comando}\n   ➤ {str(e).strip()}")
+    finally:
+        conn.close()
+    return falhas
+
+def main():
+    parser = argparse.ArgumentParser(description="Índices para a busca de NUOP (exata/prefixo/substring).")
+    parser.add_argument("--aplicar", action="store_true", help="Executa o DDL no banco do .env")
+    parser.add_argument("--trgm", action="store_true", help="Inclui pg_trgm para busca por substring")
+    args = parser.parse_args()
+
+    ddl = gerar_ddl(trgm=args.trgm)
+    if not args.aplicar:
+        print(";\n".join(ddl) + ";")
+        return 0
+    return 1 if aplicar_ddl(ddl) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
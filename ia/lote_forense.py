@@ -0,0 +1,201 @@
+"""
+Investigação forense em lote (incidentes com centenas de NUOPs falhados).
+
+Em vez de rodar o grafo uma vez por NUOP (router -> 3 scans -> LLM), busca todas
+as timelines numa única query set-based (`nuop = ANY(...)`), agrupa por NUOP e
+distribui os pareceres do LLM num pool limitado de workers.
+
+Uso:
+    python lote_forense.py nuops.txt --workers 4 --saida relatorio.md --json resultados.json
+    python lote_forense.py --nuops E123... E456...
+    cat nuops.txt | python lote_forense.py -
+"""
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from db_pool import conexao_db
+from agente_spb import (
+    QUERY_INVESTIGACAO_NUOP,
+    VEREDITO_SEMPRE_LLM,
+    extrair_evidencias,
+    calcular_sla_unificado,
+    gerar_parecer_forense,
+)
+from regras_veredito import aplicar_regras, relatorio_deterministico
+from timeline_nuop import TimelineNuop
+
+QUERY_LOTE_NUOP = QUERY_INVESTIGACAO_NUOP.format(filtro="= ANY(%(nuops)s)")
+
+TAMANHO_LOTE_SQL = 500   # NUOPs por query (mantém o array do ANY num tamanho razoável)
+WORKERS_LLM = 4          # Chamadas simultâneas ao Ollama
+
+
+def carregar_nuops(linhas):
+    """Extrai NUOPs de linhas de texto (um por linha, aceita CSV/lixo ao redor). Remove duplicados mantendo a ordem."""
+    vistos = {}
+    for linha in linhas:
+        for nuop in re.findall(r'\b[a-zA-Z0-9]{20,35}\b', linha):
+            vistos.setdefault(nuop, None)
+    return list(vistos)
+
+def buscar_timelines_lote(nuops, tamanho_lote=TAMANHO_LOTE_SQL):
+    """Uma query por bloco de NUOPs; devolve {nuop: TimelineNuop ordenada por ts_inclusao}."""
+    timelines = {}
+    with conexao_db() as conn:
+        for i in range(0, len(nuops), tamanho_lote):
+            bloco = nuops[i:i + tamanho_lote]
+            df = pd.read_sql(QUERY_LOTE_NUOP, conn, params={"nuops": bloco})
+            # Motivo extraído no bloco inteiro (XML repetido entre NUOPs é parseado uma vez);
+            # o XML bruto não fica guardado nas centenas de timelines do lote
+            extrair_evidencias(df)
+            for nuop, grupo in df.groupby('nuop', sort=False):
+                timelines[nuop] = TimelineNuop.de_dataframe(grupo)
+    return timelines
+
+def extrair_veredito(relatorio):
+    """Lê a linha '**Veredito Final:** ...' do parecer para o consolidado."""
+    match = re.search(r'Veredito Final:\**\s*\**([^\n*]+)', relatorio or "")
+    return match.group(1).strip() if match else "INDEFINIDO"
+
+def _resultado(nuop, timeline, sla, relatorio, veredito, erro, via, inicio):
+    return {
+        "nuop": nuop,
+        "encontrado": True,
+        "linhas": len(timeline),
+        "sla": sla,
+        "relatorio": relatorio,
+        "veredito": veredito,
+        "via": via,
+        "erro": erro,
+        "tempo_s": round(time.perf_counter() - inicio, 3),
+    }
+
+def _analisar_llm(nuop, timeline, sla):
+    inicio = time.perf_counter()
+    try:
+        relatorio = gerar_parecer_forense(timeline.para_dataframe(), sla)
+        return _resultado(nuop, timeline, sla, relatorio, extrair_veredito(relatorio), None, "llm", inicio)
+    except Exception as e:
+        return _resultado(nuop, timeline, sla, None, "ERRO", str(e), "llm", inicio)
+
+def investigar_lote(nuops, workers=WORKERS_LLM, tamanho_lote=TAMANHO_LOTE_SQL, narrativa=False):
+    """Executa a investigação completa. Retorna (resultados na ordem de entrada, estatísticas)."""
+    inicio = time.perf_counter()
+    timelines = buscar_timelines_lote(nuops, tamanho_lote)
+    t_db = time.perf_counter() - inicio
+
+    # SLA + motor de regras é CPU local: roda aqui, o pool fica só com o LLM.
+    # Só os casos que as regras não decidem vão para o pool; o DataFrame de cada NUOP
+    # existe só enquanto ele é analisado (a timeline compacta é o que fica guardado)
+    resultados = {}
+    pendentes = {}
+    for nuop, timeline in timelines.items():
+        inicio_regra = time.perf_counter()
+        df = timeline.para_dataframe()
+        sla = calcular_sla_unificado(df)
+        decisao = None if (narrativa or VEREDITO_SEMPRE_LLM) else aplicar_regras(df)
+        if decisao:
+            relatorio = relatorio_deterministico(decisao, sla)
+            resultados[nuop] = _resultado(nuop, timeline, sla, relatorio, decisao["veredito"], None, "regra", inicio_regra)
+        else:
+            pendentes[nuop] = (timeline, sla)
+    print(f"   ➤ {len(resultados)} decididos por regra, {len(pendentes)} para o LLM")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futuros = [pool.submit(_analisar_llm, nuop, timeline, sla) for nuop, (timeline, sla) in pendentes.items()]
+        for futuro in as_completed(futuros):
+            r = futuro.result()
+            resultados[r["nuop"]] = r
+            print(f"   ➤ {r['nuop']}: {r['veredito']} ({r['tempo_s']}s)")
+
+    for nuop in nuops:
+        if nuop not in resultados:
+            resultados[nuop] = {
+                "nuop": nuop, "encontrado": False, "linhas": 0, "sla": None,
+                "relatorio": None, "veredito": "NÃO ENCONTRADO", "via": None, "erro": None, "tempo_s": 0.0,
+            }
+
+    total = time.perf_counter() - inicio
+    stats = {
+        "nuops": len(nuops),
+        "encontrados": len(timelines),
+        "decididos_por_regra": len(timelines) - len(pendentes),
+        "tempo_db_s": round(t_db, 3),
+        "tempo_total_s": round(total, 3),
+        "nuops_por_segundo": round(len(nuops) / total, 2) if total else None,
+    }
+    return [resultados[n] for n in nuops], stats
+
+def relatorio_consolidado(resultados, stats):
+    """Markdown: resumo por veredito + seção por NUOP."""
+    contagem = pd.Series([r["veredito"] for r in resultados]).value_counts()
+    linhas = [
+        "# 🛡️ RELATÓRIO FORENSE EM LOTE",
+        "",
+        f"- NUOPs: {stats['nuops']} (encontrados: {stats['encontrados']}, decididos por regra: {stats['decididos_por_regra']})",
+        f"- Tempo total: {stats['tempo_total_s']}s (DB: {stats['tempo_db_s']}s) | {stats['nuops_por_segundo']} NUOP/s",
+        "",
+        "## 📊 Vereditos",
+        contagem.rename_axis("veredito").reset_index(name="qtd").to_markdown(index=False),
+        "",
+        "## 🔍 Detalhe por NUOP",
+    ]
+    for r in resultados:
+        linhas.append(f"\n### {r['nuop']} — {r['veredito']}")
+        if r["erro"]:
+            linhas.append(f"❌ Erro na análise: {r['erro']}")
+        if r["sla"]:
+            linhas.append(r["sla"])
+        if r["relatorio"]:
+            linhas.append(r["relatorio"])
+    return "\n".join(linhas)
+
+def main():
+    parser = argparse.ArgumentParser(description="Investigação forense de vários NUOPs em uma passada.")
+    parser.add_argument("arquivo", nargs="?", help="Arquivo com NUOPs (um por linha) ou '-' para stdin")
+    parser.add_argument("--nuops", nargs="*", default=[], help="NUOPs direto na linha de comando")
+    parser.add_argument("--workers", type=int, default=WORKERS_LLM, help="Chamadas simultâneas ao LLM")
+    parser.add_argument("--lote-sql", type=int, default=TAMANHO_LOTE_SQL, help="NUOPs por query")
+    parser.add_argument("--narrativa", action="store_true", help="Pede o parecer do LLM mesmo nos casos decididos por regra")
+    parser.add_argument("--saida", help="Grava o relatório consolidado (Markdown)")
+    parser.add_argument("--json", help="Grava os resultados por NUOP (JSON)")
+    args = parser.parse_args()
+
+    linhas = list(args.nuops)
+    if args.arquivo == "-":
+        linhas += sys.stdin.readlines()
+    elif args.arquivo:
+        with open(args.arquivo, encoding="utf-8") as f:
+            linhas += f.readlines()
+
+    nuops = carregar_nuops(linhas)
+    if not nuops:
+        print("⚠️ Nenhum NUOP válido informado.")
+        return 1
+
+    print(f"🕵️ Investigando {len(nuops)} NUOPs em lote...")
+    resultados, stats = investigar_lote(
+        nuops, workers=args.workers, tamanho_lote=args.lote_sql, narrativa=args.narrativa
+    )
+    relatorio = relatorio_consolidado(resultados, stats)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(relatorio)
+        print(f"💾 Relatório salvo em {args.saida}")
+    else:
+        print(relatorio)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"estatisticas": stats, "resultados": resultados}, f, ensure_ascii=False, indent=2)
+        print(f"💾 Resultados salvos em {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+Instrumentação dos nós do grafo: onde foi o tempo de cada resposta (LLM, banco ou pandas).
+
+Por nó (router, gerar_sql, validar_sql, executar_sql, investigar_nuop, analise_forense...):
+- Tempo de parede (histograma) e erros;
+- LLM: chamadas, tokens de prompt/resposta e latência (callback global do LangChain);
+- Banco: tempo de execução e linhas devolvidas;
+- Retentativas da autocorreção do SQL;
+- Pico de memória dos DataFrames manipulados.
+
+Exportação: texto do Prometheus (`exportar_prometheus`, GET /metricas no serviço) e
+JSON lines (um registro por nó executado, em METRICAS_JSONL). A TUI mostra o resumo
+da última pergunta no painel lateral.
+"""
+import os
+import json
+import time
+import inspect
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+ARQUIVO_JSONL = os.getenv("METRICAS_JSONL", "")   # Vazio = não grava JSON lines
+BUCKETS_S = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_span_atual = ContextVar("jarvis_span", default=None)        # Medição do nó em andamento
+_execucao_atual = ContextVar("jarvis_execucao", default=None)  # Spans da pergunta em andamento
+
+
+class Coletor:
+    """Agregados do processo inteiro (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lock_arquivo = threading.Lock()
+        self.zerar()
+
+    def zerar(self):
+        with self._lock:
+            self.nos = {}   # no -> contadores
+            self.retries_sql = 0
+            self.df_bytes_pico = 0
+
+    def _no(self, no):
+        if no not in self.nos:
+            self.nos[no] = {
+                "chamadas": 0, "erros": 0, "duracao_s": 0.0, "buckets": [0] * len(BUCKETS_S),
+                "llm_chamadas": 0, "llm_s": 0.0, "tokens_prompt": 0, "tokens_resposta": 0,
+                "db_s": 0.0, "db_linhas": 0,
+            }
+        return self.nos[no]
+
+    def registrar_span(self, span):
+        with self._lock:
+            dados = self._no(span["no"])
+            dados["chamadas"] += 1
+            dados["erros"] += 1 if span.get("erro") else 0
+            dados["duracao_s"] += span["duracao_s"]
+            for i, limite in enumerate(BUCKETS_S):
+                if span["duracao_s"] <= limite:
+                    dados["buckets"][i] += 1
+            for chave in ("llm_chamadas", "llm_s", "tokens_prompt", "tokens_resposta", "db_s", "db_linhas"):
+                dados[chave] += span[chave]
+            self.df_bytes_pico = max(self.df_bytes_pico, span["df_bytes"])
+        if ARQUIVO_JSONL:
+            linha = json.dumps(span, ensure_ascii=False, default=str)
+            with self._lock_arquivo:
+                with open(ARQUIVO_JSONL, "a", encoding="utf-8") as f:
+                    f.write(linha + "\n")
+
+    def contar_retry_sql(self):
+        with self._lock:
+            self.retries_sql += 1
+
+    def retrato(self):
+        with self._lock:
+            return {
+                "nos": {no: dict(dados, buckets=list(dados["buckets"])) for no, dados in self.nos.items()},
+                "retries_sql": self.retries_sql,
+                "df_bytes_pico": self.df_bytes_pico,
+            }
+
+
+coletor = Coletor()
+
+
+# --- Medição dos nós ---
+
+def _novo_span(no):
+    return {
+        "no": no, "ts": time.time(), "duracao_s": 0.0, "erro": None,
+        "llm_chamadas": 0, "llm_s": 0.0, "tokens_prompt": 0, "tokens_resposta": 0,
+        "db_s": 0.0, "db_linhas": 0, "df_bytes": 0,
+    }
+
+def _fechar_span(span, inicio):
+    span["duracao_s"] = round(time.perf_counter() - inicio, 6)
+    coletor.registrar_span(span)
+    execucao = _execucao_atual.get()
+    if execucao is not None:
+        execucao.append(span)
+
+def instrumentar(no, funcao):
+    """Envolve um nó (síncrono ou assíncrono) medindo tempo, LLM, banco e DataFrames lá dentro."""
+    if inspect.iscoroutinefunction(funcao):
+        @functools.wraps(funcao)
+        async def medido_async(state):
+            span, inicio = _novo_span(no), time.perf_counter()
+            token = _span_atual.set(span)
+            try:
+                return await funcao(state)
+            except Exception as e:
+                span["erro"] = str(e)
+                raise
+            finally:
+                _span_atual.reset(token)
+                _fechar_span(span, inicio)
+        return medido_async
+
+    @functools.wraps(funcao)
+    def medido(state):
+        span, inicio = _novo_span(no), time.perf_counter()
+        token = _span_atual.set(span)
+        try:
+            return funcao(state)
+        except Exception as e:
+            span["erro"] = str(e)
+            raise
+        finally:
+            _span_atual.reset(token)
+            _fechar_span(span, inicio)
+    return medido
+
+@contextmanager
+def medir_db():
+    """Tempo de banco do nó atual; quem chama preenche medicao['linhas']."""
+    medicao = {"linhas": 0}
+    inicio = time.perf_counter()
+    try:
+        yield medicao
+    finally:
+        span = _span_atual.get()
+        if span is not None:
+            span["db_s"] += time.perf_counter() - inicio
+            span["db_linhas"] += int(medicao["linhas"] or 0)
+
+def registrar_dataframe(df):
+    """Memória (deep) de um DataFrame manipulado no nó atual; guarda o pico."""
+    span = _span_atual.get()
+    if span is not None and df is not None:
+        span["df_bytes"] = max(span["df_bytes"], int(df.memory_usage(deep=True).sum()))
+
+def contar_retry_sql():
+    coletor.contar_retry_sql()
+
+@contextmanager
+def medir_execucao():
+    """Agrupa os spans de uma pergunta (TUI/serviço): `with medir_execucao() as spans: ...`."""
+    spans = []
+    token = _execucao_atual.set(spans)
+    try:
+        yield spans
+    finally:
+        _execucao_atual.reset(token)
+
+
+# --- LLM: callback global (entra em toda chamada de chat model, inclusive fora do grafo) ---
+
+class CallbackMetricasLLM(BaseCallbackHandler):
+    run_inline = True
+
+    def __init__(self):
+        self._inicio = {}   # run_id -> (perf_counter, span, tokens de prompt estimados)
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        caracteres = sum(len(str(getattr(m, "content", m))) for lista in messages for m in lista)
+        with self._lock:
+            self._inicio[run_id] = (time.perf_counter(), _span_atual.get(), caracteres // 4 + 1)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.on_chat_model_start(serialized, [prompts], run_id=run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        with self._lock:
+            inicio, span, prompt_estimado = self._inicio.pop(run_id, (None, None, 0))
+        if inicio is None:
+            return
+        if span is None:
+            # Chamada fora de um nó instrumentado (ex.: lote_forense): span avulso
+            span = _novo_span("llm_avulso")
+            avulso = True
+        else:
+            avulso = False
+        span["llm_chamadas"] += 1
+        span["llm_s"] += time.perf_counter() - inicio
+        prompt, resposta = _contar_tokens(response, prompt_estimado)
+        span["tokens_prompt"] += prompt
+        span["tokens_resposta"] += resposta
+        if avulso:
+            span["duracao_s"] = span["llm_s"]
+            coletor.registrar_span(span)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        with self._lock:
+            self._inicio.pop(run_id, None)
+
+def _contar_tokens(response, prompt_estimado):
+    """usage_metadata do modelo (Ollama informa prompt_eval_count/eval_count); senão estimativa por caracteres."""
+    prompt = resposta = 0
+    informado = False
+    for geracoes in response.generations:
+        for geracao in geracoes:
+            uso = getattr(getattr(geracao, "message", None), "usage_metadata", None)
+            if uso:
+                informado = True
+                prompt += uso.get("input_tokens", 0)
+                resposta += uso.get("output_tokens", 0)
+            else:
+                resposta += len(geracao.text or "") // 4 + 1
+    return (prompt if informado else prompt_estimado), resposta
+
+_callback_llm = ContextVar("jarvis_metricas_llm", default=CallbackMetricasLLM())
+register_configure_hook(_callback_llm, inheritable=True)
+
+
+# --- Exportação ---
+
+def exportar_prometheus():
+    dados = coletor.retrato()
+    linhas = [
+        "# HELP jarvis_no_duracao_segundos Tempo de parede por nó do grafo.",
+        "# TYPE jarvis_no_duracao_segundos histogram",
+    ]
+    for no, d in sorted(dados["nos"].items()):
+        for limite, qtd in zip(BUCKETS_S, d["buckets"]):   # Já cumulativos (<= limite)
+            linhas.append(f'jarvis_no_duracao_segundos_bucket{{no="{no}",le="{limite}"}} {qtd}')
+        linhas.append(f'jarvis_no_duracao_segundos_bucket{{no="{no}",le="+Inf"}} {d["chamadas"]}')
+        linhas.append(f'jarvis_no_duracao_segundos_sum{{no="{no}"}} {d["duracao_s"]:.6f}')
+        linhas.append(f'jarvis_no_duracao_segundos_count{{no="{no}"}} {d["chamadas"]}')
+
+    contadores = [
+        ("jarvis_no_erros_total", "Execuções do nó que terminaram em exceção.", "erros", None),
+        ("jarvis_llm_chamadas_total", "Chamadas ao LLM.", "llm_chamadas", None),
+        ("jarvis_llm_segundos_total", "Tempo esperando o LLM.", "llm_s", None),
+        ("jarvis_llm_tokens_total", "Tokens do LLM.", "tokens_prompt", 'tipo="prompt"'),
+        ("jarvis_llm_tokens_total", None, "tokens_resposta", 'tipo="resposta"'),
+        ("jarvis_db_segundos_total", "Tempo de execução no banco.", "db_s", None),
+        ("jarvis_db_linhas_total", "Linhas devolvidas pelo banco.", "db_linhas", None),
+    ]
+    for nome, ajuda, chave, rotulo_extra in contadores:
+        if ajuda:
+            linhas += [f"# HELP {nome} {ajuda}", f"# TYPE {nome} counter"]
+        for no, d in sorted(dados["nos"].items()):
+            rotulos = f'no="{no}"' + (f",{rotulo_extra}" if rotulo_extra else "")
+            linhas.append(f"{nome}{{{rotulos}}} {d[chave]:g}")
+
+    linhas += [
+        "# HELP jarvis_sql_retries_total Retentativas da autocorreção do SQL.",
+        "# TYPE jarvis_sql_retries_total counter",
+        f"jarvis_sql_retries_total {dados['retries_sql']}",
+        "# HELP jarvis_dataframe_bytes_pico Maior DataFrame manipulado (memória deep).",
+        "# TYPE jarvis_dataframe_bytes_pico gauge",
+        f"jarvis_dataframe_bytes_pico {dados['df_bytes_pico']}",
+    ]
+    return "\n".join(linhas) + "\n"
+
+def resumo_execucao(spans):
+    """Texto curto para o painel da TUI: total, LLM, banco e pandas da última pergunta."""
+    if not spans:
+        return "—"
+    total = sum(s["duracao_s"] for s in spans)
+    llm_s = sum(s["llm_s"] for s in spans)
+    db_s = sum(s["db_s"] for s in spans)
+    tokens_p = sum(s["tokens_prompt"] for s in spans)
+    tokens_r = sum(s["tokens_resposta"] for s in spans)
+    linhas_db = sum(s["db_linhas"] for s in spans)
+    retries = max(0, sum(1 for s in spans if s["no"] == "gerar_sql") - 1)
+    df_kb = max(s["df_bytes"] for s in spans) / 1024
+    mais_lento = max(spans, key=lambda s: s["duracao_s"])
+    return (
+        f"Total: {total:.2f}s\n"
+        f"LLM: {llm_s:.2f}s ({tokens_p}+{tokens_r} tok)\n"
+        f"DB: {db_s:.2f}s ({linhas_db} linhas)\n"
+        f"Pandas/outros: {max(0.0, total - llm_s - db_s):.2f}s\n"
+        f"Retries SQL: {retries}\n"
+        f"DF pico: {df_kb:.0f} KB\n"
+        f"Gargalo: {mais_lento['no']}"
+    )
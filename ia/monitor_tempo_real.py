@@ -0,0 +1,335 @@
+"""
+Monitor contínuo de SLA e falhas (modo tempo real da TUI, /monitor).
+
+- Segue as linhas novas de pix.operacao, spb.operacao e pix.legado por keyset
+  (ts_inclusao, msgid) a partir do fim da tabela: cada tick lê só o que entrou
+  desde o último, nunca o histórico;
+- Com MONITOR_CANAL configurado (e o trigger de --preparar-notify), o tick acorda
+  no NOTIFY em vez de esperar o intervalo; o keyset continua sendo a fonte da verdade;
+- Janelas deslizantes (buckets por segundo, somas incrementais): taxa de timeout,
+  taxa de rejeição 319/320 e latência de consumo do legado (histograma -> p95);
+- Alertas com histerese (dispara ao cruzar o limite, avisa quando normaliza).
+  A TUI entrega no RichLog e no speak_system; o modo CLI imprime.
+
+Uso:
+    python monitor_tempo_real.py --intervalo 2 --janela 300
+    python monitor_tempo_real.py --preparar-notify      # Trigger de NOTIFY nas tabelas seguidas
+"""
+import os
+import sys
+import time
+import select
+import argparse
+from collections import deque
+
+import psycopg2
+
+from db_pool import DB_CONFIG, conexao_db
+from indices_nuop import aplicar_ddl
+
+MONITOR_INTERVALO_S = float(os.getenv("MONITOR_INTERVALO_S", "2"))
+MONITOR_JANELA_S = int(os.getenv("MONITOR_JANELA_S", "300"))
+MONITOR_CANAL = os.getenv("MONITOR_CANAL", "")                        # Vazio = só polling
+MONITOR_BLOCO = int(os.getenv("MONITOR_BLOCO", "5000"))               # Linhas por leitura de keyset
+MONITOR_MINIMO_EVENTOS = int(os.getenv("MONITOR_MINIMO_EVENTOS", "20"))  # Abaixo disso não alerta (ruído)
+MONITOR_MINIMO_SEM_CONSUMO = int(os.getenv("MONITOR_MINIMO_SEM_CONSUMO", "5"))  # Eventos do legado sem consumo na janela
+
+# regra -> limite (taxas em fração; consumo em segundos de p95)
+LIMITES_PADRAO = {
+    "timeout": float(os.getenv("MONITOR_TAXA_TIMEOUT", "0.05")),
+    "rejeicao": float(os.getenv("MONITOR_TAXA_REJEICAO", "0.10")),
+    "consumo": float(os.getenv("MONITOR_P95_CONSUMO_S", "10")),
+}
+
+# Só as colunas necessárias; o LIKE do timeout roda no banco, sobre as linhas novas
+SQL_OPERACAO = """
+SELECT ts_inclusao, msgid, statusop, CAST(statusmsg AS INTEGER),
+       statusop = 205 AND msgop LIKE '%%Pagamento expirado por timeout%%'
+FROM {tabela}
+WHERE (ts_inclusao, msgid) > (%(ts)s, %(msgid)s)
+ORDER BY ts_inclusao, msgid
+LIMIT %(limite)s
+"""
+SQL_LEGADO = """
+SELECT ts_inclusao, msgid, EXTRACT(EPOCH FROM ts_consumo - ts_entrega)::float8
+FROM {tabela}
+WHERE (ts_inclusao, msgid) > (%(ts)s, %(msgid)s)
+ORDER BY ts_inclusao, msgid
+LIMIT %(limite)s
+"""
+SQL_LEGADO_PENDENTES = """
+SELECT msgid, EXTRACT(EPOCH FROM ts_consumo - ts_entrega)::float8
+FROM {tabela} WHERE msgid = ANY(%(msgids)s) AND ts_consumo IS NOT NULL
+"""
+
+# tabela -> tipo
+FONTES = {"pix.operacao": "operacao", "spb.operacao": "operacao", "pix.legado": "legado"}
+
+# Histograma da latência de consumo (segundos); o último bucket é "acima de 60s"
+BUCKETS_CONSUMO_S = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, float("inf"))
+PENDENTES_MAXIMO = 5000   # Eventos do legado ainda sem ts_consumo acompanhados
+
+
+def gerar_ddl_notify(canal):
+    """Trigger por comando (não por linha) que só acorda o monitor; o conteúdo vem do keyset."""
+    ddl = [
+        "CREATE SCHEMA IF NOT EXISTS forense",
+        f"""CREATE OR REPLACE FUNCTION forense.notificar_monitor() RETURNS trigger AS $$
+            BEGIN PERFORM pg_notify('{canal}', TG_TABLE_SCHEMA || '.' || TG_TABLE_NAME); RETURN NULL; END
+            $$ LANGUAGE plpgsql""",
+    ]
+    for tabela in FONTES:
+        nome = f"trg_monitor_{tabela.replace('.', '_')}"
+        ddl.append(f"DROP TRIGGER IF EXISTS {nome} ON {tabela}")
+        ddl.append(f"CREATE TRIGGER {nome} AFTER INSERT ON {tabela} "
+                   f"FOR EACH STATEMENT EXECUTE FUNCTION forense.notificar_monitor()")
+    return ddl
+
+
+class JanelaDeslizante:
+    """Contadores em buckets de 1s; a soma da janela é mantida ao entrar e ao expirar (O(1) amortizado)."""
+
+    def __init__(self, janela_s):
+        self.janela_s = janela_s
+        self.buckets = deque()   # [(segundo, {chave: qtd})]
+        self.soma = {}
+
+    def adicionar(self, agora, chave, qtd=1):
+        segundo = int(agora)
+        if not self.buckets or self.buckets[-1][0] != segundo:
+            self.buckets.append((segundo, {}))
+        contadores = self.buckets[-1][1]
+        contadores[chave] = contadores.get(chave, 0) + qtd
+        self.soma[chave] = self.soma.get(chave, 0) + qtd
+
+    def expirar(self, agora):
+        limite = int(agora) - self.janela_s
+        while self.buckets and self.buckets[0][0] <= limite:
+            _, contadores = self.buckets.popleft()
+            for chave, qtd in contadores.items():
+                self.soma[chave] -= qtd
+
+    def valor(self, chave):
+        return self.soma.get(chave, 0)
+
+
+class MonitorTempoReal:
+    """Estado do monitor: watermarks por tabela, janela deslizante e estado dos alertas."""
+
+    def __init__(self, janela_s=MONITOR_JANELA_S, limites=None, canal=MONITOR_CANAL,
+                 bloco=MONITOR_BLOCO, minimo_eventos=MONITOR_MINIMO_EVENTOS,
+                 minimo_sem_consumo=MONITOR_MINIMO_SEM_CONSUMO, relogio=time.monotonic):
+        self.janela = JanelaDeslizante(janela_s)
+        self.limites = dict(LIMITES_PADRAO, **(limites or {}))
+        self.canal = canal
+        self.bloco = bloco
+        self.minimo_eventos = minimo_eventos
+        self.minimo_sem_consumo = max(1, minimo_sem_consumo)
+        self.relogio = relogio
+        self.watermarks = {}       # tabela -> (ts_inclusao, msgid)
+        self.pendentes = {}        # msgid do legado sem ts_consumo -> chegada
+        self.alertas_ativos = set()
+        self._conn_listen = None
+
+    # --- Leitura incremental ---
+
+    def iniciar(self):
+        """Watermark = fim atual de cada tabela (o monitor não reprocessa o passado)."""
+        with conexao_db() as conn:
+            with conn.cursor() as cur:
+                for tabela in FONTES:
+                    cur.execute(f"SELECT ts_inclusao, msgid FROM {tabela} "
+                                f"ORDER BY ts_inclusao DESC, msgid DESC LIMIT 1")
+                    self.watermarks[tabela] = cur.fetchone() or ("-infinity", "")
+        if self.canal:
+            try:
+                self._conn_listen = psycopg2.connect(**DB_CONFIG)
+                self._conn_listen.autocommit = True
+                with self._conn_listen.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.canal}"')
+            except Exception as e:
+                print(f"⚠️ LISTEN indisponível ({str(e).strip()}): seguindo só por polling.")
+                self._conn_listen = None
+
+    def _ler_novas(self, cur, tabela, sql):
+        """Todas as linhas após o watermark, em blocos de keyset."""
+        linhas = []
+        while True:
+            ts, msgid = self.watermarks[tabela]
+            cur.execute(sql.format(tabela=tabela), {"ts": ts, "msgid": msgid, "limite": self.bloco})
+            bloco = cur.fetchall()
+            if bloco:
+                self.watermarks[tabela] = (bloco[-1][0], bloco[-1][1])
+                linhas += bloco
+            if len(bloco) < self.bloco:
+                return linhas
+
+    def _registrar_consumo(self, agora, latencia_s):
+        indice = next(i for i, limite in enumerate(BUCKETS_CONSUMO_S) if latencia_s <= limite)
+        self.janela.adicionar(agora, "consumo_eventos")
+        self.janela.adicionar(agora, f"consumo_{indice}")
+
+    def tick(self):
+        """Lê as linhas novas, atualiza a janela e devolve (retrato, alertas novos)."""
+        agora = self.relogio()
+        novas = 0
+        with conexao_db() as conn:
+            with conn.cursor() as cur:
+                for tabela, tipo in FONTES.items():
+                    if tipo == "operacao":
+                        for _, _, statusop, statusmsg, timeout in self._ler_novas(cur, tabela, SQL_OPERACAO):
+                            self.janela.adicionar(agora, "mensagens")
+                            if timeout:
+                                self.janela.adicionar(agora, "timeouts")
+                            if statusmsg in (319, 320):
+                                self.janela.adicionar(agora, "rejeicoes")
+                            novas += 1
+                        continue
+                    for _, msgid, latencia_s in self._ler_novas(cur, tabela, SQL_LEGADO):
+                        novas += 1
+                        if latencia_s is None:
+                            if len(self.pendentes) < PENDENTES_MAXIMO:
+                                self.pendentes[msgid] = agora
+                        else:
+                            self._registrar_consumo(agora, latencia_s)
+                    self._conferir_pendentes(cur, tabela, agora)
+        self.janela.expirar(agora)
+        retrato = self.retrato()
+        retrato["novas"] = novas
+        return retrato, self._avaliar(retrato)
+
+    def _conferir_pendentes(self, cur, tabela, agora):
+        """Eventos sem consumo: entram na janela quando consumidos; velhos demais contam como sem consumo."""
+        if not self.pendentes:
+            return
+        cur.execute(SQL_LEGADO_PENDENTES.format(tabela=tabela), {"msgids": list(self.pendentes)})
+        for msgid, latencia_s in cur.fetchall():
+            self.pendentes.pop(msgid, None)
+            self._registrar_consumo(agora, latencia_s)
+        for msgid, chegada in list(self.pendentes.items()):
+            if agora - chegada > self.janela.janela_s:
+                del self.pendentes[msgid]
+                self.janela.adicionar(agora, "sem_consumo")
+
+    def aguardar(self, timeout_s):
+        """Espera o próximo tick: acorda antes no NOTIFY (se houver LISTEN). True se foi notificado."""
+        if self._conn_listen is None:
+            time.sleep(timeout_s)
+            return False
+        try:
+            if select.select([self._conn_listen], [], [], timeout_s) == ([], [], []):
+                return False
+            self._conn_listen.poll()
+            notificado = bool(self._conn_listen.notifies)
+            self._conn_listen.notifies.clear()
+            return notificado
+        except Exception:
+            self._conn_listen = None   # Conexão caiu: continua por polling
+            return False
+
+    def fechar(self):
+        if self._conn_listen is not None:
+            self._conn_listen.close()
+            self._conn_listen = None
+
+    # --- Janela e alertas ---
+
+    def p95_consumo(self):
+        total = self.janela.valor("consumo_eventos")
+        if not total:
+            return None
+        acumulado = 0
+        for i, limite in enumerate(BUCKETS_CONSUMO_S):
+            acumulado += self.janela.valor(f"consumo_{i}")
+            if acumulado >= 0.95 * total:
+                return limite
+        return BUCKETS_CONSUMO_S[-1]
+
+    def retrato(self):
+        mensagens = self.janela.valor("mensagens")
+        return {
+            "janela_s": self.janela.janela_s,
+            "mensagens": mensagens,
+            "taxa_timeout": self.janela.valor("timeouts") / mensagens if mensagens else 0.0,
+            "taxa_rejeicao": self.janela.valor("rejeicoes") / mensagens if mensagens else 0.0,
+            "consumo_eventos": self.janela.valor("consumo_eventos"),
+            "consumo_p95_s": self.p95_consumo(),
+            "sem_consumo": self.janela.valor("sem_consumo"),
+            "pendentes": len(self.pendentes),
+        }
+
+    def _avaliar(self, r):
+        """Histerese: alerta só na transição normal -> acima do limite, e avisa a volta ao normal."""
+        p95 = texto_p95(r)
+        condicoes = {
+            "timeout": (r["mensagens"] >= self.minimo_eventos and r["taxa_timeout"] > self.limites["timeout"],
+                        f"Taxa de timeout {r['taxa_timeout']:.1%} na janela de {r['janela_s']}s "
+                        f"(limite {self.limites['timeout']:.0%})",
+                        "Alerta. Taxa de timeout acima do limite."),
+            "rejeicao": (r["mensagens"] >= self.minimo_eventos and r["taxa_rejeicao"] > self.limites["rejeicao"],
+                         f"Rejeições 319/320 em {r['taxa_rejeicao']:.1%} na janela de {r['janela_s']}s "
+                         f"(limite {self.limites['rejeicao']:.0%})",
+                         "Alerta. Rejeições do piloto e autorizador acima do limite."),
+            "consumo": ((r["consumo_eventos"] >= self.minimo_eventos and (r["consumo_p95_s"] or 0) > self.limites["consumo"])
+                        or r["sem_consumo"] >= self.minimo_sem_consumo,
+                        f"Consumo do legado lento: p95 {p95}, {r['sem_consumo']} sem consumo "
+                        f"(limite p95 {self.limites['consumo']:g}s)",
+                        "Alerta. Consumo do legado lento."),
+        }
+        alertas = []
+        for regra, (acima, texto, voz) in condicoes.items():
+            if acima and regra not in self.alertas_ativos:
+                self.alertas_ativos.add(regra)
+                alertas.append({"regra": regra, "nivel": "alerta", "texto": texto, "voz": voz})
+            elif not acima and regra in self.alertas_ativos:
+                self.alertas_ativos.discard(regra)
+                alertas.append({"regra": regra, "nivel": "normalizado",
+                                "texto": f"{regra}: de volta abaixo do limite", "voz": None})
+        return alertas
+
+
+def texto_p95(r):
+    """p95 do consumo como limite superior do bucket ("—" enquanto não há eventos)."""
+    return "—" if r["consumo_p95_s"] is None else f"≤{r['consumo_p95_s']:g}s"
+
+def resumo_monitor(r):
+    """Texto curto para o painel lateral da TUI."""
+    p95 = texto_p95(r)
+    return (
+        f"Janela: {r['janela_s']}s | {r['mensagens']} msgs\n"
+        f"Timeout: {r['taxa_timeout']:.1%}\n"
+        f"Rejeição 319/320: {r['taxa_rejeicao']:.1%}\n"
+        f"Consumo p95: {p95} ({r['consumo_eventos']} ev.)\n"
+        f"Sem consumo: {r['sem_consumo']} | pendentes: {r['pendentes']}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor contínuo de SLA/falhas (tailing por keyset).")
+    parser.add_argument("--intervalo", type=float, default=MONITOR_INTERVALO_S)
+    parser.add_argument("--janela", type=int, default=MONITOR_JANELA_S, help="Segundos da janela deslizante")
+    parser.add_argument("--canal", default=MONITOR_CANAL, help="Canal do LISTEN/NOTIFY (vazio = polling)")
+    parser.add_argument("--preparar-notify", action="store_true", help="Cria o trigger de NOTIFY e sai")
+    parser.add_argument("--verboso", action="store_true", help="Imprime o retrato a cada tick")
+    args = parser.parse_args()
+
+    if args.preparar_notify:
+        return 1 if aplicar_ddl(gerar_ddl_notify(args.canal or "jarvis_monitor")) else 0
+
+    monitor = MonitorTempoReal(janela_s=args.janela, canal=args.canal)
+    monitor.iniciar()
+    print(f"📡 Monitor ativo (janela {args.janela}s, {'LISTEN ' + args.canal if monitor._conn_listen else 'polling'})")
+    try:
+        while True:
+            retrato, alertas = monitor.tick()
+            if args.verboso:
+                print(resumo_monitor(retrato).replace("\n", " | "))
+            for alerta in alertas:
+                print(f"{'🚨' if alerta['nivel'] == 'alerta' else '✅'} {alerta['texto']}")
+            monitor.aguardar(args.intervalo)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        monitor.fechar()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+Perfil do tempo de import (python -X importtime) dos pontos de entrada do Jarvis.
+
+Cada módulo é importado num interpretador limpo (várias vezes; fica a menor medida)
+e o relatório mostra o total e os pacotes que mais pesam, para pegar regressão de
+partida: um import pesado que voltou para o topo do agente_spb ou da TUI.
+Com --salvar-baseline grava o resultado; com --baseline compara e sai com código 1
+se algum total piorar além da tolerância.
+
+Uso:
+    python perfil_importacao.py                                  # agente_spb e Jarvis_ui
+    python perfil_importacao.py --modulos Jarvis_ui --top 25
+    python perfil_importacao.py --salvar-baseline import_baseline.json
+    python perfil_importacao.py --baseline import_baseline.json --tolerancia 0.25
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+MODULOS_PADRAO = ["agente_spb", "Jarvis_ui"]
+DIFERENCA_MINIMA_S = 0.1    # Abaixo disso é ruído (cache de disco, CPU), não regressão
+
+
+def medir(modulo):
+    """{nome: (próprio_s, acumulado_s, profundidade)} de um import num processo novo."""
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=DIR, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": DIR + os.pathsep + os.environ.get("PYTHONPATH", "")},
+    )
+    if processo.returncode != 0:
+        raise RuntimeError(f"import {modulo} falhou: {processo.stderr.strip().splitlines()[-1:]}")
+    tempos = {}
+    for linha in processo.stderr.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        proprio, acumulado, nome = linha[len("import time:"):].split("|")
+        profundidade = (len(nome) - len(nome.lstrip())) // 2
+        tempos[nome.strip()] = (int(proprio) / 1e6, int(acumulado) / 1e6, profundidade)
+    return tempos
+
+def perfil(modulo, repeticoes, top):
+    """Menor total entre as repetições + os pacotes (topo de cada árvore) mais pesados dessa medida."""
+    melhor = min((medir(modulo) for _ in range(repeticoes)), key=lambda t: t.get(modulo, (0, 0, 0))[1])
+    total = melhor[modulo][1]
+    # Profundidade 1 = importado diretamente (ou primeira vez) pelo módulo medido
+    diretos = sorted(((nome, t[1]) for nome, t in melhor.items() if t[2] == 1), key=lambda x: -x[1])
+    proprios = sorted(((nome, t[0]) for nome, t in melhor.items()), key=lambda x: -x[1])
+    return {
+        "total_s": round(total, 4),
+        "modulos": len(melhor),
+        "diretos": [[nome, round(s, 4)] for nome, s in diretos[:top]],
+        "proprios": [[nome, round(s, 4)] for nome, s in proprios[:top]],
+    }
+
+def imprimir(resultado):
+    for modulo, dados in resultado["perfis"].items():
+        print(f"\n📦 import {modulo}: {dados['total_s'] * 1000:.0f} ms ({dados['modulos']} módulos)")
+        print(f"   {'importado por ele (acumulado)':<44} {'ms':>8}")
+        for nome, s in dados["diretos"]:
+            print(f"   {nome:<44} {s * 1000:>8.1f}")
+        print(f"   {'mais caros sozinhos (próprio)':<44} {'ms':>8}")
+        for nome, s in dados["proprios"]:
+            print(f"   {nome:<44} {s * 1000:>8.1f}")
+
+def comparar(atual, baseline, tolerancia):
+    """Lista de regressões (texto): total atual > base*(1+tol) e acima do ruído."""
+    regressoes = []
+    for modulo, dados in atual["perfis"].items():
+        base = baseline.get("perfis", {}).get(modulo)
+        if not base:
+            continue
+        agora, antes = dados["total_s"], base["total_s"]
+        if agora > antes * (1 + tolerancia) and agora - antes > DIFERENCA_MINIMA_S:
+            regressoes.append(f"import {modulo}: {antes * 1000:.0f} ms -> {agora * 1000:.0f} ms")
+    return regressoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de import dos pontos de entrada (python -X importtime).")
+    parser.add_argument("--modulos", nargs="+", default=MODULOS_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=3, help="Imports por módulo; vale o mais rápido")
+    parser.add_argument("--top", type=int, default=12, help="Linhas por lista")
+    parser.add_argument("--salvar-baseline", help="Grava o resultado em JSON")
+    parser.add_argument("--baseline", help="Compara com um resultado gravado")
+    parser.add_argument("--tolerancia", type=float, default=0.25, help="Piora relativa aceita (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    resultado = {"python": sys.version.split()[0],
+                 "perfis": {m: perfil(m, args.repeticoes, args.top) for m in args.modulos}}
+    imprimir(resultado)
+
+    if args.salvar_baseline:
+        with open(args.salvar_baseline, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Baseline salvo em {args.salvar_baseline}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressoes = comparar(resultado, baseline, args.tolerancia)
+        if regressoes:
+            print(f"\n❌ Regressões acima de {args.tolerancia:.0%}:")
+            for r in regressoes:
+                print(f"   {r}")
+            return 1
+        print(f"\n✅ Sem regressão acima de {args.tolerancia:.0%} em relação a {args.baseline}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
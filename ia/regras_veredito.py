@@ -0,0 +1,115 @@
+"""
+Motor de regras do veredito forense.
+
+Implementa, em Python, a mesma HIERARQUIA DE DECISÃO do prompt de
+node_analise_forense. Casos claros saem daqui em milissegundos;
+o LLM só é chamado quando nenhuma regra decide ou quando o usuário pede a narrativa.
+"""
+import pandas as pd
+
+STATUS_SUCESSO = {302, 108}
+STATUS_REJEICAO = {319, 320}
+STATUSOP_BACEN = 205
+TEXTO_TIMEOUT = "pagamento expirado por timeout"
+PALAVRAS_CADASTRO = ["identificação", "agente", "participante", "conta inexistente", "saldo"]
+
+# Palavras que pedem o parecer narrativo do LLM mesmo em caso claro
+PALAVRAS_NARRATIVA = ["explique", "explica", "detalhe", "detalhada", "narrativa", "por que", "porque", "completo"]
+
+
+def _numerico(serie):
+    return pd.to_numeric(serie, errors='coerce')
+
+def _primeira(df, mascara):
+    """Primeira linha (ordem cronológica) que satisfaz a máscara."""
+    return df[mascara.fillna(False)].iloc[0]
+
+def aplicar_regras(df):
+    """
+    Decide o veredito a partir de 'statusmsg', 'statusop' e 'evidencia_erro'.
+    Retorna dict(veredito, regra, resumo, analise) ou None se o caso precisa do LLM.
+    """
+    if df is None or df.empty:
+        return None
+
+    statusmsg = _numerico(df['statusmsg'])
+    statusop = _numerico(df['statusop'])
+    evidencia = df['evidencia_erro'].fillna("").astype(str) if 'evidencia_erro' in df.columns \
+        else pd.Series("", index=df.index)
+    evidencia_lower = evidencia.str.lower()
+
+    # 1. SUCESSO (prioridade suprema): 302/108 em qualquer linha
+    mascara = statusmsg.isin(STATUS_SUCESSO)
+    if mascara.any():
+        linha = _primeira(df, mascara)
+        return {
+            "veredito": "SUCESSO",
+            "regra": "1",
+            "resumo": "Operação liquidada com sucesso.",
+            "analise": f"Status {int(linha['statusmsg'])} encontrado em {linha['origem']} "
+                       f"({linha['codmsg']}, {linha['ts_inclusao']}). Erros anteriores foram superados.",
+        }
+
+    # 2A. TIMEOUT confirmado pelo texto
+    mascara = evidencia_lower.str.contains(TEXTO_TIMEOUT, regex=False)
+    if mascara.any():
+        linha = _primeira(df, mascara)
+        return {
+            "veredito": "TIMEOUT / FALHA TÉCNICA",
+            "regra": "2A",
+            "resumo": "Falha por timeout no Bacen.",
+            "analise": f"Mensagem explícita de timeout em {linha['origem']} ({linha['codmsg']}): "
+                       f"\"{linha['evidencia_erro']}\".",
+        }
+
+    # 2B. ERRO DE CADASTRO
+    mascara = evidencia_lower.apply(lambda texto: any(p in texto for p in PALAVRAS_CADASTRO))
+    if mascara.any():
+        linha = _primeira(df, mascara)
+        return {
+            "veredito": "ERRO OPERACIONAL / CADASTRO",
+            "regra": "2B",
+            "resumo": "Falha operacional/cadastral (dados do participante ou da conta).",
+            "analise": f"Texto de erro em {linha['origem']} ({linha['codmsg']}): \"{linha['evidencia_erro']}\".",
+        }
+
+    # 2C. ERRO DO BACEN: 205 sem texto de timeout
+    mascara = statusop == STATUSOP_BACEN
+    if mascara.any():
+        com_texto = mascara & (evidencia.str.strip() != "")
+        linha = _primeira(df, com_texto if com_texto.any() else mascara)
+        texto = linha['evidencia_erro'] if 'evidencia_erro' in linha and linha['evidencia_erro'] else "sem texto de erro no XML"
+        return {
+            "veredito": "ERRO DE PROCESSAMENTO NO BACEN",
+            "regra": "2C",
+            "resumo": "Erro 205 genérico no processamento do Bacen (sem timeout explícito).",
+            "analise": f"statusop 205 em {linha['origem']} ({linha['codmsg']}). Texto do erro: \"{texto}\".",
+        }
+
+    # 2D. REJEIÇÃO DE NEGÓCIO: 319 (piloto) / 320 (autorizador)
+    mascara = statusmsg.isin(STATUS_REJEICAO)
+    if mascara.any():
+        linha = _primeira(df, mascara)
+        quem = "piloto" if int(linha['statusmsg']) == 319 else "autorizador"
+        return {
+            "veredito": "REJEIÇÃO DE NEGÓCIO",
+            "regra": "2D",
+            "resumo": f"Operação rejeitada pelo {quem}.",
+            "analise": f"statusmsg {int(linha['statusmsg'])} em {linha['origem']} ({linha['codmsg']}, {linha['ts_inclusao']}).",
+        }
+
+    return None
+
+def relatorio_deterministico(decisao, sla):
+    """Relatório no mesmo formato do parecer do LLM (Resumo / Análise / Veredito)."""
+    return (
+        f"**Resumo do Caso:** {decisao['resumo']}\n"
+        f"**Análise Técnica:** {decisao['analise']}\n\n"
+        f"{sla}\n"
+        f"**Veredito Final:** {decisao['veredito']}\n\n"
+        f"_(Veredito por regra {decisao['regra']} — peça \"explique\" para o parecer narrativo da IA.)_"
+    )
+
+def pediu_narrativa(texto):
+    texto = (texto or "").lower()
+    return any(p in texto for p in PALAVRAS_NARRATIVA)
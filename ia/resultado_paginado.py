@@ -0,0 +1,189 @@
+"""
+Execução em streaming do SQL gerado, com cursor nomeado (server-side) no PostgreSQL.
+
+Em vez de `pd.read_sql` puxar o resultado inteiro para a memória, o resultado fica
+no servidor e o agente lê só o necessário:
+- `fetch size` por ida ao banco, `limite de linhas` total por consulta;
+- páginas entregues sob demanda (a TUI pede a próxima com /mais);
+- truncagem de texto vetorizada (sem apply por célula).
+
+Cursores abandonados são fechados por TTL para não prender conexões do pool.
+"""
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+
+import pandas as pd
+
+from db_pool import obter_pool
+
+LIMITE_LINHAS = int(os.getenv("SQL_LIMITE_LINHAS", "1000"))     # Máximo de linhas lidas por consulta
+TAMANHO_PAGINA = int(os.getenv("SQL_TAMANHO_PAGINA", "50"))     # Linhas por página exibida
+FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "200"))            # Linhas por ida ao banco
+CONTAR_TOTAL = os.getenv("SQL_CONTAR_TOTAL", "0") == "1"        # count(*) extra para saber o total exato
+MAX_ABERTOS = int(os.getenv("SQL_CURSORES_ABERTOS", "4"))       # Cursores (= conexões) presos à espera de /mais
+TTL_ABERTO_S = float(os.getenv("SQL_CURSOR_TTL_S", "300"))
+LARGURA_MAXIMA = 50
+
+
+def truncar_colunas(df, largura=LARGURA_MAXIMA):
+    """Limpeza visual vetorizada: remove msgop e corta textos longos com '...'."""
+    if 'msgop' in df.columns:
+        df = df.drop(columns=['msgop'])
+    for col in df.columns:
+        if df[col].dtype == 'object':
+            texto = df[col].astype(str)
+            longos = texto.str.len() > largura
+            if longos.any():
+                df[col] = df[col].where(~longos, texto.str.slice(0, largura) + '...')
+    return df
+
+def linhas_texto(df):
+    """Página como (colunas, linhas de texto) para a tabela da TUI; vazio no lugar de NaN/None."""
+    texto = df.astype(object).where(df.notna(), "").astype(str)
+    return [str(c) for c in df.columns], texto.values.tolist()
+
+
+class ResultadoPaginado:
+    def __init__(self, query, params=None, tamanho_pagina=TAMANHO_PAGINA,
+                 limite_linhas=LIMITE_LINHAS, fetch_size=FETCH_SIZE, contar_total=CONTAR_TOTAL):
+        self.id = uuid.uuid4().hex[:12]
+        self.tamanho_pagina = tamanho_pagina
+        self.limite_linhas = limite_linhas
+        self.fetch_size = max(fetch_size, tamanho_pagina)
+        self.colunas = None
+        self.lidas = 0              # Linhas já entregues
+        self.pagina = 0
+        self.total = None           # Exato se contado ou se o cursor esgotou
+        self.truncado = False       # Bateu no limite e ainda havia linhas
+        self.esgotado = False
+        self.ultimo_uso = time.monotonic()
+        self._buffer = deque()
+        self._lock = threading.Lock()
+
+        self._pool = obter_pool()
+        self._conn = self._pool.obter()
+        try:
+            self.query_exibida = self._conn.cursor().mogrify(query, params).decode() if params else query
+            if contar_total:
+                with self._conn.cursor() as cur:
+                    cur.execute(f"SELECT count(*) FROM ({query.rstrip().rstrip(';')}) q", params)
+                    self.total = cur.fetchone()[0]
+            # Cursor nomeado: DECLARE no servidor, linhas vêm por FETCH sob demanda
+            self._cur = self._conn.cursor(name=f"jarvis_{self.id}")
+            self._cur.itersize = self.fetch_size
+            self._cur.execute(query.rstrip().rstrip(';'), params)
+        except Exception:
+            self._pool.devolver(self._conn)
+            self._conn = None
+            raise
+
+    def _abastecer(self, quantidade):
+        while len(self._buffer) < quantidade and not self.esgotado:
+            linhas = self._cur.fetchmany(self.fetch_size)
+            if self.colunas is None and self._cur.description:
+                self.colunas = [d[0] for d in self._cur.description]
+            self._buffer.extend(linhas)
+            if len(linhas) < self.fetch_size:
+                self.esgotado = True
+
+    def proxima_pagina(self):
+        """Próxima página como DataFrame (já truncado). Vazio quando não há mais nada."""
+        with self._lock:
+            self.ultimo_uso = time.monotonic()
+            if self._conn is None:
+                return pd.DataFrame(columns=self.colunas or [])
+            restante = self.limite_linhas - self.lidas
+            quantidade = min(self.tamanho_pagina, restante)
+            # +1 para descobrir se ainda há linhas além desta página / do limite
+            self._abastecer(quantidade + 1)
+            linhas = [self._buffer.popleft() for _ in range(min(quantidade, len(self._buffer)))]
+            self.lidas += len(linhas)
+            self.pagina += 1
+            if not self._buffer and self.esgotado:
+                self.total = self.lidas if self.total is None else self.total
+                self._fechar()
+            elif self.lidas >= self.limite_linhas:
+                self.truncado = True
+                self._fechar()
+            return truncar_colunas(pd.DataFrame(linhas, columns=self.colunas))
+
+    @property
+    def tem_mais(self):
+        return self._conn is not None
+
+    def resumo(self):
+        """Texto de rodapé: linhas exibidas / total / limite."""
+        if self.total is not None:
+            total = f"{self.total} no total"
+        elif self.truncado:
+            total = f"mais de {self.lidas} (limite de {self.limite_linhas} atingido)"
+        else:
+            total = "total ainda desconhecido"
+        dica = " — digite /mais para a próxima página" if self.tem_mais else ""
+        return f"📄 Página {self.pagina}: {self.lidas} linhas exibidas, {total}{dica}"
+
+    def _fechar(self):
+        if self._conn is None:
+            return
+        try:
+            self._cur.close()
+        except Exception:
+            pass
+        self._pool.devolver(self._conn)
+        self._conn = None
+
+    def fechar(self):
+        with self._lock:
+            self._fechar()
+
+
+# --- Registro de resultados abertos (API para a TUI) ---
+
+_abertos = OrderedDict()   # id -> ResultadoPaginado
+_abertos_lock = threading.Lock()
+
+def _limpar_abandonados():
+    agora = time.monotonic()
+    with _abertos_lock:
+        vencidos = [r for r in _abertos.values() if not r.tem_mais or agora - r.ultimo_uso > TTL_ABERTO_S]
+        for r in vencidos:
+            _abertos.pop(r.id, None)
+        while len(_abertos) >= MAX_ABERTOS:
+            vencidos.append(_abertos.popitem(last=False)[1])
+    for r in vencidos:
+        r.fechar()
+
+def abrir_resultado(query, params=None, **opcoes):
+    """Executa a query e devolve (resultado, primeira página)."""
+    _limpar_abandonados()
+    resultado = ResultadoPaginado(query, params, **opcoes)
+    try:
+        pagina = resultado.proxima_pagina()
+    except Exception:
+        resultado.fechar()
+        raise
+    if resultado.tem_mais:
+        with _abertos_lock:
+            _abertos[resultado.id] = resultado
+    return resultado, pagina
+
+def proxima_pagina(resultado_id):
+    """Para a TUI: (DataFrame, rodapé) da próxima página, ou (None, aviso) se expirou/acabou."""
+    with _abertos_lock:
+        resultado = _abertos.get(resultado_id)
+    if resultado is None or not resultado.tem_mais:
+        return None, "⚠️ Não há mais páginas para este resultado (acabou ou expirou)."
+    pagina = resultado.proxima_pagina()
+    if not resultado.tem_mais:
+        with _abertos_lock:
+            _abertos.pop(resultado_id, None)
+    return pagina, resultado.resumo()
+
+def fechar_resultado(resultado_id):
+    with _abertos_lock:
+        resultado = _abertos.pop(resultado_id, None)
+    if resultado:
+        resultado.fechar()
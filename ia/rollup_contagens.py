@@ -0,0 +1,394 @@
+"""
+Rollups por minuto para as perguntas de contagem (quantas por status, timeouts por hora...).
+
+Sem isso, cada contagem faz COUNT(*) sobre o UNION ALL da view_universal, e o
+CAST(statusmsg AS INTEGER) impede o uso de índice.
+
+- forense.rollup_minuto: qtd por (minuto, origem, statusop, statusmsg, codmsg);
+- Atualização incremental a partir do watermark de ts_inclusao (forense.rollup_watermark),
+  em blocos, numa transação por bloco (mesmo esquema do backfill_motivos.py). Só entram
+  minutos fechados há mais de ROLLUP_ATRASO_S;
+- Reescrita automática (`reescrever_contagem`): um SELECT count(*) ... FROM view_universal
+  com filtros só em origem/statusop/statusmsg/codmsg/ts_inclusao e GROUP BY nessas colunas
+  (ou date_trunc de ts_inclusao) passa a ler os minutos inteiros do rollup. As bordas
+  parciais da janela e a cauda ainda não consolidada (após o watermark) vêm das tabelas base.
+
+Uso:
+    python rollup_contagens.py --preparar               # Cria schema, tabelas e índices
+    python rollup_contagens.py                          # Consolida o que falta e sai
+    python rollup_contagens.py --intervalo 60           # Modo contínuo
+    python rollup_contagens.py --recalcular-desde 2025-11-01   # Reprocessa (ex.: carga atrasada)
+"""
+import os
+import re
+import sys
+import time
+import argparse
+from datetime import timedelta
+
+from db_pool import conexao_db
+from indices_nuop import aplicar_ddl
+
+TABELA_ROLLUP = "forense.rollup_minuto"
+TABELA_WATERMARK = "forense.rollup_watermark"
+
+# origem (valores da CTE_UNIVERSAL) -> tabela base
+FONTES = {"PIX": "pix.operacao", "STR": "str.operacao"}
+
+ROLLUP_CONSULTAS = os.getenv("ROLLUP_CONSULTAS", "1") == "1"       # Reescrita das contagens
+ROLLUP_ATRASO_S = int(os.getenv("ROLLUP_ATRASO_S", "120"))           # Folga para gravações atrasadas
+ROLLUP_BLOCO = os.getenv("ROLLUP_BLOCO", "1 day")                    # Janela por transação
+PAUSA_INDISPONIVEL_S = 60   # Sem tabelas/watermark: não tenta reescrever de novo por um tempo
+
+DIMENSOES = ("origem", "statusop", "statusmsg", "codmsg")
+UNIDADES_DATE_TRUNC = ("minute", "hour", "day", "week", "month", "quarter", "year")
+
+
+def gerar_ddl():
+    ddl = [
+        "CREATE SCHEMA IF NOT EXISTS forense",
+        f"""CREATE TABLE IF NOT EXISTS {TABELA_ROLLUP} (
+            minuto timestamp NOT NULL,
+            origem text NOT NULL,
+            statusop smallint,
+            statusmsg integer,
+            codmsg text,
+            qtd bigint NOT NULL
+        )""",
+        f"CREATE INDEX IF NOT EXISTS idx_rollup_minuto ON {TABELA_ROLLUP} (minuto, origem)",
+        f"""CREATE TABLE IF NOT EXISTS {TABELA_WATERMARK} (
+            origem text PRIMARY KEY,
+            ate timestamp NOT NULL,
+            atualizado_em timestamptz NOT NULL DEFAULT now()
+        )""",
+    ]
+    # Range scan por ts_inclusao nas tabelas base (mesmo índice do keyset do backfill)
+    for tabela in FONTES.values():
+        nome = f"idx_{tabela.split('.')[-1]}_keyset"
+        ddl.append(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nome} ON {tabela} (ts_inclusao, msgid)")
+    return ddl
+
+
+# --- Atualização incremental ---
+
+def _limites(conn, origem, tabela, atraso_s):
+    """(de, ate): do watermark (ou do primeiro minuto com dado) até o último minuto fechado."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT ate FROM {TABELA_WATERMARK} WHERE origem = %s", (origem,))
+        linha = cur.fetchone()
+        cur.execute(
+            f"""SELECT date_trunc('minute', min(ts_inclusao)),
+                       date_trunc('minute', least(max(ts_inclusao), (now() - %s * interval '1 second')::timestamp))
+                FROM {tabela}""",
+            (atraso_s,),
+        )
+        primeiro, ate = cur.fetchone()
+    return (linha[0] if linha else primeiro), ate
+
+def consolidar_origem(origem, atraso_s=ROLLUP_ATRASO_S, bloco=ROLLUP_BLOCO):
+    """Consolida os minutos fechados de uma origem, bloco a bloco. Retorna minutos-grupo gravados."""
+    tabela = FONTES[origem]
+    gravados = 0
+    with conexao_db(somente_leitura=False) as conn:
+        de, ate = _limites(conn, origem, tabela, atraso_s)
+        conn.commit()
+        if de is None or ate is None:
+            return 0
+        while de < ate:
+            with conn.cursor() as cur:
+                cur.execute("SELECT least(%s + %s::interval, %s)", (de, bloco, ate))
+                fim = cur.fetchone()[0]
+                # DELETE antes do INSERT: reprocessar um bloco (--recalcular-desde) não duplica
+                cur.execute(f"DELETE FROM {TABELA_ROLLUP} WHERE origem = %s AND minuto >= %s AND minuto < %s",
+                            (origem, de, fim))
+                cur.execute(
+                    f"""INSERT INTO {TABELA_ROLLUP} (minuto, origem, statusop, statusmsg, codmsg, qtd)
+                        SELECT date_trunc('minute', ts_inclusao), %s, statusop, CAST(statusmsg AS INTEGER), codmsg, count(*)
+                        FROM {tabela}
+                        WHERE ts_inclusao >= %s AND ts_inclusao < %s
+                        GROUP BY 1, 3, 4, 5""",
+                    (origem, de, fim),
+                )
+                gravados += cur.rowcount
+                cur.execute(
+                    f"""INSERT INTO {TABELA_WATERMARK} (origem, ate) VALUES (%s, %s)
+                        ON CONFLICT (origem) DO UPDATE SET ate = EXCLUDED.ate, atualizado_em = now()""",
+                    (origem, fim),
+                )
+            conn.commit()
+            de = fim
+    return gravados
+
+def recalcular_desde(ts):
+    """Recua o watermark (nunca avança): a próxima rodada reprocessa a partir de `ts`."""
+    with conexao_db(somente_leitura=False) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"UPDATE {TABELA_WATERMARK} SET ate = least(ate, %s::timestamp), atualizado_em = now()", (ts,))
+        conn.commit()
+
+def executar(origens, atraso_s=ROLLUP_ATRASO_S, bloco=ROLLUP_BLOCO):
+    resumo = {}
+    for origem in origens:
+        inicio = time.perf_counter()
+        try:
+            resumo[origem] = consolidar_origem(origem, atraso_s, bloco)
+            print(f"✅ {origem}: {resumo[origem]} grupos por minuto em {time.perf_counter() - inicio:.1f}s")
+        except Exception as e:
+            print(f"❌ {origem}: {str(e).strip()}")
+            resumo[origem] = None
+    return resumo
+
+
+# --- Reescrita das contagens ---
+
+_RE_CLAUSULAS = re.compile(
+    r"^\s*SELECT\s+(?P<select>.+?)\s+FROM\s+view_universal"
+    r"(?:\s+WHERE\s+(?P<where>.+?))?"
+    r"(?:\s+GROUP\s+BY\s+(?P<group>.+?))?"
+    r"(?:\s+HAVING\s+(?P<having>.+?))?"
+    r"(?:\s+ORDER\s+BY\s+(?P<order>.+?))?"
+    r"(?:\s+LIMIT\s+(?P<limit>\S+?))?"
+    r"\s*;?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_VALOR = r"(?:'(?:[^']|'')*'|-?\d+|%\(\w+\)s)"
+_RE_COND_DIMENSAO = re.compile(
+    rf"^(?:{'|'.join(DIMENSOES)})\s*(?:=|<>|!=|>=|<=|>|<)\s*{_VALOR}$"
+    rf"|^(?:{'|'.join(DIMENSOES)})\s+(?:NOT\s+)?IN\s*\(\s*{_VALOR}(?:\s*,\s*{_VALOR})*\s*\)$",
+    re.IGNORECASE,
+)
+_RE_COND_TS = re.compile(r"^ts_inclusao\s*(>=|>|<=|<)\s*(.+)$", re.IGNORECASE | re.DOTALL)
+# Limite de tempo constante: literais, parâmetros e funções de data (nenhuma coluna)
+_RE_LIMITE_TS = re.compile(
+    r"^(?:\s|\d|[-+*/(),.:]|'(?:[^']|'')*'|%\(\w+\)s|now|current_timestamp|current_date|localtimestamp"
+    r"|interval|timestamp|date|date_trunc)+$",
+    re.IGNORECASE,
+)
+_RE_CONTAGEM = re.compile(r"\bcount\s*\(\s*(?:\*|1)\s*\)", re.IGNORECASE)
+_RE_ALIAS = re.compile(r"^(?P<expr>.+?)(?:\s+AS\s+(?P<alias>\w+))?$", re.IGNORECASE | re.DOTALL)
+_RE_AGRUPAVEL = re.compile(
+    rf"^(?:{'|'.join(DIMENSOES)}|date_trunc\('(?:{'|'.join(UNIDADES_DATE_TRUNC)})',ts_inclusao\))$"
+)
+
+_indisponivel_ate = 0.0
+
+
+def _mascarar(sql):
+    """Mesmo comprimento; o que está entre aspas ou dentro de parênteses vira '_' (palavras-chave só no topo)."""
+    saida, nivel, aspas = [], 0, False
+    for c in sql:
+        if aspas:
+            aspas = c != "'"
+            saida.append("_")
+        elif c == "'":
+            aspas = True
+            saida.append("_")
+        elif c == "(":
+            nivel += 1
+            saida.append("_")
+        elif c == ")":
+            nivel -= 1
+            saida.append("_")
+        else:
+            saida.append(c if nivel == 0 else "_")
+    return "".join(saida)
+
+def _dividir(trecho, separador):
+    """Divide `trecho` no separador (regex) só no nível de topo."""
+    mascarado = _mascarar(trecho)
+    partes, inicio = [], 0
+    for m in re.finditer(separador, mascarado, re.IGNORECASE):
+        partes.append(trecho[inicio:m.start()].strip())
+        inicio = m.end()
+    partes.append(trecho[inicio:].strip())
+    return partes
+
+def _sem_parenteses_externos(cond):
+    """'(statusmsg = 319)' -> 'statusmsg = 319' (só quando o par envolve a condição inteira)."""
+    cond = cond.strip()
+    while cond.startswith("(") and cond.endswith(")"):
+        nivel = 0
+        for i, c in enumerate(_mascarar_aspas(cond)):
+            nivel += {"(": 1, ")": -1}.get(c, 0)
+            if nivel == 0 and i < len(cond) - 1:
+                return cond
+        cond = cond[1:-1].strip()
+    return cond
+
+def _mascarar_aspas(sql):
+    """Mesmo comprimento; só o conteúdo entre aspas vira '_'."""
+    return re.sub(r"'(?:[^']|'')*'", lambda m: "_" * len(m.group()), sql)
+
+def _normalizar_expr(expr):
+    return re.sub(r"\s+", "", expr).lower()
+
+def _piso_minuto(ts):
+    return ts.replace(second=0, microsecond=0)
+
+def _analisar(sql):
+    """Decompõe a contagem ou devolve None se o formato não for coberto pelo rollup."""
+    if "%" in re.sub(r"%\(\w+\)s", "", sql):
+        return None   # LIKE/curingas ou % literal: não é contagem por dimensão
+    m = _RE_CLAUSULAS.match(_mascarar(sql))
+    if not m:
+        return None
+    partes = {nome: (sql[m.start(nome):m.end(nome)] if m.group(nome) else None) for nome in m.groupdict()}
+
+    # SELECT: count(*) e expressões do GROUP BY (com alias opcional)
+    itens = _dividir(partes["select"], ",")
+    por_alias = {}
+    for item in itens:
+        m = _RE_ALIAS.match(item)
+        if m.group("alias"):
+            por_alias[m.group("alias").lower()] = m.group("expr")
+    grupos = []
+    for g in (_dividir(partes["group"], ",") if partes["group"] else []):
+        if g.isdigit() and 0 < int(g) <= len(itens):
+            g = _RE_ALIAS.match(itens[int(g) - 1]).group("expr")   # GROUP BY 1
+        grupos.append(por_alias.get(g.lower(), g))                 # GROUP BY hora (alias do SELECT)
+    normalizados = {_normalizar_expr(g) for g in grupos}
+    if not all(_RE_AGRUPAVEL.match(g) for g in normalizados):
+        return None
+    tem_contagem = False
+    for item in itens:
+        expr = _RE_ALIAS.match(item).group("expr")
+        if _RE_CONTAGEM.fullmatch(expr.strip()):
+            tem_contagem = True
+        elif _normalizar_expr(expr) not in normalizados:
+            return None
+    if not tem_contagem:
+        return None
+
+    # WHERE: só AND de condições simples em dimensões e limites constantes de ts_inclusao
+    dimensoes, limites = [], []
+    if partes["where"]:
+        if re.search(r"\b(OR|BETWEEN|NOT\s+\()", _mascarar(partes["where"]), re.IGNORECASE):
+            return None
+        for cond in _dividir(partes["where"], r"\bAND\b"):
+            cond = _sem_parenteses_externos(cond)
+            if _RE_COND_DIMENSAO.match(cond):
+                dimensoes.append(cond)
+                continue
+            ts = _RE_COND_TS.match(cond)
+            if ts and _RE_LIMITE_TS.match(ts.group(2)):
+                limites.append((ts.group(1), ts.group(2).strip()))
+                continue
+            return None
+    for clausula in ("having", "order"):
+        if partes[clausula] and re.search(r"\bcount\s*\(\s*(?!\*|1\s*\))", partes[clausula], re.IGNORECASE):
+            return None
+    return partes, dimensoes, limites
+
+def reescrever_contagem(sql, params=None):
+    """
+    (sql, params) reescritos para ler do rollup, ou None (formato não coberto,
+    rollup ausente ou janela sem nenhum minuto consolidado). Resultado idêntico ao original.
+    """
+    global _indisponivel_ate
+    if not ROLLUP_CONSULTAS or time.monotonic() < _indisponivel_ate:
+        return None
+    analise = _analisar(sql)
+    if not analise:
+        return None
+    partes, dimensoes, limites = analise
+
+    # Watermark e valores dos limites de tempo numa ida ao banco (now() avaliado uma vez só)
+    colunas = ", ".join([f"(SELECT min(ate) FROM {TABELA_WATERMARK})",
+                         f"(SELECT count(*) FROM {TABELA_WATERMARK})"] +
+                        [f"({expr})::timestamp" for _, expr in limites])
+    try:
+        with conexao_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT {colunas}", params or None)
+                watermark, origens, *valores = cur.fetchone()
+    except Exception as e:
+        print(f"   ➤ Rollup indisponível ({str(e).strip().splitlines()[0]})")
+        _indisponivel_ate = time.monotonic() + PAUSA_INDISPONIVEL_S
+        return None
+    if watermark is None or origens < len(FONTES):
+        _indisponivel_ate = time.monotonic() + PAUSA_INDISPONIVEL_S
+        return None
+
+    # [de, ate): minutos inteiros dentro da janela e já consolidados
+    um_minuto = timedelta(minutes=1)
+    de, ate = None, watermark
+    novos_params = dict(params or {})
+    conds_ts = []
+    for i, ((operador, _), valor) in enumerate(zip(limites, valores)):
+        if valor is None:
+            return None
+        nome = f"rollup_limite_{i}"
+        novos_params[nome] = valor
+        conds_ts.append(f"ts_inclusao {operador} %({nome})s")
+        piso = _piso_minuto(valor)
+        if operador == ">=":
+            candidato = piso if piso == valor else piso + um_minuto
+            de = candidato if de is None else max(de, candidato)
+        elif operador == ">":
+            de = piso + um_minuto if de is None else max(de, piso + um_minuto)
+        elif operador == "<":
+            ate = min(ate, piso)
+        else:
+            ate = min(ate, _piso_minuto(valor + timedelta(microseconds=1)))
+    if de is not None and de >= ate:
+        return None
+    novos_params["rollup_ate"] = ate
+    if de is not None:
+        novos_params["rollup_de"] = de
+
+    filtro_rollup = ["minuto < %(rollup_ate)s"] + (["minuto >= %(rollup_de)s"] if de is not None else []) + dimensoes
+    fora_rollup = "ts_inclusao >= %(rollup_ate)s" + (" OR ts_inclusao < %(rollup_de)s" if de is not None else "")
+    if not limites:
+        # Sem limite de tempo o original conta também ts_inclusao nulo (nenhum minuto no rollup)
+        fora_rollup += " OR ts_inclusao IS NULL"
+    filtro_base = conds_ts + dimensoes + [f"({fora_rollup})"]
+
+    itens = []
+    for item in _dividir(partes["select"], ","):
+        m = _RE_ALIAS.match(item)
+        if _RE_CONTAGEM.fullmatch(m.group("expr").strip()):
+            # Mesmo nome de coluna do original (count(*) sem alias se chama "count")
+            item = f"COALESCE(sum(qtd), 0)::bigint AS {m.group('alias') or 'count'}"
+        itens.append(item)
+    select = ", ".join(itens)
+    consulta = (
+        f"SELECT {select} FROM (\n"
+        f"    SELECT minuto AS ts_inclusao, origem, statusop, statusmsg, codmsg, qtd FROM {TABELA_ROLLUP}\n"
+        f"    WHERE {' AND '.join(filtro_rollup)}\n"
+        f"    UNION ALL\n"
+        f"    SELECT ts_inclusao, origem, statusop, statusmsg, codmsg, 1::bigint FROM view_universal\n"
+        f"    WHERE {' AND '.join(filtro_base)}\n"
+        f") view_universal"
+    )
+    if partes["group"]:
+        consulta += f"\nGROUP BY {partes['group']}"
+    for clausula, palavra in (("having", "HAVING"), ("order", "ORDER BY")):
+        if partes[clausula]:
+            consulta += f"\n{palavra} {_RE_CONTAGEM.sub('COALESCE(sum(qtd), 0)::bigint', partes[clausula])}"
+    if partes["limit"]:
+        consulta += f"\nLIMIT {partes['limit']}"
+    return consulta + ";", novos_params
+
+def main():
+    parser = argparse.ArgumentParser(description="Rollups por minuto das contagens (forense.rollup_minuto).")
+    parser.add_argument("--preparar", action="store_true", help="Cria schema, tabelas e índices e sai")
+    parser.add_argument("--origens", nargs="*", default=list(FONTES), choices=list(FONTES))
+    parser.add_argument("--atraso", type=int, default=ROLLUP_ATRASO_S, help="Segundos de folga antes de fechar um minuto")
+    parser.add_argument("--bloco", default=ROLLUP_BLOCO, help="Intervalo por transação (ex.: '6 hours')")
+    parser.add_argument("--recalcular-desde", help="Recua o watermark para reprocessar a partir deste timestamp")
+    parser.add_argument("--intervalo", type=float, help="Modo contínuo: segundos entre rodadas incrementais")
+    args = parser.parse_args()
+
+    if args.preparar:
+        return 1 if aplicar_ddl(gerar_ddl()) else 0
+    if args.recalcular_desde:
+        recalcular_desde(args.recalcular_desde)
+
+    while True:
+        resumo = executar(args.origens, args.atraso, args.bloco)
+        if args.intervalo is None:
+            return 1 if any(v is None for v in resumo.values()) else 0
+        time.sleep(args.intervalo)
+
+if __name__ == "__main__":
+    sys.exit(main())
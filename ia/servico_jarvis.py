@@ -0,0 +1,297 @@
+"""
+Modo serviço (headless) do Jarvis: API HTTP/JSON sobre o grafo compilado do agente_spb.
+
+Um processo atende o time inteiro (pipeline de alertas, scripts, outras ferramentas)
+em vez de cada analista rodar a própria TUI:
+- Concorrência limitada (execuções simultâneas do grafo) + fila de espera limitada;
+- Backpressure: fila cheia, pool do Postgres com gente esperando ou Ollama com
+  chamadas demais em andamento -> 503 com Retry-After (quem chama tenta depois);
+- Timeout por requisição (504);
+- Lote: várias perguntas numa chamada, respeitando os mesmos limites;
+- Sessões opcionais ('sessao_id'): histórico e último NUOP ficam no checkpointer
+  do serviço, como na TUI; sem sessão, o cliente manda o próprio 'historico'.
+
+Uso:
+    python servico_jarvis.py --porta 8765
+    python servico_jarvis.py --uds /tmp/jarvis.sock --concorrencia 8 --fila 32 --timeout 120
+
+    curl -s localhost:8765/perguntar -H 'Content-Type: application/json' \\
+         -d '{"pergunta": "quantas rejeitadas pelo autorizador hoje?"}'
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from langchain_core.callbacks import BaseCallbackHandler
+
+from agente_spb import app as agente_graph, construir_app, aquecer_modelo
+from db_pool import POOL_MAX, metricas_pool
+from metricas import exportar_prometheus
+from resultado_paginado import proxima_pagina
+from sessoes import CheckpointerPersistente, entrada_turno, DIR_JARVIS
+
+CONCORRENCIA = int(os.getenv("SERVICO_CONCORRENCIA", str(POOL_MAX)))   # Grafos rodando ao mesmo tempo
+FILA_MAXIMA = int(os.getenv("SERVICO_FILA", "32"))                      # Esperando vaga; além disso -> 503
+TIMEOUT_S = float(os.getenv("SERVICO_TIMEOUT_S", "120"))
+LLM_MAXIMO = int(os.getenv("SERVICO_LLM_MAXIMO", "4"))                  # Chamadas ao Ollama em andamento
+LOTE_MAXIMO = int(os.getenv("SERVICO_LOTE_MAXIMO", "100"))
+RETRY_AFTER_S = 5
+# Arquivo próprio: TUI e serviço no mesmo diretório não sobrescrevem as sessões um do outro
+SESSOES_ARQUIVO = os.getenv("SERVICO_SESSOES_ARQUIVO", os.path.join(DIR_JARVIS, "sessoes_servico.pkl"))
+
+# Campos do AgentState devolvidos na resposta (o DataFrame da timeline não vai para o JSON)
+CAMPOS_RESPOSTA = [
+    "tipo_fluxo", "nuop_id", "relatorio_final",
+    "sql_executado", "sql_resultado", "sql_erro", "sql_resultado_id", "sql_linhas", "sql_total",
+]
+
+
+class Saturado(Exception):
+    """Serviço sem capacidade agora (fila, Postgres ou Ollama): o cliente deve tentar depois."""
+
+
+class ContadorLLM(BaseCallbackHandler):
+    """Callback do LangChain que conta chamadas ao modelo em andamento (sinal de saturação do Ollama)."""
+
+    run_inline = True  # Conta na hora, sem passar pelo executor
+
+    def __init__(self):
+        self.em_andamento = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        with self._lock:
+            self.em_andamento += 1
+            self.total += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.on_chat_model_start(serialized, prompts)
+
+    def _terminou(self):
+        with self._lock:
+            self.em_andamento = max(0, self.em_andamento - 1)
+
+    def on_llm_end(self, response, **kwargs):
+        self._terminou()
+
+    def on_llm_error(self, error, **kwargs):
+        self._terminou()
+
+
+class ServicoAgente:
+    """Controle de admissão + execução do grafo com limite de concorrência e timeout."""
+
+    def __init__(self, concorrencia=CONCORRENCIA, fila_maxima=FILA_MAXIMA,
+                 timeout_s=TIMEOUT_S, llm_maximo=LLM_MAXIMO, arquivo_sessoes=SESSOES_ARQUIVO):
+        # Muitas sessões em paralelo: agrupa as gravações do checkpointer (no máximo 1/s)
+        self.grafo_sessoes = construir_app(CheckpointerPersistente(arquivo_sessoes, intervalo_gravacao_s=1.0))
+        self.concorrencia = concorrencia
+        self.fila_maxima = fila_maxima
+        self.timeout_s = timeout_s
+        self.llm_maximo = llm_maximo
+        self.llm = ContadorLLM()
+        self._vagas = asyncio.Semaphore(concorrencia)
+        self._em_execucao = 0
+        self._na_fila = 0
+        self._metricas = {"atendidas": 0, "erros": 0, "timeouts": 0, "rejeitadas": 0}
+        self.modelo = "aquecendo"   # Estado do warm-up do Ollama (GET /saude)
+
+    def motivo_saturacao(self, novas=1):
+        """None se cabe mais `novas` requisições; senão o motivo do 503."""
+        if self._na_fila + novas > self.fila_maxima + max(0, self.concorrencia - self._em_execucao):
+            return f"fila cheia ({self._na_fila} aguardando, máximo {self.fila_maxima})"
+        leitura = metricas_pool().get("leitura")
+        if leitura and leitura["aguardando"] > 0:
+            return f"Postgres saturado ({leitura['aguardando']} esperando conexão, pool máximo {leitura['maximo']})"
+        if self.llm.em_andamento >= self.llm_maximo:
+            return f"Ollama saturado ({self.llm.em_andamento} gerações em andamento)"
+        return None
+
+    def admitir(self, novas=1):
+        motivo = self.motivo_saturacao(novas)
+        if motivo:
+            self._metricas["rejeitadas"] += novas
+            raise Saturado(motivo)
+
+    async def executar(self, pergunta, historico="", timeout_s=None, sessao_id=None):
+        """Roda o grafo uma vez (já admitido). Timeout conta a espera na fila + execução."""
+        timeout_s = min(timeout_s or self.timeout_s, self.timeout_s)
+        inicio = time.perf_counter()
+        self._na_fila += 1
+        try:
+            await asyncio.wait_for(self._vagas.acquire(), timeout_s)
+        except asyncio.TimeoutError:
+            self._metricas["timeouts"] += 1
+            raise
+        finally:
+            self._na_fila -= 1
+        self._em_execucao += 1
+        try:
+            restante = max(0.001, timeout_s - (time.perf_counter() - inicio))
+            config = {"callbacks": [self.llm]}
+            if sessao_id:
+                grafo, entrada = self.grafo_sessoes, entrada_turno(pergunta)
+                config["configurable"] = {"thread_id": sessao_id}
+            else:
+                grafo, entrada = agente_graph, {"input_usuario": pergunta, "historico": historico or ""}
+            # Cancelar aqui interrompe o HTTP do Ollama; o SQL em andamento termina
+            # sozinho (statement_timeout do pool) e a conexão volta para o pool
+            estado = await asyncio.wait_for(grafo.ainvoke(entrada, config=config), restante)
+            self._metricas["atendidas"] += 1
+        except asyncio.TimeoutError:
+            self._metricas["timeouts"] += 1
+            raise
+        except Exception:
+            self._metricas["erros"] += 1
+            raise
+        finally:
+            self._em_execucao -= 1
+            self._vagas.release()
+        resposta = {campo: estado.get(campo) for campo in CAMPOS_RESPOSTA}
+        resposta["ultimo_nuop"] = estado.get("ultimo_nuop")
+        resposta["duracao_s"] = round(time.perf_counter() - inicio, 3)
+        return resposta
+
+    def estado(self):
+        return {
+            "em_execucao": self._em_execucao,
+            "na_fila": self._na_fila,
+            "concorrencia": self.concorrencia,
+            "fila_maxima": self.fila_maxima,
+            "llm_em_andamento": self.llm.em_andamento,
+            "llm_chamadas": self.llm.total,
+            "modelo": self.modelo,
+            **self._metricas,
+            "pool": metricas_pool(),
+        }
+
+
+# --- API ---
+
+class Pergunta(BaseModel):
+    pergunta: str
+    historico: Optional[str] = ""
+    sessao_id: Optional[str] = None
+    timeout_s: Optional[float] = None
+
+class Lote(BaseModel):
+    perguntas: List[Pergunta] = Field(..., min_length=1)
+
+def _erro_saturado(e):
+    return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": str(RETRY_AFTER_S)})
+
+def criar_api(servico=None):
+    estado = {}
+
+    @asynccontextmanager
+    async def ciclo_de_vida(api):
+        # Threads dos nós de banco/CPU (asyncio.to_thread) limitadas ao que o pool aguenta
+        estado["servico"] = srv = servico or ServicoAgente()
+        executor = ThreadPoolExecutor(max_workers=max(4, srv.concorrencia * 2), thread_name_prefix="jarvis")
+        asyncio.get_running_loop().set_default_executor(executor)
+
+        async def aquecer():
+            # Em segundo plano: o serviço já atende (fast-path, NUOP por regra) enquanto o modelo carrega
+            ok, detalhe = await asyncio.to_thread(aquecer_modelo)
+            srv.modelo = f"pronto: {detalhe}" if ok else f"indisponível: {detalhe}"
+            print(f"🧠 Modelo {srv.modelo}")
+        aquecimento = asyncio.create_task(aquecer())
+        yield
+        aquecimento.cancel()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    api = FastAPI(title="Jarvis SPB (headless)", lifespan=ciclo_de_vida)
+
+    @api.get("/saude")
+    async def saude():
+        return estado["servico"].estado()
+
+    @api.get("/metricas", response_class=PlainTextResponse)
+    async def metricas():
+        """Formato texto do Prometheus: latência por nó, tokens, banco, retries, DataFrames."""
+        return exportar_prometheus()
+
+    @api.post("/perguntar")
+    async def perguntar(req: Pergunta):
+        srv = estado["servico"]
+        try:
+            srv.admitir()
+            return await srv.executar(req.pergunta, req.historico, req.timeout_s, req.sessao_id)
+        except Saturado as e:
+            return _erro_saturado(e)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Tempo limite da requisição excedido.")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @api.post("/lote")
+    async def lote(req: Lote):
+        """Admite o lote inteiro ou nada; cada item responde com o próprio status."""
+        srv = estado["servico"]
+        if len(req.perguntas) > LOTE_MAXIMO:
+            raise HTTPException(status_code=413, detail=f"Lote acima do máximo ({LOTE_MAXIMO}).")
+        try:
+            srv.admitir(len(req.perguntas))
+        except Saturado as e:
+            return _erro_saturado(e)
+
+        async def um(item):
+            try:
+                return {"status": 200, **await srv.executar(item.pergunta, item.historico, item.timeout_s, item.sessao_id)}
+            except asyncio.TimeoutError:
+                return {"status": 504, "detail": "Tempo limite da requisição excedido."}
+            except Exception as e:
+                return {"status": 500, "detail": str(e)}
+
+        return {"resultados": await asyncio.gather(*(um(item) for item in req.perguntas))}
+
+    @api.delete("/sessao/{sessao_id}")
+    async def encerrar_sessao(sessao_id: str):
+        """Esquece histórico e último NUOP da sessão (o /nova da TUI)."""
+        await asyncio.to_thread(estado["servico"].grafo_sessoes.checkpointer.delete_thread, sessao_id)
+        return {"sessao_id": sessao_id, "encerrada": True}
+
+    @api.get("/resultado/{resultado_id}/proxima")
+    async def pagina(resultado_id: str):
+        """Próxima página de um resultado SQL com cursor aberto (o mesmo /mais da TUI)."""
+        df, rodape = await asyncio.to_thread(proxima_pagina, resultado_id)
+        if df is None:
+            raise HTTPException(status_code=404, detail=rodape)
+        return {"linhas": df.to_dict(orient="records"), "rodape": rodape}
+
+    return api
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Jarvis SPB em modo serviço (HTTP/JSON).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--uds", help="Escuta num Unix socket em vez de TCP")
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA)
+    parser.add_argument("--fila", type=int, default=FILA_MAXIMA)
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_S, help="Segundos por requisição")
+    parser.add_argument("--llm-maximo", type=int, default=LLM_MAXIMO)
+    parser.add_argument("--sessoes", default=SESSOES_ARQUIVO, help="Arquivo das sessões ('' = só memória)")
+    args = parser.parse_args()
+
+    servico = ServicoAgente(args.concorrencia, args.fila, args.timeout, args.llm_maximo, args.sessoes)
+    api = criar_api(servico)
+    if args.uds:
+        uvicorn.run(api, uds=args.uds, log_level="warning")
+    else:
+        uvicorn.run(api, host=args.host, port=args.porta, log_level="warning")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
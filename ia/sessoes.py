@@ -0,0 +1,261 @@
+"""
+Estado de conversa por sessão (substitui a lista chat_memory compartilhada da TUI).
+
+- Histórico em ring buffer (últimos N turnos, resumidos) dentro do próprio AgentState;
+- Compactação por orçamento de tokens na hora de montar o texto para o prompt:
+  turnos recentes completos, antigos só com a pergunta, os mais velhos saem;
+- Slot estruturado 'ultimo_nuop': "esse"/"dessa" são resolvidos pelo router sem o
+  LLM reler o histórico;
+- Checkpointer do LangGraph persistido em disco (sessão = thread_id), então a
+  conversa sobrevive a reinícios da TUI/serviço.
+"""
+import os
+import re
+import time
+import atexit
+import asyncio
+import pickle
+import threading
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from cache_sql import normalizar_pergunta, usa_contexto
+
+HISTORICO_TURNOS = int(os.getenv("SESSAO_HISTORICO_TURNOS", "10"))      # Tamanho do ring buffer
+HISTORICO_TOKENS = int(os.getenv("SESSAO_HISTORICO_TOKENS", "600"))     # Orçamento do texto no prompt
+# Fora do diretório corrente: o arquivo é lido com pickle, então só o do próprio usuário
+DIR_JARVIS = os.getenv("JARVIS_DIR", os.path.join(os.path.expanduser("~"), ".jarvis"))
+SESSOES_ARQUIVO = os.getenv("SESSOES_ARQUIVO", os.path.join(DIR_JARVIS, "sessoes_jarvis.pkl"))   # Vazio = só memória
+SESSOES_INTERVALO_S = float(os.getenv("SESSOES_INTERVALO_S", "1.0"))   # Junta as gravações de um turno numa só
+SESSOES_MAXIMAS = int(os.getenv("SESSOES_MAXIMAS", "200"))
+CHECKPOINTS_POR_SESSAO = 3   # Só o último importa para retomar; o resto é margem
+
+# Campos que valem só para um turno: zerados na entrada de cada pergunta, senão
+# o checkpointer traria o sql_erro/relatorio_final da pergunta anterior
+CAMPOS_DO_TURNO = [
+    "tipo_fluxo", "sql_query", "sql_erro", "sql_resultado", "sql_executado", "sql_params", "sql_original",
+    "sql_resultado_id", "sql_linhas", "sql_total", "sql_pagina", "sql_cache_chave", "sql_do_cache", "sql_plano",
+    "sql_pre_validacao",
+    "nuop_id", "busca_parcial", "narrativa_solicitada", "dados_nuop", "relatorio_final",
+]
+
+_RE_NUOP = re.compile(r'\b[a-zA-Z0-9]{20,35}\b')
+
+
+def estimar_tokens(texto):
+    """Aproximação barata (~4 caracteres por token), suficiente para orçamento."""
+    return len(texto or "") // 4 + 1
+
+def entrada_turno(pergunta):
+    """Entrada do grafo para uma nova pergunta numa sessão com checkpointer."""
+    entrada = {campo: None for campo in CAMPOS_DO_TURNO}
+    entrada.update({"input_usuario": pergunta, "tentativas": 0})
+    return entrada
+
+def resumir_turno(pergunta, estado):
+    """Um turno vira um registro pequeno (o ring buffer guarda isso, não o resultado inteiro)."""
+    turno = {"pergunta": pergunta, "nuop": estado.get("nuop_id")}
+    if estado.get("relatorio_final"):
+        turno["resposta"] = "AI Analysis: " + str(estado["relatorio_final"]).replace("\n", " ")[:300]
+    elif estado.get("sql_query"):
+        turno["resposta"] = f"AI SQL Executed: {estado['sql_query']}"
+        if estado.get("sql_resultado"):
+            turno["resposta"] += " | AI Data Result: " + str(estado["sql_resultado"]).replace("\n", " ")[:150]
+    return turno
+
+def registrar(turnos, turno, maximo=HISTORICO_TURNOS):
+    """Ring buffer: devolve a lista nova com no máximo `maximo` turnos."""
+    return (list(turnos or []) + [turno])[-maximo:]
+
+def compactar_historico(turnos, orcamento_tokens=HISTORICO_TOKENS):
+    """
+    Texto do histórico para o prompt, do mais novo para o mais velho, até o orçamento:
+    turno completo se couber, senão só a pergunta, senão para.
+    """
+    linhas = []
+    gasto = 0
+    for turno in reversed(turnos or []):
+        completo = f"User: {turno['pergunta']}" + (f"\n{turno['resposta']}" if turno.get("resposta") else "")
+        curto = f"User: {turno['pergunta']}"
+        for texto in (completo, curto):
+            custo = estimar_tokens(texto)
+            if gasto + custo <= orcamento_tokens:
+                linhas.append(texto)
+                gasto += custo
+                break
+        else:
+            break
+    return "\n".join(reversed(linhas))
+
+def resolver_referencia(pergunta, ultimo_nuop):
+    """
+    "o que houve com essa?" -> "o que houve com essa? (NUOP E123...)".
+    Só mexe quando a pergunta usa referência e não traz NUOP nenhum.
+    """
+    if not ultimo_nuop or _RE_NUOP.search(pergunta or ""):
+        return pergunta
+    if not usa_contexto(normalizar_pergunta(pergunta)):
+        return pergunta
+    return f"{pergunta.rstrip()} (NUOP {ultimo_nuop})"
+
+
+class CheckpointerPersistente(InMemorySaver):
+    """
+    InMemorySaver gravado em disco (pickle atômico), podado para poucos checkpoints
+    por sessão e um número máximo de sessões (LRU).
+    - As versões async (astream/ainvoke) rodam numa thread: poda e disco fora do event loop;
+    - A gravação é agendada num timer: os checkpoints de um turno viram uma gravação só,
+      feita sobre uma cópia rasa (o lock não fica preso durante o pickle);
+    - Os blobs usados por checkpoint são anotados no put, então a poda não desserializa nada.
+    A timeline do NUOP (dados_nuop) é uma dataclass colunar sem XML: vai no msgpack
+    do serializador; pickle fica só de reserva para tipos que ele não conhece.
+    """
+
+    def __init__(self, arquivo=SESSOES_ARQUIVO, sessoes_maximas=SESSOES_MAXIMAS,
+                 checkpoints_por_sessao=CHECKPOINTS_POR_SESSAO, intervalo_gravacao_s=SESSOES_INTERVALO_S):
+        super().__init__(serde=JsonPlusSerializer(pickle_fallback=True))
+        self.arquivo = arquivo
+        self.sessoes_maximas = sessoes_maximas
+        self.checkpoints_por_sessao = checkpoints_por_sessao
+        self.intervalo_gravacao_s = intervalo_gravacao_s   # Atraso máximo até o disco (0 = grava já)
+        self._recentes = OrderedDict()   # thread_id -> None, ordem de uso
+        self._versoes = {}               # (thread_id, ns, checkpoint_id) -> {(canal, versão)} dos blobs usados
+        self._lock = threading.RLock()
+        self._lock_arquivo = threading.Lock()   # Uma gravação por vez no .tmp
+        self._pendente = False
+        self._agendada = None
+        self._gravado_em = 0.0
+        self._carregar()
+        atexit.register(self.gravar)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            resultado = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            ns = config["configurable"]["checkpoint_ns"]
+            self._versoes[(thread_id, ns, checkpoint["id"])] = set(checkpoint["channel_versions"].items())
+            self._recentes[thread_id] = None
+            self._recentes.move_to_end(thread_id)
+            self._podar(thread_id)
+            self._marcar_pendente()
+        return resultado
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id):
+        with self._lock:
+            self._apagar_sessao(thread_id)
+            self._recentes.pop(thread_id, None)
+            self._pendente = True
+        self.gravar()
+
+    # O InMemorySaver executa as versões async direto no event loop
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def _apagar_sessao(self, thread_id):
+        super().delete_thread(thread_id)
+        for chave in [k for k in self._versoes if k[0] == thread_id]:
+            del self._versoes[chave]
+
+    def _podar(self, thread_id):
+        while len(self._recentes) > self.sessoes_maximas:
+            antiga, _ = self._recentes.popitem(last=False)
+            self._apagar_sessao(antiga)
+        for ns, checkpoints in self.storage[thread_id].items():
+            # IDs de checkpoint são ordenáveis no tempo (uuid6)
+            antigos = sorted(checkpoints)[:-self.checkpoints_por_sessao]
+            if not antigos:
+                continue
+            for checkpoint_id in antigos:
+                del checkpoints[checkpoint_id]
+                self._versoes.pop((thread_id, ns, checkpoint_id), None)
+                for chave in [k for k in self.writes if k[:3] == (thread_id, ns, checkpoint_id)]:
+                    del self.writes[chave]
+            # Blobs (valores dos canais) que nenhum checkpoint restante referencia
+            usados = set()
+            for checkpoint_id, (checkpoint, _, _) in checkpoints.items():
+                usados |= self._versoes_de(thread_id, ns, checkpoint_id, checkpoint)
+            for chave in [k for k in self.blobs if k[:2] == (thread_id, ns) and (k[2], k[3]) not in usados]:
+                del self.blobs[chave]
+
+    def _versoes_de(self, thread_id, ns, checkpoint_id, checkpoint):
+        chave = (thread_id, ns, checkpoint_id)
+        if chave not in self._versoes:   # Arquivo gravado antes das versões anotadas: uma vez só
+            self._versoes[chave] = set(self.serde.loads_typed(checkpoint)["channel_versions"].items())
+        return self._versoes[chave]
+
+    def _marcar_pendente(self):
+        """Agenda a gravação (com o lock): no máximo uma por intervalo_gravacao_s."""
+        self._pendente = True
+        if self._agendada is not None or not self.arquivo:
+            return
+        atraso = max(0.0, self._gravado_em + self.intervalo_gravacao_s - time.monotonic())
+        self._agendada = threading.Timer(atraso, self.gravar)
+        self._agendada.daemon = True
+        self._agendada.start()
+
+    def gravar(self):
+        """Grava o que estiver pendente (pelo timer, no delete_thread e no atexit)."""
+        with self._lock_arquivo:
+            with self._lock:
+                self._agendada = None
+                if not self.arquivo or not self._pendente:
+                    return
+                # Cópia rasa (os valores são bytes imutáveis): o pickle roda sem o lock
+                dados = {
+                    "storage": {t: {ns: dict(c) for ns, c in por_ns.items()} for t, por_ns in self.storage.items()},
+                    "writes": dict(self.writes),
+                    "blobs": dict(self.blobs),
+                    "versoes": dict(self._versoes),
+                    "recentes": list(self._recentes),
+                }
+                self._pendente = False
+                self._gravado_em = time.monotonic()
+            try:
+                os.makedirs(os.path.dirname(self.arquivo) or ".", exist_ok=True)
+                tmp = f"{self.arquivo}.tmp"
+                with open(tmp, "wb") as f:
+                    pickle.dump(dados, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, self.arquivo)
+            except OSError as e:
+                print(f"⚠️ Sessões não gravadas ({self.arquivo}): {e}")
+                with self._lock:
+                    self._pendente = True   # Tenta de novo no próximo checkpoint
+
+    def _carregar(self):
+        if not self.arquivo or not os.path.exists(self.arquivo):
+            return
+        try:
+            with open(self.arquivo, "rb") as f:
+                dados = pickle.load(f)
+        except Exception as e:
+            print(f"⚠️ Sessões salvas ignoradas ({self.arquivo}): {e}")
+            return
+        for thread_id, por_ns in dados["storage"].items():
+            for ns, checkpoints in por_ns.items():
+                self.storage[thread_id][ns].update(checkpoints)
+        self.writes.update(dados["writes"])
+        self.blobs.update(dados["blobs"])
+        self._versoes.update(dados.get("versoes", {}))
+        self._recentes.update((t, None) for t in dados["recentes"])
+
+
+_checkpointer = None
+
+def checkpointer_padrao():
+    """Um checkpointer por processo (TUI ou serviço), gravando em SESSOES_ARQUIVO."""
+    global _checkpointer
+    if _checkpointer is None:
+        _checkpointer = CheckpointerPersistente()
+    return _checkpointer
@@ -0,0 +1,141 @@
+"""
+SLA do consumidor legado (ts_consumo - ts_entrega) em lote, não só do último evento.
+
+- Um NUOP (DataFrame da timeline): latência de todos os eventos numa passada vetorizada;
+- Uma janela de tempo (frota inteira): agregação empurrada para o Postgres
+  (percentile_cont + FILTER + GROUPING SETS), só o resumo trafega.
+
+Saída: eventos, p50/p95/p99, máximo, quantos acima do limite (10s) e quebra por origem/codmsg.
+
+Uso:
+    python sla_legado.py --ultimas "1 hour"                              # Consumidor legado na última hora
+    python sla_legado.py --inicio 2025-12-01 --fim 2025-12-02 --limite 5
+"""
+import os
+import sys
+import argparse
+
+import pandas as pd
+
+from db_pool import conexao_db
+
+LIMITE_LENTO_S = float(os.getenv("SLA_LIMITE_CONSUMO_S", "10"))   # Acima disso é "Consumo Lento"
+PERCENTIS = (0.5, 0.95, 0.99)
+
+# Agregação no banco: legado + codmsg da operação (JOIN pelo índice de msgid).
+# {filtro} recebe a condição de janela sobre L.ts_entrega (parâmetros ligados).
+SQL_SLA_JANELA = """
+SELECT 'PIX.legado' AS origem,
+       CASE WHEN GROUPING(codmsg) = 1 THEN '(todos)' ELSE codmsg END AS codmsg,
+       count(*) AS eventos,
+       percentile_cont(0.5) WITHIN GROUP (ORDER BY latencia_s) AS p50_s,
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY latencia_s) AS p95_s,
+       percentile_cont(0.99) WITHIN GROUP (ORDER BY latencia_s) AS p99_s,
+       max(latencia_s) AS max_s,
+       count(*) FILTER (WHERE latencia_s > %(limite_s)s) AS acima_limite
+FROM (
+    SELECT O.codmsg, EXTRACT(EPOCH FROM L.ts_consumo - L.ts_entrega)::float8 AS latencia_s
+    FROM pix.legado L JOIN spi.operacao O ON O.msgid = L.msgid
+    WHERE L.ts_consumo IS NOT NULL AND L.ts_entrega IS NOT NULL AND {filtro}
+) eventos
+GROUP BY GROUPING SETS ((), (codmsg))
+ORDER BY GROUPING(codmsg) DESC, eventos DESC
+"""
+
+FILTROS_JANELA = {
+    "intervalo": "L.ts_entrega >= %(inicio)s AND L.ts_entrega < %(fim)s",
+    "recente": "L.ts_entrega >= now() - %(janela)s::interval",
+    "desde": "L.ts_entrega >= %(inicio)s",
+}
+
+
+def latencias_consumo(df):
+    """Série (segundos) de ts_consumo - ts_entrega para todos os eventos com os dois carimbos."""
+    if df is None or df.empty or 'ts_entrega' not in df or 'ts_consumo' not in df:
+        return pd.Series(dtype="float64")
+    # Conversão por coluna (uma vez), não por linha
+    delta = pd.to_datetime(df['ts_consumo']) - pd.to_datetime(df['ts_entrega'])
+    return delta.dt.total_seconds().dropna()
+
+def _resumo(latencias, limite_s):
+    quantis = latencias.quantile(PERCENTIS) if len(latencias) else None
+    return {
+        "eventos": int(len(latencias)),
+        "p50_s": float(quantis.iloc[0]) if quantis is not None else None,
+        "p95_s": float(quantis.iloc[1]) if quantis is not None else None,
+        "p99_s": float(quantis.iloc[2]) if quantis is not None else None,
+        "max_s": float(latencias.max()) if len(latencias) else None,
+        "acima_limite": int((latencias > limite_s).sum()),
+    }
+
+def estatisticas_sla(df, limite_s=LIMITE_LENTO_S, agrupar_por=("origem", "codmsg")):
+    """
+    SLA de um DataFrame (timeline de um NUOP ou lote já carregado).
+    Retorna {"geral": {...}, "ultimo_s": latência do último evento, "por_grupo": DataFrame}.
+    """
+    latencias = latencias_consumo(df)
+    resultado = {"geral": _resumo(latencias, limite_s),
+                 "ultimo_s": float(latencias.iloc[-1]) if len(latencias) else None,
+                 "por_grupo": pd.DataFrame()}
+    colunas = [c for c in agrupar_por if c in df]
+    if len(latencias) and colunas:
+        eventos = df.loc[latencias.index, colunas].assign(latencia_s=latencias, lento=latencias > limite_s)
+        grupos = eventos.groupby(colunas, dropna=False)['latencia_s']
+        por_grupo = grupos.quantile(PERCENTIS).unstack()
+        por_grupo.columns = ["p50_s", "p95_s", "p99_s"]
+        por_grupo.insert(0, "eventos", grupos.size())
+        por_grupo["max_s"] = grupos.max()
+        por_grupo["acima_limite"] = eventos.groupby(colunas, dropna=False)['lento'].sum()
+        resultado["por_grupo"] = por_grupo.reset_index()
+    return resultado
+
+def sla_janela(inicio=None, fim=None, janela=None, limite_s=LIMITE_LENTO_S):
+    """
+    SLA da frota numa janela, agregado no Postgres. Use (inicio, fim), só inicio,
+    ou janela relativa ("1 hour", "30 minutes"). Primeira linha = total ('(todos)').
+    """
+    if janela:
+        filtro, params = FILTROS_JANELA["recente"], {"janela": janela}
+    elif fim:
+        filtro, params = FILTROS_JANELA["intervalo"], {"inicio": inicio, "fim": fim}
+    else:
+        filtro, params = FILTROS_JANELA["desde"], {"inicio": inicio}
+    params["limite_s"] = limite_s
+    with conexao_db() as conn:
+        return pd.read_sql(SQL_SLA_JANELA.format(filtro=filtro), conn, params=params)
+
+def texto_sla(estatisticas, limite_s=LIMITE_LENTO_S):
+    """Bloco de texto do SLA de um caso (formato do relatório forense)."""
+    relatorio = "📊 SLA & PERFORMANCE:\n"
+    if estatisticas["ultimo_s"] is None:
+        return relatorio
+    relatorio += f"   ➤ TEMPO CONSUMO: {estatisticas['ultimo_s']:.3f}s\n"
+    if estatisticas["ultimo_s"] > limite_s:
+        relatorio += f"      ⚠️ ALERTA: Consumo Lento (>{limite_s:g}s)!\n"
+    else:
+        relatorio += "      🏆 Performance: Imediata.\n"
+    geral = estatisticas["geral"]
+    if geral["eventos"] > 1:
+        relatorio += (f"   ➤ EVENTOS LEGADO: {geral['eventos']} | p50 {geral['p50_s']:.3f}s | "
+                      f"p95 {geral['p95_s']:.3f}s | máx {geral['max_s']:.3f}s | >{limite_s:g}s: {geral['acima_limite']}\n")
+    return relatorio
+
+def main():
+    parser = argparse.ArgumentParser(description="SLA do consumidor legado numa janela (agregado no banco).")
+    parser.add_argument("--inicio", help="Timestamp inicial (inclusivo)")
+    parser.add_argument("--fim", help="Timestamp final (exclusivo)")
+    parser.add_argument("--ultimas", help="Janela relativa ao agora, ex.: '1 hour', '15 minutes'")
+    parser.add_argument("--limite", type=float, default=LIMITE_LENTO_S, help="Segundos para 'Consumo Lento'")
+    args = parser.parse_args()
+    if not args.inicio and not args.ultimas:
+        parser.error("informe --inicio [--fim] ou --ultimas")
+
+    df = sla_janela(args.inicio, args.fim, args.ultimas, args.limite)
+    if df.empty or not df["eventos"].iloc[0]:
+        print("⚠️ Nenhum evento do legado na janela.")
+        return 1
+    print(df.to_markdown(index=False, floatfmt=".3f"))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Tabela da timeline do NUOP para o prompt do perito, dentro de um orçamento de tokens.
+
+Histórico longo (reenvios, polling do legado) não vira centenas de linhas no prompt:
+- Linhas repetidas (mesma origem/codmsg/status/evidência) viram uma só, com 'qtd'
+  e o primeiro/último carimbo de tempo;
+- Células longas são cortadas e só as colunas que o perito lê entram;
+- Estourado o orçamento, ficam as linhas que decidem o veredito (sucesso, evidência
+  de erro, 205/319/320) e a primeira/última da timeline; o resto vira uma nota.
+
+Uso:
+    from tabela_prompt import compactar_tabela
+    tabela = compactar_tabela(df)    # Markdown pronto para o {tabela} do prompt
+"""
+import os
+
+import pandas as pd
+
+from regras_veredito import STATUS_SUCESSO, STATUS_REJEICAO, STATUSOP_BACEN, TEXTO_TIMEOUT, PALAVRAS_CADASTRO
+from sessoes import estimar_tokens
+
+ORCAMENTO_TOKENS = int(os.getenv("PARECER_ORCAMENTO_TOKENS", "1200"))   # Só a tabela, sem o resto do prompt
+LARGURA_CELULA = int(os.getenv("PARECER_LARGURA_CELULA", "160"))        # Caracteres por célula
+COLUNAS_PARECER = ['origem', 'codmsg', 'statusop', 'statusmsg', 'evidencia_erro', 'ts_inclusao']
+COLUNA_TEMPO = 'ts_inclusao'
+RESERVA_NOTA = 40   # Tokens guardados para a nota das linhas omitidas
+
+
+def _texto(serie, largura):
+    """Célula como texto curto; inteiros sem '.0' (o prompt procura '302', não '302.0')."""
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        valores = serie.dropna()
+        if (valores % 1 == 0).all():
+            serie = serie.astype('Int64')
+    texto = serie.astype(object).where(serie.notna(), "").astype(str)
+    texto = texto.str.replace(r"\s+", " ", regex=True).str.replace("|", "/", regex=False)
+    longas = texto.str.len() > largura
+    return texto.where(~longas, texto.str.slice(0, largura - 1) + "…")
+
+def _colapsar(df, colunas, largura):
+    """Uma linha por combinação distinta, na ordem da primeira ocorrência."""
+    chave = [c for c in colunas if c != COLUNA_TEMPO]
+    base = pd.DataFrame({c: _texto(df[c], largura) for c in chave}, index=df.index)
+    if COLUNA_TEMPO not in colunas:
+        return base.drop_duplicates().reset_index(drop=True)
+    base['_ts'] = pd.to_datetime(df[COLUNA_TEMPO], errors='coerce')
+    grupos = base.groupby(chave, sort=False, dropna=False)['_ts']
+    colapsada = grupos.agg(_primeiro='min', _ultimo='max', qtd='size').reset_index()
+    colapsada = colapsada.sort_values('_primeiro', kind='stable', na_position='last').reset_index(drop=True)
+    colapsada[COLUNA_TEMPO] = _texto(colapsada['_primeiro'], largura)
+    if (colapsada['qtd'] > 1).any():
+        ultimo = _texto(colapsada['_ultimo'], largura)
+        colapsada['ts_ultimo'] = ultimo.where(ultimo != colapsada[COLUNA_TEMPO], "")
+        return colapsada[colunas + ['ts_ultimo', 'qtd']]
+    return colapsada[colunas]
+
+def _prioridade(tabela):
+    """Quanto a linha pesa no veredito (mesma hierarquia de regras_veredito)."""
+    statusmsg = pd.to_numeric(tabela['statusmsg'], errors='coerce') if 'statusmsg' in tabela else None
+    statusop = pd.to_numeric(tabela['statusop'], errors='coerce') if 'statusop' in tabela else None
+    evidencia = tabela['evidencia_erro'].str.lower() if 'evidencia_erro' in tabela else pd.Series("", index=tabela.index)
+
+    prioridade = pd.Series(0, index=tabela.index)
+    relevante = evidencia != ""
+    if statusop is not None:
+        relevante |= statusop == STATUSOP_BACEN
+    if statusmsg is not None:
+        relevante |= statusmsg.isin(STATUS_REJEICAO)
+    prioridade[relevante] = 2
+    decisiva = evidencia.str.contains(TEXTO_TIMEOUT, regex=False)
+    for palavra in PALAVRAS_CADASTRO:
+        decisiva |= evidencia.str.contains(palavra, regex=False)
+    prioridade[decisiva] = 3
+    extremos = tabela.index[[0, -1]]   # Primeiro e último carimbo da timeline
+    prioridade[extremos] = prioridade[extremos].clip(lower=3)
+    if statusmsg is not None:
+        prioridade[statusmsg.isin(STATUS_SUCESSO)] = 4
+    return prioridade
+
+def _linha(valores):
+    return "| " + " | ".join(valores) + " |"
+
+def _markdown(tabela):
+    """Markdown sem alinhamento (o preenchimento com espaços só gastaria tokens)."""
+    linhas = [_linha(tabela.columns), _linha(["---"] * len(tabela.columns))]
+    linhas += [_linha(valores) for valores in tabela.astype(str).itertuples(index=False, name=None)]
+    return "\n".join(linhas)
+
+def compactar_tabela(df, colunas=COLUNAS_PARECER, orcamento_tokens=ORCAMENTO_TOKENS, largura=LARGURA_CELULA):
+    """Markdown da timeline com no máximo ~orcamento_tokens (estimativa de sessoes.estimar_tokens)."""
+    colunas = [c for c in colunas if c in df.columns]
+    if df.empty or not colunas:
+        return _markdown(pd.DataFrame(columns=colunas))
+    tabela = _colapsar(df, colunas, largura)
+    custos = [estimar_tokens(_linha(v)) for v in tabela.astype(str).itertuples(index=False, name=None)]
+    cabecalho = estimar_tokens(_linha(tabela.columns)) * 2
+    if cabecalho + sum(custos) <= orcamento_tokens:
+        return _markdown(tabela)
+
+    # Estourou: mantém as linhas mais informativas (empate: a mais antiga) até o orçamento
+    prioridade = _prioridade(tabela)
+    ordem = sorted(range(len(tabela)), key=lambda i: (-prioridade.iloc[i], i))
+    disponivel, mantidas = orcamento_tokens - cabecalho - RESERVA_NOTA, []
+    for i in ordem:
+        if custos[i] > disponivel and mantidas:
+            continue
+        mantidas.append(i)
+        disponivel -= custos[i]
+    mantidas.sort()
+    omitidas = tabela.drop(index=tabela.index[mantidas])
+    eventos = int(omitidas['qtd'].sum()) if 'qtd' in omitidas else len(omitidas)
+    nota = f"\n(+{eventos} eventos omitidos pelo orçamento do prompt"
+    if 'statusmsg' in omitidas:
+        status = omitidas['statusmsg'].replace("", "vazio")
+        contagem = (omitidas['qtd'].groupby(status).sum() if 'qtd' in omitidas else status.value_counts())
+        contagem = contagem.sort_values(ascending=False).head(5)
+        nota += "; statusmsg: " + ", ".join(f"{s}×{n}" for s, n in contagem.items())
+    return _markdown(tabela.iloc[mantidas]) + nota + ")"
@@ -0,0 +1,233 @@
+"""
+Fast-path de templates SQL para as perguntas mais frequentes.
+
+Reconhece as REGRAS DE NEGÓCIO do prompt do Text-to-SQL (timeout, saldo/limite,
+piloto 319, autorizador 320, status explícito) com seus parâmetros (janela de tempo,
+origem, limite) e devolve SQL pronto e parametrizado contra a view_universal
+(CTE_UNIVERSAL). Perguntas que não casam com segurança voltam para o LLM.
+
+Tempo é lista de permissão: consumida a janela reconhecida, sobrou número, hora,
+mês ou "a partir" na pergunta -> LLM (o template contaria a tabela inteira).
+
+Uso:
+    from templates_sql import casar_template
+    casar_template("quantos timeouts hoje?")   # (nome, sql, params) ou None
+    python templates_sql.py                     # Confere os casos de regressão
+"""
+import os
+import re
+import sys
+import unicodedata
+
+from sla_legado import SQL_SLA_JANELA, FILTROS_JANELA, LIMITE_LENTO_S
+from regras_veredito import STATUS_SUCESSO, STATUS_REJEICAO, STATUSOP_BACEN
+
+# "Hoje" no ambiente de homologação (mesma convenção do prompt do Text-to-SQL)
+DATA_HOJE = os.getenv("JARVIS_DATA_HOJE", "2025-12-01")
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 500
+
+COLUNAS_LISTA = "origem, msgid, codmsg, nuop, statusop, statusmsg, sitlanc, ts_inclusao"
+
+PADRAO_STATUS = r"\bstatus(op|msg)?\s*(?:=|de|igual a)?\s*(\d{3})\b"
+
+# Intenções na ordem de prioridade (saldo antes de autorizador: ambos são 320)
+INTENCOES = [
+    ("timeout", r"\btime ?outs?\b|expirad",
+     "statusop = 205 AND msgop LIKE %(padrao_timeout)s",
+     {"padrao_timeout": "%Pagamento expirado por timeout%"}),
+    ("saldo_limite", r"\bsaldo\b|\blimite\b|insuficiente",
+     "statusmsg = 320 AND (msgop ILIKE %(padrao_saldo)s OR msgop ILIKE %(padrao_insuficiente)s OR msgop ILIKE %(padrao_limite)s)",
+     {"padrao_saldo": "%Saldo%", "padrao_insuficiente": "%Insuficiente%", "padrao_limite": "%Limite%"}),
+    ("piloto", r"\bpiloto\b",
+     "statusmsg = 319", {}),
+    ("autorizador", r"\bautorizador\b",
+     "statusmsg = 320", {}),
+    # Coluna decidida em casar_template: "status 205" é statusop (glossário), não statusmsg
+    ("status", PADRAO_STATUS,
+     "status{coluna} = %(status)s", {}),
+]
+
+# SLA do consumidor legado: agregado no banco (sla_legado.py), não lista de mensagens
+PALAVRAS_LEGADO = r"\blegado\b"
+PALAVRAS_SLA = r"\b(lent[oa]s?|lentidao|consumo|consumidor|sla|latencia|demor\w*|atras\w*)\b"
+
+PALAVRAS_CONTAGEM = r"\b(quantas|quantos|quantidade|total|count|numero)\b"
+PALAVRAS_LISTA = r"\b(quais|listar|liste|lista|mostre|mostrar|exiba|traga|ultimas|ultimos)\b"
+# Agrupamentos/análises que o template não cobre: deixa para o LLM
+PALAVRAS_COMPLEXAS = r"\b(por hora|por dia|por minuto|por origem|por codmsg|agrupad\w*|cada|media|percentual|taxa|compar\w*|maior|menor|ranking|nuop)\b"
+
+UNIDADES = {"min": "minutes", "minuto": "minutes", "minutos": "minutes",
+            "h": "hours", "hora": "hours", "horas": "hours",
+            "dia": "days", "dias": "days", "semana": "weeks"}
+
+# Janelas que o fast-path entende: "ultimas 2 horas", "ultima hora"/"nesta hora", "hoje"
+JANELA_NUMERICA = r"\bultim[oa]s?\s+(\d+)\s*(minutos?|min|horas?|h|dias?)\b"
+JANELA_UNITARIA = r"\b(?:ultim[oa]|n?esta|n?este)\s+(minuto|hora|dia|semana)\b"
+JANELA_HOJE = r"\b(hoje|agora)\b"
+# Qualquer outra expressão de tempo ("ontem", "desde", "dia 28"...) vai para o LLM:
+# o template sem o filtro contaria a tabela inteira
+PALAVRAS_TEMPO = (r"\b(ultim[oa]s?\s+(?:\d+\s*)?(?:minutos?|min|horas?|h|dias?|semanas?|mes(?:es)?|anos?)|"
+                  r"ontem|anteontem|semanas?|mes(?:es)?|anos?|desde|entre|durante|ate|antes|depois|"
+                  r"dia\s+\d+|\d{1,2}/\d{1,2}|\d{4}-\d{2}-\d{2}|manha|tarde|noite|madrugada|"
+                  r"minutos?|horas?|dias?|hoje|agora|a partir|"
+                  r"janeiro|fevereiro|marco|abril|maio|junho|julho|agosto|setembro|outubro|novembro|dezembro|"
+                  r"jan|fev|mar|abr|jun|jul|ago|set|out|nov|dez)\b")
+# "ultimas 10 mensagens" -> LIMIT 10 (o único número que o template usa além do status)
+QUANTIDADE = r"\bultim[oa]s\s+(\d+)\b(?!\s*(?:minutos?|min|horas?|h|dias?)\b)"
+
+# Regressões: perguntas com tempo que o template não sabe filtrar -> têm que ir para o LLM
+CASOS_LLM = [
+    "liste os timeouts de ontem do pix",
+    "quantos timeouts desde segunda?",
+    "quantos rejeitados pelo autorizador no dia 28?",
+    "quantas mensagens o piloto rejeitou a partir das 10h",
+    "quantas rejeitadas pelo piloto em dezembro",
+    "quantas rejeitadas pelo piloto em 2024",
+    "quantas timeout as 14:30",
+    "quantos timeouts entre 10h e 11h?",
+    "quantas mensagens com status 999?",
+    "quão lento estava o consumidor do legado ontem?",
+]
+# E as que continuam no fast-path, com o filtro certo
+CASOS_TEMPLATE = [
+    ("quantas recusas por saldo insuficiente na última hora?", {"janela": "1 hours"}),
+    ("quantos timeouts hoje?", {"data_hoje": DATA_HOJE}),
+    ("liste as últimas 20 rejeitadas pelo piloto", {"limite": 20}),
+    ("liste as ultimas 10 mensagens do piloto nas ultimas 2 horas", {"janela": "2 hours", "limite": 10}),
+    ("quantas mensagens com status 205?", {"status": 205}),
+    ("quantas com status 320 hoje", {"status": 320, "data_hoje": DATA_HOJE}),
+]
+
+
+def _normalizar(texto):
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower()
+
+def _janela(texto):
+    """(tipo, valor) da janela reconhecida — ("intervalo", "2 hours"), ("hoje", None) ou None —
+    e o texto sem ela, para conferir se sobrou alguma expressão de tempo não entendida."""
+    for padrao in (JANELA_NUMERICA, JANELA_UNITARIA, JANELA_HOJE):
+        match = re.search(padrao, texto)
+        if not match:
+            continue
+        resto = texto[:match.start()] + " " + texto[match.end():]
+        if padrao == JANELA_HOJE:
+            return ("hoje", None), resto
+        if padrao == JANELA_UNITARIA:
+            return ("intervalo", f"1 {UNIDADES[match.group(1)]}"), resto
+        return ("intervalo", f"{int(match.group(1))} {UNIDADES[match.group(2)]}"), resto
+    return None, texto
+
+def _sobra_tempo(resto):
+    """Depois de consumidos janela, status e quantidade: algum tempo/número ainda sem filtro?"""
+    return bool(re.search(PALAVRAS_TEMPO, resto) or re.search(r"\d", resto))
+
+def casar_template(pergunta):
+    """
+    Retorna (nome, sql, params) se a pergunta casar com um template, senão None.
+    O SQL usa placeholders do psycopg2 (%(nome)s) e referencia a view_universal.
+    """
+    texto = _normalizar(pergunta)
+    if re.search(PALAVRAS_LEGADO, texto) and re.search(PALAVRAS_SLA, texto):
+        return _template_sla_legado(texto)
+    if re.search(PALAVRAS_COMPLEXAS, texto):
+        return None
+
+    intencoes = [(nome, cond, dict(params), re.search(padrao, texto))
+                 for nome, padrao, cond, params in INTENCOES if re.search(padrao, texto)]
+    if not intencoes:
+        return None
+    nome, condicao, params, match = intencoes[0]
+    # "piloto" + "autorizador" na mesma pergunta é ambíguo
+    if {"piloto", "autorizador"} <= {i[0] for i in intencoes}:
+        return None
+    if nome == "status":
+        coluna, codigo = match.group(1), int(match.group(2))
+        if coluna is None:
+            # Sem a coluna explícita, só os códigos do glossário (os demais: LLM)
+            coluna = "op" if codigo == STATUSOP_BACEN else "msg" if codigo in STATUS_SUCESSO | STATUS_REJEICAO else None
+            if coluna is None:
+                return None
+        condicao = condicao.format(coluna=coluna)
+        params["status"] = codigo
+
+    contagem = re.search(PALAVRAS_CONTAGEM, texto)
+    lista = re.search(PALAVRAS_LISTA, texto)
+    if not contagem and not lista:
+        return None
+
+    condicoes = [condicao]
+
+    # Origem (valores reais da CTE_UNIVERSAL)
+    if re.search(r"\b(pix|spi)\b", texto):
+        condicoes.append("origem = %(origem)s")
+        params["origem"] = "PIX"
+    elif re.search(r"\b(str|ted|spb)\b", texto):
+        condicoes.append("origem = %(origem)s")
+        params["origem"] = "STR"
+
+    # Janela de tempo: "ultimas 2 horas", "ultimos 30 min", "ultima hora", "hoje"
+    janela, resto = _janela(texto)
+    resto = re.sub(QUANTIDADE, " ", re.sub(PADRAO_STATUS, " ", resto))
+    if _sobra_tempo(resto):
+        return None
+    if janela and janela[0] == "intervalo":
+        condicoes.append("ts_inclusao >= now() - %(janela)s::interval")
+        params["janela"] = janela[1]
+    elif janela:
+        condicoes.append("ts_inclusao >= %(data_hoje)s")
+        params["data_hoje"] = DATA_HOJE
+
+    where = " AND ".join(condicoes)
+    if contagem:
+        sql = f"SELECT count(*) AS total FROM view_universal WHERE {where};"
+        return f"{nome}_contagem", sql, params
+
+    # "ultimas 10 mensagens" -> LIMIT 10
+    quantidade = re.search(QUANTIDADE, texto)
+    params["limite"] = min(int(quantidade.group(1)), LIMITE_MAXIMO) if quantidade else LIMITE_PADRAO
+    sql = (f"SELECT {COLUNAS_LISTA} FROM view_universal WHERE {where} "
+           f"ORDER BY ts_inclusao DESC LIMIT %(limite)s;")
+    return f"{nome}_lista", sql, params
+
+def _template_sla_legado(texto):
+    """"Quão lento estava o legado nesta hora?" -> p50/p95/p99 por codmsg, agregado no Postgres."""
+    params = {"limite_s": LIMITE_LENTO_S}
+    janela, resto = _janela(texto)
+    if _sobra_tempo(resto):
+        return None
+    if janela and janela[0] == "intervalo":
+        filtro = FILTROS_JANELA["recente"]
+        params["janela"] = janela[1]
+    elif janela:
+        filtro = FILTROS_JANELA["desde"]
+        params["inicio"] = DATA_HOJE
+    else:
+        # Sem janela: a última hora
+        filtro = FILTROS_JANELA["recente"]
+        params["janela"] = "1 hours"
+    return "sla_legado", SQL_SLA_JANELA.format(filtro=filtro).strip() + ";", params
+
+def conferir():
+    """Roda CASOS_LLM e CASOS_TEMPLATE; devolve a lista de falhas (texto)."""
+    falhas = []
+    for pergunta in CASOS_LLM:
+        casado = casar_template(pergunta)
+        if casado:
+            falhas.append(f"{pergunta!r} deveria ir para o LLM, casou {casado[0]}")
+    for pergunta, esperado in CASOS_TEMPLATE:
+        casado = casar_template(pergunta)
+        if not casado:
+            falhas.append(f"{pergunta!r} deveria casar um template")
+        elif any(casado[2].get(k) != v for k, v in esperado.items()):
+            falhas.append(f"{pergunta!r}: params {casado[2]} sem {esperado}")
+    return falhas
+
+if __name__ == "__main__":
+    falhas = conferir()
+    for falha in falhas:
+        print(f"❌ {falha}")
+    print(f"{'❌' if falhas else '✅'} {len(CASOS_LLM) + len(CASOS_TEMPLATE) - len(falhas)}/"
+          f"{len(CASOS_LLM) + len(CASOS_TEMPLATE)} casos")
+    sys.exit(1 if falhas else 0)
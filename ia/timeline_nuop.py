@@ -0,0 +1,60 @@
+"""
+Timeline de um NUOP em formato colunar compacto (o que circula no AgentState).
+
+O DataFrame da investigação vira colunas de valores Python puros, já sem o XML bruto
+(msgop) depois que o motivo foi extraído para 'evidencia_erro':
+- Imutável (dataclass frozen + __slots__): os nós não alteram o estado no lugar;
+- Serializa barato: o serializador msgpack do checkpointer grava os campos direto
+  (sem pickle de DataFrame), então a sessão persiste e o estado viaja entre workers;
+- DataFrame só sob demanda (para_dataframe), com os dtypes originais.
+
+Uso:
+    timeline = TimelineNuop.de_dataframe(df)       # Descarta msgop
+    df = timeline.para_dataframe()                 # Regras, SLA, prompt do perito
+"""
+from dataclasses import dataclass
+from typing import Sequence
+
+import pandas as pd
+
+COLUNAS_DESCARTADAS = ("msgop",)   # XML bruto: depois do extrator só o motivo importa
+
+
+def _valores(serie):
+    """Coluna como lista de valores Python (None no lugar de NaN/NaT)."""
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return [None if pd.isna(v) else v.to_pydatetime() for v in serie]
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+@dataclass(frozen=True, slots=True)
+class TimelineNuop:
+    colunas: Sequence[str]
+    tipos: Sequence[str]              # dtype de cada coluna no DataFrame de origem
+    valores: Sequence[Sequence]       # Uma sequência por coluna (mesma ordem de 'colunas')
+
+    @classmethod
+    def de_dataframe(cls, df, descartar=COLUNAS_DESCARTADAS):
+        colunas = tuple(c for c in df.columns if c not in descartar)
+        return cls(
+            colunas=colunas,
+            tipos=tuple(str(df[c].dtype) for c in colunas),
+            valores=tuple(tuple(_valores(df[c])) for c in colunas),
+        )
+
+    def para_dataframe(self):
+        """DataFrame novo a cada chamada (quem altera não mexe no estado)."""
+        return pd.DataFrame({
+            coluna: pd.Series(list(valores), dtype=tipo)
+            for coluna, tipo, valores in zip(self.colunas, self.tipos, self.valores)
+        })
+
+    def coluna(self, nome):
+        return self.valores[list(self.colunas).index(nome)]
+
+    def nuops(self):
+        """NUOPs distintos da timeline (a busca por prefixo pode trazer mais de um)."""
+        return set(self.coluna("nuop")) - {None} if "nuop" in self.colunas else set()
+
+    def __len__(self):
+        return len(self.valores[0]) if self.valores else 0